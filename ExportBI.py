@@ -1,85 +1,780 @@
 import pandas as pd
-from pymongo import MongoClient
+import numpy as np
 import os
+import glob
+import time
+import shutil
+import argparse
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from repositorio_vendas import MONGO_COLLECTION_REMOVIDOS, obter_colecao
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow só é necessário para a saída em Parquet
+    pa = None
 
 # --- CONFIGURAÇÕES ---
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
 NOME_ARQUIVO_SAIDA = "dados_para_powerbi.csv"
+# Pedidos lidos do cursor e gravados no CSV de cada vez. A memória usada
+# depende só deste valor, não do tamanho da coleção.
+TAMANHO_LOTE_EXPORTACAO = 20_000
+OPCOES_CSV = {'index': False, 'sep': ';', 'decimal': ',', 'encoding': 'utf-8-sig'}
+# Formato da Data_Emissao no CSV, o mesmo em todos os lotes: sem ele o pandas
+# escreve só a data num lote em que todas as emissões são à meia-noite e data
+# e hora nos demais. A hora não vai para o CSV, como no Parquet (date32).
+FORMATO_DATA_CSV = '%Y-%m-%d'
+# Campos do pedido lidos do MongoDB (o restante, como data_carga, não vai para o CSV)
+PROJECAO_EXPORTACAO = {'numero_pv': 1, 'filial_codigo': 1, 'filial_nome': 1, 'parceiro': 1, 'emissao': 1,
+                       'vendedor': 1, 'condicao_pagamento': 1, 'valor_total_pedido': 1, 'itens': 1}
+# Colunas do CSV -> campo de origem no pedido (itens.* são os campos de cada item)
+COLUNAS_EXPORTACAO = {
+    'ID_Pedido_Filial': '_id',
+    'Numero_PV': 'numero_pv',
+    'Filial_Codigo': 'filial_codigo',
+    'Filial_Nome': 'filial_nome',
+    'Parceiro': 'parceiro',
+    'Data_Emissao': 'emissao',
+    'Vendedor': 'vendedor',
+    'Condicao_Pagamento': 'condicao_pagamento',
+    'Valor_Total_Pedido': 'valor_total_pedido',
+    'Cod_Produto': 'itens.cod_produto',
+    'Descricao_Produto': 'itens.descricao',
+    'Quantidade_Item': 'itens.quantidade',
+    'Valor_Unitario_Item': 'itens.unitario',
+    'Valor_Total_Item': 'itens.total_item',
+}
+# Tipo de cada coluna nos lotes, fixo: sem isso o pandas infere o tipo a cada
+# lote, e um único código de produto nulo faria a coluna virar float e sair
+# como "16880,0" só naquele lote.
+#   texto   -> como vem do MongoDB
+#   inteiro -> Int64 (inteiro que aceita nulo)
+#   numero  -> float64
+#   data    -> datetime64
+#   natural -> o valor como foi carregado, com 16880.0 tratado como 16880
+#              (códigos que podem ser numéricos ou alfanuméricos, quantidades)
+TIPOS_EXPORTACAO = {
+    'ID_Pedido_Filial': 'texto',
+    'Numero_PV': 'inteiro',
+    'Filial_Codigo': 'texto',
+    'Filial_Nome': 'texto',
+    'Parceiro': 'texto',
+    'Data_Emissao': 'data',
+    'Vendedor': 'texto',
+    'Condicao_Pagamento': 'texto',
+    'Valor_Total_Pedido': 'numero',
+    'Cod_Produto': 'natural',
+    'Descricao_Produto': 'texto',
+    'Quantidade_Item': 'natural',
+    'Valor_Unitario_Item': 'numero',
+    'Valor_Total_Item': 'numero',
+}
+# Modo --servidor: o próprio MongoDB "achata" os itens ($unwind + $project) e
+# devolve as linhas já no layout do CSV, em lotes deste tamanho (linhas).
+TAMANHO_LOTE_LINHAS_SERVIDOR = 50_000
+PIPELINE_ACHATAMENTO = [
+    {'$unwind': '$itens'},
+    {'$project': {'_id': 0, **{coluna: f"${campo}" for coluna, campo in COLUNAS_EXPORTACAO.items()}}},
+]
+
+# Exportação incremental (--incremental): grava só os pedidos carregados desde
+# a última exportação, em arquivos delta na pasta "<arquivo base>_deltas",
+# um por dia de carga (dia=AAAA-MM-DD/<execução>.csv). Os pedidos apagados
+# (pedidos_removidos) vão para "<execução>_removidos.csv" na pasta do dia da
+# remoção. Um pedido num delta substitui todas as linhas anteriores dele.
+# --compactar aplica os deltas ao arquivo base e apaga os deltas.
+MONGO_COLLECTION_EXPORTACOES = "exportacoes_powerbi"
+# A carga grava data_carga antes de escrever os lotes, então um pedido pode
+# aparecer no banco com data_carga anterior à marca d'água. Cada exportação
+# relê esta janela antes da marca; como o delta substitui o pedido inteiro,
+# reexportá-lo não duplica linhas. Deve ser maior que a carga mais demorada.
+MARGEM_MARCA_DAGUA = timedelta(hours=1)
+COLUNAS_REMOVIDOS = ['ID_Pedido_Filial', 'Removido_Em']
+
+# Saída em Parquet (--formato parquet/ambos): uma pasta particionada por ano de
+# emissão e filial (ano=2025/filial=JF/dados.parquet), da qual o Power BI pode
+# ler só as partições de que precisa. Requer o pacote pyarrow.
+PASTA_PARQUET = "dados_para_powerbi_parquet"
+COMPRESSAO_PARQUET = 'zstd'
+# Linhas acumuladas por partição antes de gravar um grupo de linhas (row group)
+LINHAS_POR_GRUPO_PARQUET = 100_000
+# Tipo de cada coluna no Parquet:
+#   texto     -> string
+#   categoria -> string com dicionário (valores que se repetem a cada item)
+#   inteiro   -> int64
+#   data      -> date32
+#   (decimal, casas) -> decimal128 com PRECISAO_DECIMAL dígitos
+PRECISAO_DECIMAL = 18
+TIPOS_PARQUET = {
+    'ID_Pedido_Filial': 'texto',
+    'Numero_PV': 'inteiro',
+    'Filial_Codigo': 'categoria',
+    'Filial_Nome': 'categoria',
+    'Parceiro': 'categoria',
+    'Data_Emissao': 'data',
+    'Vendedor': 'categoria',
+    'Condicao_Pagamento': 'categoria',
+    'Valor_Total_Pedido': ('decimal', 2),
+    'Cod_Produto': 'categoria',
+    'Descricao_Produto': 'categoria',
+    'Quantidade_Item': ('decimal', 3),
+    'Valor_Unitario_Item': ('decimal', 4),
+    'Valor_Total_Item': ('decimal', 2),
+}
+# Nome da partição de linhas sem emissão ou sem filial (o padrão do Hive, lido como nulo)
+VALOR_PARTICAO_NULO = "__HIVE_DEFAULT_PARTITION__"
+
+# Exportação em estrela (--estrela): uma tabela fato com um item por linha e
+# chaves inteiras, mais uma tabela por dimensão, na pasta PASTA_ESTRELA.
+# As chaves substitutas ficam registradas no MongoDB (MONGO_COLLECTION_CHAVES),
+# então um valor mantém a mesma chave em todas as exportações; valores novos
+# recebem a próxima chave do contador da dimensão (em exportacoes_powerbi).
+PASTA_ESTRELA = "dados_para_powerbi_estrela"
+MONGO_COLLECTION_CHAVES = "chaves_dimensoes_powerbi"
+ID_CONTADOR_CHAVES = "contador_chaves"
+# Dimensão -> coluna da chave, coluna do valor natural (na exportação plana) e
+# colunas descritivas (guardam o último valor visto)
+DIMENSOES_ESTRELA = {
+    'filial': {'chave': 'Chave_Filial', 'valor': 'Filial_Codigo', 'atributos': ['Filial_Nome']},
+    'vendedor': {'chave': 'Chave_Vendedor', 'valor': 'Vendedor', 'atributos': []},
+    'parceiro': {'chave': 'Chave_Parceiro', 'valor': 'Parceiro', 'atributos': []},
+    'produto': {'chave': 'Chave_Produto', 'valor': 'Cod_Produto', 'atributos': ['Descricao_Produto']},
+    'condicao_pagamento': {'chave': 'Chave_Condicao_Pagamento', 'valor': 'Condicao_Pagamento', 'atributos': []},
+}
+COLUNAS_FATO = ['Numero_PV', 'Chave_Filial', 'Data_Emissao', 'Chave_Vendedor', 'Chave_Parceiro',
+                'Chave_Condicao_Pagamento', 'Valor_Total_Pedido', 'Chave_Produto', 'Quantidade_Item',
+                'Valor_Unitario_Item', 'Valor_Total_Item']
+ARQUIVO_FATO = "fato_itens.csv"
 # --------------------
 
-def exportar_dados_para_csv():
+def achatar_pedidos(pedidos):
+    """
+    "Achata" um lote de pedidos: uma linha por item, com as informações do
+    pedido repetidas. Monta as colunas diretamente, sem um dict por linha.
+    """
+    colunas = {nome: [] for nome in COLUNAS_EXPORTACAO}
+
+    # Itera sobre cada documento de pedido
+    for pedido in pedidos:
+        itens = pedido.get('itens') or []
+        if not itens:
+            continue
+        quantidade = len(itens)
+        # Informações do Pedido (repetidas para cada item)
+        colunas['ID_Pedido_Filial'].extend([pedido.get('_id')] * quantidade)
+        colunas['Numero_PV'].extend([pedido.get('numero_pv')] * quantidade)
+        colunas['Filial_Codigo'].extend([pedido.get('filial_codigo')] * quantidade)
+        colunas['Filial_Nome'].extend([pedido.get('filial_nome')] * quantidade)
+        colunas['Parceiro'].extend([pedido.get('parceiro')] * quantidade)
+        colunas['Data_Emissao'].extend([pedido.get('emissao')] * quantidade)
+        colunas['Vendedor'].extend([pedido.get('vendedor')] * quantidade)
+        colunas['Condicao_Pagamento'].extend([pedido.get('condicao_pagamento')] * quantidade)
+        colunas['Valor_Total_Pedido'].extend([pedido.get('valor_total_pedido')] * quantidade)
+
+        # Informações do Item
+        for item in itens:
+            colunas['Cod_Produto'].append(item.get('cod_produto'))
+            colunas['Descricao_Produto'].append(item.get('descricao'))
+            colunas['Quantidade_Item'].append(item.get('quantidade'))
+            colunas['Valor_Unitario_Item'].append(item.get('unitario'))
+            colunas['Valor_Total_Item'].append(item.get('total_item'))
+
+    return tipar_lote(pd.DataFrame({nome: pd.Series(valores, dtype=object) for nome, valores in colunas.items()}))
+
+def numero_natural(valor):
+    """None para nulo, 16880.0 -> 16880; os demais valores ficam como estão."""
+    if valor is None or pd.isna(valor):
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def valor_natural(valor):
+    """O valor como texto, com o código 14613 e o 14613.0 de um lote com nulos escritos do mesmo jeito."""
+    valor = numero_natural(valor)
+    return None if valor is None else str(valor)
+
+def mapear_valores(serie, funcao):
+    """Aplica funcao a cada valor distinto da série (nulos viram None), mantendo o tipo object."""
+    codigos, valores = pd.factorize(serie)
+    resultado = np.empty(len(valores) + 1, dtype=object)
+    resultado[:-1] = [funcao(valor) for valor in valores]
+    resultado[-1] = None
+    return pd.Series(resultado[codigos], index=serie.index, dtype=object)
+
+def tipar_lote(df):
+    """Converte as colunas do lote para os tipos de TIPOS_EXPORTACAO, iguais em todos os lotes."""
+    for coluna, tipo in TIPOS_EXPORTACAO.items():
+        if tipo == 'data':
+            df[coluna] = pd.to_datetime(df[coluna])
+        elif tipo == 'inteiro':
+            df[coluna] = pd.to_numeric(df[coluna]).astype('Int64')
+        elif tipo == 'numero':
+            df[coluna] = pd.to_numeric(df[coluna]).astype('float64')
+        elif tipo == 'natural':
+            df[coluna] = mapear_valores(df[coluna], numero_natural)
+    return df
+
+def texto_csv(valor):
+    """Valores não inteiros das colunas naturais com o separador decimal do CSV (2.5 -> 2,5)."""
+    return str(valor).replace('.', OPCOES_CSV['decimal']) if isinstance(valor, float) else valor
+
+def ler_em_lotes(cursor, tamanho_lote):
+    """Entrega os documentos do cursor em listas de até tamanho_lote."""
+    lote = []
+    for documento in cursor:
+        lote.append(documento)
+        if len(lote) == tamanho_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def acrescentar_csv(df, caminho, novo):
+    """Cria o CSV (com o BOM do utf-8-sig e o cabeçalho) ou acrescenta o lote a ele, sem um segundo BOM."""
+    # O decimal do to_csv só vale para colunas float, não para as naturais (object)
+    colunas = {coluna: mapear_valores(df[coluna], texto_csv)
+               for coluna, tipo in TIPOS_EXPORTACAO.items() if tipo == 'natural' and coluna in df}
+    # Só as datas da exportação: a Removido_Em dos deltas mantém a hora
+    colunas.update({coluna: df[coluna].dt.strftime(FORMATO_DATA_CSV) for coluna, tipo in TIPOS_EXPORTACAO.items()
+                    if tipo == 'data' and coluna in df and pd.api.types.is_datetime64_any_dtype(df[coluna])})
+    if colunas:
+        df = df.assign(**colunas)
+    df.to_csv(caminho, mode='w' if novo else 'a', header=novo,
+              **(OPCOES_CSV if novo else {**OPCOES_CSV, 'encoding': 'utf-8'}))
+
+def lotes_achatados_python(collection, tamanho_lote):
+    """Lotes de linhas do CSV achatados no Python: (DataFrame, pedidos lidos)."""
+    cursor = collection.find({}, PROJECAO_EXPORTACAO, batch_size=tamanho_lote)
+    for lote in ler_em_lotes(cursor, tamanho_lote):
+        yield achatar_pedidos(lote), len(lote)
+
+def lotes_achatados_servidor(collection, tamanho_lote):
     """
-    Conecta ao MongoDB, busca todos os pedidos, "achata" os dados dos itens
-    e exporta tudo para um único arquivo CSV, pronto para o Power BI.
+    Lotes de linhas do CSV achatados no MongoDB ($unwind + $project): o
+    Python só monta o DataFrame e grava. Devolve (DataFrame, None), pois o
+    servidor não informa quantos pedidos geraram as linhas.
+    """
+    cursor = collection.aggregate(PIPELINE_ACHATAMENTO, batchSize=tamanho_lote)
+    for lote in ler_em_lotes(cursor, tamanho_lote):
+        # Mesmos tipos do modo Python: o $project omite os campos ausentes e o pandas inferiria o tipo por lote
+        colunas = {coluna: pd.Series([linha.get(coluna) for linha in lote], dtype=object) for coluna in COLUNAS_EXPORTACAO}
+        yield tipar_lote(pd.DataFrame(colunas)), None
+
+def tipo_parquet(tipo):
+    if tipo in ('texto', 'categoria'):
+        return pa.string()
+    if tipo == 'inteiro':
+        return pa.int64()
+    if tipo == 'data':
+        return pa.date32()
+    return pa.decimal128(PRECISAO_DECIMAL, tipo[1])
+
+def esquema_parquet():
+    return pa.schema([(coluna, tipo_parquet(tipo)) for coluna, tipo in TIPOS_PARQUET.items()])
+
+def tabela_parquet(df):
+    """Converte um lote achatado para os tipos de TIPOS_PARQUET."""
+    colunas = []
+    for coluna, tipo in TIPOS_PARQUET.items():
+        serie = df[coluna]
+        if tipo in ('texto', 'categoria'):
+            # Códigos de produto podem vir ora numéricos, ora alfanuméricos; 14613.0 vira "14613"
+            colunas.append(pa.array(mapear_valores(serie, valor_natural), type=pa.string()))
+        elif tipo == 'inteiro':
+            colunas.append(pa.array(serie, type=pa.int64(), from_pandas=True))
+        elif tipo == 'data':
+            colunas.append(pa.array(serie).cast(pa.date32()))
+        else:
+            # Arredonda antes de converter: 3248.3900000000003 vira 3248.39
+            valores = pa.array(serie, type=pa.float64(), from_pandas=True)
+            colunas.append(pc.round(valores, tipo[1]).cast(tipo_parquet(tipo)))
+    return pa.Table.from_arrays(colunas, schema=esquema_parquet())
+
+def valor_particao(valor):
+    return VALOR_PARTICAO_NULO if pd.isna(valor) else str(valor)
+
+def gravar_grupo_parquet(pasta, chave, particao):
+    """Grava as linhas acumuladas da partição como um grupo de linhas do arquivo dela."""
+    if particao['escritor'] is None:
+        caminho = os.path.join(pasta, f"ano={chave[0]}", f"filial={chave[1]}", "dados.parquet")
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        categorias = [coluna for coluna, tipo in TIPOS_PARQUET.items() if tipo == 'categoria']
+        particao['escritor'] = pq.ParquetWriter(caminho, esquema_parquet(), compression=COMPRESSAO_PARQUET,
+                                                use_dictionary=categorias)
+    particao['escritor'].write_table(pa.concat_tables(particao['tabelas']))
+    particao['tabelas'] = []
+    particao['linhas'] = 0
+
+def acrescentar_parquet(df, pasta, particoes):
+    """Distribui o lote pelas partições ano/filial; cada uma grava ao juntar LINHAS_POR_GRUPO_PARQUET linhas."""
+    anos = df['Data_Emissao'].dt.year.astype('Int64')
+    for (ano, filial), grupo in df.groupby([anos, df['Filial_Codigo']], dropna=False, sort=False):
+        chave = (valor_particao(ano), valor_particao(filial))
+        particao = particoes.setdefault(chave, {'tabelas': [], 'linhas': 0, 'escritor': None})
+        particao['tabelas'].append(tabela_parquet(grupo))
+        particao['linhas'] += len(grupo)
+        if particao['linhas'] >= LINHAS_POR_GRUPO_PARQUET:
+            gravar_grupo_parquet(pasta, chave, particao)
+
+def fechar_parquet(pasta, particoes, descartar=False):
+    """Grava o que restou em cada partição (exceto ao descartar) e fecha os arquivos."""
+    for chave, particao in particoes.items():
+        if particao['tabelas'] and not descartar:
+            gravar_grupo_parquet(pasta, chave, particao)
+        if particao['escritor'] is not None:
+            particao['escritor'].close()
+            particao['escritor'] = None
+
+def substituir_pasta(pasta_temporaria, pasta):
+    """Troca a pasta publicada pela recém-gravada, apagando a anterior só depois da troca."""
+    pasta_antiga = f"{pasta}.antiga"
+    shutil.rmtree(pasta_antiga, ignore_errors=True)
+    if os.path.exists(pasta):
+        os.replace(pasta, pasta_antiga)
+    os.replace(pasta_temporaria, pasta)
+    shutil.rmtree(pasta_antiga, ignore_errors=True)
+
+def tamanho_em_disco(caminho):
+    """Tamanho de um arquivo ou da soma dos arquivos de uma pasta, em bytes."""
+    if os.path.isfile(caminho):
+        return os.path.getsize(caminho)
+    return sum(os.path.getsize(os.path.join(raiz, nome)) for raiz, _, nomes in os.walk(caminho) for nome in nomes)
+
+def exportar_dados_para_csv(caminho_saida=None, tamanho_lote=None, servidor=False, formatos=('csv',),
+                            pasta_parquet=None):
+    """
+    Conecta ao MongoDB, percorre os pedidos em lotes, "achata" os dados dos
+    itens e acrescenta cada lote ao arquivo CSV, pronto para o Power BI.
+    Com servidor=True o achatamento é feito pelo MongoDB e tamanho_lote
+    conta linhas em vez de pedidos.
+    formatos escolhe as saídas gravadas na mesma leitura: 'csv' e/ou
+    'parquet' (pasta particionada por ano e filial, ver PASTA_PARQUET).
+    Cada saída é gravada com um nome temporário e só substitui a anterior no
+    fim, para que o Power BI nunca leia uma exportação pela metade.
     """
     print("Iniciando o exportador de dados para o Power BI...")
-    
+    caminho_saida = caminho_saida or os.path.join(os.getcwd(), NOME_ARQUIVO_SAIDA)
+    pasta_parquet = pasta_parquet or os.path.join(os.getcwd(), PASTA_PARQUET)
+    caminho_temporario = f"{caminho_saida}.tmp"
+    pasta_temporaria = f"{pasta_parquet}.tmp"
+    if 'parquet' in formatos and pa is None:
+        print("O pacote pyarrow não está instalado; não é possível gravar o Parquet (pip install pyarrow).")
+        return
+    particoes = {}
+
     try:
         print("Conectando ao MongoDB...")
-        client = MongoClient(MONGO_CONNECTION_STRING)
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
-        
-        # Busca todos os documentos da coleção
-        dados = list(collection.find({}))
-        
-        if not dados:
-            print("Aviso: Nenhum dado encontrado no banco de dados para exportar.")
-            return
-            
-        print(f"Encontrados {len(dados)} pedidos. Processando e achatando os dados...")
-        
-        # Lista para armazenar os dados "achatados"
-        linhas_finais = []
-        
-        # Itera sobre cada documento de pedido
-        for pedido in dados:
-            # Itera sobre cada item dentro do pedido
-            for item in pedido.get('itens', []):
-                nova_linha = {
-                    # Informações do Pedido (repetidas para cada item)
-                    'ID_Pedido_Filial': pedido.get('_id'),
-                    'Numero_PV': pedido.get('numero_pv'),
-                    'Filial_Codigo': pedido.get('filial_codigo'),
-                    'Filial_Nome': pedido.get('filial_nome'),
-                    'Parceiro': pedido.get('parceiro'),
-                    'Data_Emissao': pedido.get('emissao'),
-                    'Vendedor': pedido.get('vendedor'),
-                    'Condicao_Pagamento': pedido.get('condicao_pagamento'),
-                    'Valor_Total_Pedido': pedido.get('valor_total_pedido'),
-                    
-                    # Informações do Item
-                    'Cod_Produto': item.get('cod_produto'),
-                    'Descricao_Produto': item.get('descricao'),
-                    'Quantidade_Item': item.get('quantidade'),
-                    'Valor_Unitario_Item': item.get('unitario'),
-                    'Valor_Total_Item': item.get('total_item')
-                }
-                linhas_finais.append(nova_linha)
-
-        if not linhas_finais:
-            print("Nenhum item encontrado nos pedidos para exportar.")
+        collection = obter_colecao(leitura_secundaria=True)
+
+        if servidor:
+            print("Achatando os itens no MongoDB ($unwind + $project)...")
+            lotes = lotes_achatados_servidor(collection, tamanho_lote or TAMANHO_LOTE_LINHAS_SERVIDOR)
+        else:
+            lotes = lotes_achatados_python(collection, tamanho_lote or TAMANHO_LOTE_EXPORTACAO)
+        if 'parquet' in formatos:
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+        inicio = time.perf_counter()
+        total_lotes = 0
+        total_pedidos = 0
+        total_linhas = 0
+        inicio_exportacao = datetime.now()
+        for df_lote, pedidos_lote in lotes:
+            if 'csv' in formatos:
+                acrescentar_csv(df_lote, caminho_temporario, novo=(total_lotes == 0))
+            if 'parquet' in formatos:
+                acrescentar_parquet(df_lote, pasta_temporaria, particoes)
+            total_lotes += 1
+            total_pedidos += pedidos_lote or 0
+            total_linhas += len(df_lote)
+            duracao = time.perf_counter() - inicio
+            pedidos = f"{total_pedidos} pedidos, " if not servidor else ""
+            print(f"  -> {pedidos}{total_linhas} linhas ({total_linhas / max(duracao, 1e-9):,.0f} linhas/s)")
+        fechar_parquet(pasta_temporaria, particoes)
+
+        if not total_linhas:
+            if os.path.exists(caminho_temporario):
+                os.remove(caminho_temporario)
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+            if total_lotes:
+                print("Nenhum item encontrado nos pedidos para exportar.")
+            else:
+                print("Aviso: Nenhum dado encontrado no banco de dados para exportar.")
             return
 
-        # Cria o DataFrame final com os dados achatados
-        df_final = pd.DataFrame(linhas_finais)
-        
-        # Garante que a coluna de data esteja no formato correto
-        df_final['Data_Emissao'] = pd.to_datetime(df_final['Data_Emissao'])
-        
-        # Salva o arquivo CSV
-        caminho_saida = os.path.join(os.getcwd(), NOME_ARQUIVO_SAIDA)
-        df_final.to_csv(caminho_saida, index=False, sep=';', decimal=',', encoding='utf-8-sig')
-        
+        saidas = []
+        if 'csv' in formatos:
+            os.replace(caminho_temporario, caminho_saida)
+            reiniciar_incremental(caminho_saida, inicio_exportacao)
+            saidas.append(('CSV', caminho_saida))
+        if 'parquet' in formatos:
+            substituir_pasta(pasta_temporaria, pasta_parquet)
+            saidas.append((f"Parquet ({len(particoes)} partições)", pasta_parquet))
+        duracao = time.perf_counter() - inicio
+
         print("\n--- SUCESSO! ---")
-        print(f"Os dados foram exportados com sucesso para o arquivo:")
-        print(caminho_saida)
-        
+        print(f"Os dados foram exportados com sucesso para:")
+        for formato, caminho in saidas:
+            print(f"  {formato}: {caminho} ({tamanho_em_disco(caminho) / (1024 * 1024):,.1f} MB)")
+        print(f"{f'{total_pedidos} pedidos, ' if not servidor else ''}{total_linhas} linhas em {duracao:.1f}s "
+              f"({total_linhas / max(duracao, 1e-9):,.0f} linhas/s).")
+
     except Exception as e:
         print(f"\n--- ERRO ---")
         print(f"Ocorreu um erro durante a exportação: {e}")
+        if os.path.exists(caminho_temporario):
+            os.remove(caminho_temporario)
+        fechar_parquet(pasta_temporaria, particoes, descartar=True)
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+def caminho_deltas(caminho_base):
+    """Pasta dos deltas de um arquivo base: dados_para_powerbi.csv -> dados_para_powerbi_deltas."""
+    return f"{os.path.splitext(caminho_base)[0]}_deltas"
+
+def obter_marcas():
+    """Marca d'água de cada arquivo base (_id = nome do arquivo)."""
+    return obter_colecao(MONGO_COLLECTION_EXPORTACOES)
+
+def listar_deltas(pasta):
+    """Arquivos delta da pasta por execução, em ordem: {execução: {'linhas': [...], 'removidos': [...]}}."""
+    execucoes = {}
+    for caminho in glob.glob(os.path.join(pasta, 'dia=*', '*.csv')):
+        execucao, _, sufixo = os.path.splitext(os.path.basename(caminho))[0].partition('_')
+        arquivos = execucoes.setdefault(execucao, {'linhas': [], 'removidos': []})
+        arquivos['removidos' if sufixo else 'linhas'].append(caminho)
+    return dict(sorted(execucoes.items()))
+
+def apagar_deltas(execucoes):
+    """Apaga os arquivos delta listados e as pastas de dia que ficarem vazias."""
+    pastas = set()
+    for arquivos in execucoes.values():
+        for caminho in arquivos['linhas'] + arquivos['removidos']:
+            os.remove(caminho)
+            pastas.add(os.path.dirname(caminho))
+    for pasta in pastas:
+        if not os.listdir(pasta):
+            os.rmdir(pasta)
+
+def reiniciar_incremental(caminho_base, marca):
+    """
+    Depois de uma exportação completa: os deltas antigos já estão no arquivo
+    base, então são apagados, e a marca d'água passa a ser o início dela.
+    """
+    apagar_deltas(listar_deltas(caminho_deltas(caminho_base)))
+    obter_marcas().replace_one({'_id': os.path.basename(caminho_base)},
+                               {'marca': marca, 'base': caminho_base, 'atualizado_em': datetime.now()}, upsert=True)
+
+def gravar_particao(df, caminho, temporarios):
+    """Acrescenta o lote ao delta (gravado como .tmp até o fim da exportação)."""
+    novo = caminho not in temporarios
+    if novo:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporarios[caminho] = f"{caminho}.tmp"
+    acrescentar_csv(df, temporarios[caminho], novo)
+
+def exportar_incremental(caminho_base=None, tamanho_lote=None):
+    """
+    Grava em arquivos delta, um por dia de carga, os pedidos carregados desde
+    a última exportação (data_carga a partir da marca d'água, menos a
+    margem) e os pedidos apagados desde então. A marca só avança depois que
+    todos os deltas foram gravados.
+    """
+    print("Iniciando a exportação incremental para o Power BI...")
+    caminho_base = caminho_base or os.path.join(os.getcwd(), NOME_ARQUIVO_SAIDA)
+    tamanho_lote = tamanho_lote or TAMANHO_LOTE_EXPORTACAO
+    pasta = caminho_deltas(caminho_base)
+    temporarios = {}
+
+    try:
+        print("Conectando ao MongoDB...")
+        collection = obter_colecao(leitura_secundaria=True)
+        removidos = obter_colecao(MONGO_COLLECTION_REMOVIDOS, leitura_secundaria=True)
+        marcas = obter_marcas()
+        marca = marcas.find_one({'_id': os.path.basename(caminho_base)})
+        if marca is None:
+            print(f"Nenhuma exportação completa de '{os.path.basename(caminho_base)}' registrada. "
+                  "Rode primeiro sem --incremental.")
+            return
+
+        inicio = time.perf_counter()
+        inicio_exportacao = datetime.now()
+        execucao = inicio_exportacao.strftime('%Y%m%dT%H%M%S%f')
+        desde = marca['marca'] - MARGEM_MARCA_DAGUA
+        print(f"Pedidos carregados desde {desde:%d/%m/%Y %H:%M:%S} -> {pasta}")
+
+        total_pedidos = 0
+        total_linhas = 0
+        cursor = collection.find({'data_carga': {'$gte': desde}}, {**PROJECAO_EXPORTACAO, 'data_carga': 1},
+                                 batch_size=tamanho_lote)
+        for lote in ler_em_lotes(cursor, tamanho_lote):
+            por_dia = {}
+            for pedido in lote:
+                por_dia.setdefault(pedido['data_carga'].date(), []).append(pedido)
+            for dia, pedidos in por_dia.items():
+                df_dia = achatar_pedidos(pedidos)
+                if len(df_dia):
+                    gravar_particao(df_dia, os.path.join(pasta, f"dia={dia:%Y-%m-%d}", f"{execucao}.csv"), temporarios)
+                total_linhas += len(df_dia)
+            total_pedidos += len(lote)
+            print(f"  -> {total_pedidos} pedidos, {total_linhas} linhas")
+
+        # Pedidos apagados; os que voltaram a ser carregados depois já estão nos deltas acima
+        total_removidos = 0
+        cursor = removidos.find({'removido_em': {'$gte': desde}}, {'pedido': 1, 'removido_em': 1},
+                                batch_size=tamanho_lote)
+        for lote in ler_em_lotes(cursor, tamanho_lote):
+            existentes = {doc['_id'] for doc in collection.find({'_id': {'$in': [r['pedido'] for r in lote]}}, {'_id': 1})}
+            por_dia = {}
+            for registro in lote:
+                if registro['pedido'] not in existentes:
+                    por_dia.setdefault(registro['removido_em'].date(), []).append(
+                        (registro['pedido'], registro['removido_em']))
+            for dia, linhas in por_dia.items():
+                gravar_particao(pd.DataFrame(linhas, columns=COLUNAS_REMOVIDOS),
+                                os.path.join(pasta, f"dia={dia:%Y-%m-%d}", f"{execucao}_removidos.csv"), temporarios)
+                total_removidos += len(linhas)
+
+        for caminho, temporario in temporarios.items():
+            os.replace(temporario, caminho)
+        marcas.update_one({'_id': marca['_id']}, {'$set': {'marca': inicio_exportacao, 'atualizado_em': datetime.now()}})
+        duracao = time.perf_counter() - inicio
+
+        print("\n--- SUCESSO! ---")
+        print(f"{total_pedidos} pedidos ({total_linhas} linhas) e {total_removidos} remoções em "
+              f"{len(temporarios)} arquivos delta, em {duracao:.1f}s.")
+
+    except Exception as e:
+        print(f"\n--- ERRO ---")
+        print(f"Ocorreu um erro durante a exportação incremental: {e}")
+        print("A marca d'água não foi alterada; a próxima execução exporta o mesmo período de novo.")
+        for temporario in temporarios.values():
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+def ler_csv_em_lotes(caminho, tamanho_lote, colunas=None):
+    """Lê um CSV exportado como texto, sem converter números nem datas (a gravação devolve os mesmos valores)."""
+    return pd.read_csv(caminho, sep=OPCOES_CSV['sep'], encoding='utf-8-sig', dtype=str, keep_default_na=False,
+                       usecols=colunas, chunksize=tamanho_lote)
+
+def compactar_deltas(caminho_base=None, tamanho_lote=None):
+    """
+    Aplica os deltas ao arquivo base, em ordem de execução: as linhas de um
+    pedido que aparece num delta posterior (ou foi removido) saem, e as do
+    delta entram. O base é regravado com um nome temporário e os deltas só
+    são apagados depois de substituí-lo.
+    """
+    caminho_base = caminho_base or os.path.join(os.getcwd(), NOME_ARQUIVO_SAIDA)
+    tamanho_lote = tamanho_lote or TAMANHO_LOTE_LINHAS_SERVIDOR
+    caminho_temporario = f"{caminho_base}.tmp"
+    execucoes = listar_deltas(caminho_deltas(caminho_base))
+    if not execucoes:
+        print("Nenhum delta para compactar.")
+        return
+    if not os.path.exists(caminho_base):
+        print(f"Arquivo base não encontrado: {caminho_base}. Rode primeiro a exportação completa.")
+        return
+
+    print(f"Compactando {len(execucoes)} exportações incrementais em {caminho_base}...")
+    inicio = time.perf_counter()
+    try:
+        # Pedidos alterados por cada execução e, para cada uma, pelas posteriores a ela
+        alterados = []
+        for arquivos in execucoes.values():
+            ids = set()
+            for caminho in arquivos['linhas'] + arquivos['removidos']:
+                for lote in ler_csv_em_lotes(caminho, tamanho_lote, ['ID_Pedido_Filial']):
+                    ids.update(lote['ID_Pedido_Filial'])
+            alterados.append(ids)
+        substituidos_depois = []
+        substituidos = set()
+        for ids in reversed(alterados):
+            substituidos_depois.insert(0, set(substituidos))
+            substituidos |= ids
+
+        total_linhas = 0
+        criado = False
+        origens = [(caminho_base, substituidos)] + [
+            (caminho, depois) for arquivos, depois in zip(execucoes.values(), substituidos_depois)
+            for caminho in sorted(arquivos['linhas'])]
+        for caminho, substituidos_origem in origens:
+            for lote in ler_csv_em_lotes(caminho, tamanho_lote):
+                lote = lote[~lote['ID_Pedido_Filial'].isin(substituidos_origem)]
+                acrescentar_csv(lote, caminho_temporario, novo=not criado)
+                criado = True
+                total_linhas += len(lote)
+
+        os.replace(caminho_temporario, caminho_base)
+        apagar_deltas(execucoes)
+
+        print("\n--- SUCESSO! ---")
+        print(f"{caminho_base}: {total_linhas} linhas ({len(substituidos)} pedidos atualizados ou removidos) "
+              f"em {time.perf_counter() - inicio:.1f}s.")
+
+    except Exception as e:
+        print(f"\n--- ERRO ---")
+        print(f"Ocorreu um erro durante a compactação: {e}")
+        print("O arquivo base e os deltas não foram alterados.")
+        if os.path.exists(caminho_temporario):
+            os.remove(caminho_temporario)
+
+def carregar_chaves(chaves, dimensao):
+    """Chaves já registradas da dimensão: {valor natural: {'chave': ..., 'atributos': {...}}}."""
+    return {doc['valor']: {'chave': doc['chave'], 'atributos': doc.get('atributos', {})}
+            for doc in chaves.find({'dimensao': dimensao}, {'_id': 0, 'valor': 1, 'chave': 1, 'atributos': 1})}
+
+def registrar_chaves(chaves, contadores, dimensao, novos, registradas):
+    """
+    Reserva no contador da dimensão uma chave para cada valor novo e grava o
+    registro. Se outra exportação registrar o mesmo valor ao mesmo tempo, o
+    índice único recusa a segunda gravação e vale a chave que ficou no banco.
+    """
+    contador = contadores.find_one_and_update({'_id': ID_CONTADOR_CHAVES}, {'$inc': {dimensao: len(novos)}},
+                                              upsert=True, return_document=ReturnDocument.AFTER)
+    primeira = contador[dimensao] - len(novos) + 1
+    documentos = [{'dimensao': dimensao, 'valor': valor, 'chave': primeira + posicao, 'atributos': atributos}
+                  for posicao, (valor, atributos) in enumerate(novos.items())]
+    try:
+        chaves.insert_many(documentos, ordered=False)
+    except BulkWriteError as e:
+        if any(erro.get('code') != 11000 for erro in e.details.get('writeErrors', [])):
+            raise
+    for doc in chaves.find({'dimensao': dimensao, 'valor': {'$in': list(novos)}}):
+        registradas[doc['valor']] = {'chave': doc['chave'], 'atributos': doc.get('atributos', {})}
+
+def chaves_do_lote(df, chaves, contadores, dimensao, registradas):
+    """
+    Série com a chave substituta de cada linha do lote para a dimensão,
+    registrando os valores novos e atualizando os atributos que mudaram.
+    """
+    definicao = DIMENSOES_ESTRELA[dimensao]
+    # Último valor dos atributos visto no lote, por valor natural original
+    ultimos = df.drop_duplicates(definicao['valor'], keep='last')
+    novos = {}
+    alterados = []
+    mapa = {}
+    for linha in ultimos[[definicao['valor']] + definicao['atributos']].itertuples(index=False):
+        valor = valor_natural(linha[0])
+        if valor is None:
+            continue
+        atributos = {coluna: valor_natural(atributo) for coluna, atributo in zip(definicao['atributos'], linha[1:])}
+        mapa[linha[0]] = valor
+        registro = registradas.get(valor)
+        if registro is None:
+            novos[valor] = atributos
+        elif registro['atributos'] != atributos:
+            alterados.append(UpdateOne({'dimensao': dimensao, 'valor': valor}, {'$set': {'atributos': atributos}}))
+            registro['atributos'] = atributos
+    if alterados:
+        # Um único bulk_write por lote: cada valor aparece uma vez, então a ordem não importa
+        chaves.bulk_write(alterados, ordered=False)
+    if novos:
+        registrar_chaves(chaves, contadores, dimensao, novos, registradas)
+    return df[definicao['valor']].map({original: registradas[valor]['chave'] for original, valor in mapa.items()}).astype('Int64')
+
+def gravar_dimensao(chaves, dimensao, caminho):
+    """Grava a tabela da dimensão com todas as chaves já registradas, em ordem de chave."""
+    definicao = DIMENSOES_ESTRELA[dimensao]
+    linhas = [[doc['chave'], doc['valor']] + [doc.get('atributos', {}).get(coluna) for coluna in definicao['atributos']]
+              for doc in chaves.find({'dimensao': dimensao}).sort('chave', ASCENDING)]
+    df = pd.DataFrame(linhas, columns=[definicao['chave'], definicao['valor']] + definicao['atributos'])
+    acrescentar_csv(df, caminho, novo=True)
+    return len(df)
+
+def exportar_estrela(pasta=None, tamanho_lote=None, servidor=False):
+    """
+    Exporta os pedidos em esquema estrela: a tabela fato (um item por linha,
+    com chaves inteiras no lugar dos textos) e uma tabela por dimensão. Os
+    lotes achatados são os mesmos da exportação plana. A pasta é gravada com
+    um nome temporário e só substitui a anterior no fim.
+    """
+    print("Iniciando a exportação em estrela para o Power BI...")
+    pasta = pasta or os.path.join(os.getcwd(), PASTA_ESTRELA)
+    pasta_temporaria = f"{pasta}.tmp"
+
+    try:
+        print("Conectando ao MongoDB...")
+        collection = obter_colecao(leitura_secundaria=True)
+        chaves = obter_colecao(MONGO_COLLECTION_CHAVES)
+        chaves.create_index([('dimensao', ASCENDING), ('valor', ASCENDING)], unique=True)
+        chaves.create_index([('dimensao', ASCENDING), ('chave', ASCENDING)], unique=True)
+        contadores = obter_marcas()
+        registradas = {dimensao: carregar_chaves(chaves, dimensao) for dimensao in DIMENSOES_ESTRELA}
+        ja_registradas = sum(len(valores) for valores in registradas.values())
+
+        if servidor:
+            print("Achatando os itens no MongoDB ($unwind + $project)...")
+            lotes = lotes_achatados_servidor(collection, tamanho_lote or TAMANHO_LOTE_LINHAS_SERVIDOR)
+        else:
+            lotes = lotes_achatados_python(collection, tamanho_lote or TAMANHO_LOTE_EXPORTACAO)
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
+        os.makedirs(pasta_temporaria)
+
+        inicio = time.perf_counter()
+        total_linhas = 0
+        for df_lote, _ in lotes:
+            for dimensao, definicao in DIMENSOES_ESTRELA.items():
+                df_lote[definicao['chave']] = chaves_do_lote(df_lote, chaves, contadores, dimensao, registradas[dimensao])
+            acrescentar_csv(df_lote[COLUNAS_FATO], os.path.join(pasta_temporaria, ARQUIVO_FATO), novo=(total_linhas == 0))
+            total_linhas += len(df_lote)
+            duracao = time.perf_counter() - inicio
+            print(f"  -> {total_linhas} linhas ({total_linhas / max(duracao, 1e-9):,.0f} linhas/s)")
+
+        if not total_linhas:
+            shutil.rmtree(pasta_temporaria, ignore_errors=True)
+            print("Aviso: Nenhum item encontrado no banco de dados para exportar.")
+            return
+
+        tamanhos_dimensoes = {dimensao: gravar_dimensao(chaves, dimensao, os.path.join(pasta_temporaria, f"dim_{dimensao}.csv"))
+                              for dimensao in DIMENSOES_ESTRELA}
+        substituir_pasta(pasta_temporaria, pasta)
+        duracao = time.perf_counter() - inicio
+
+        print("\n--- SUCESSO! ---")
+        print(f"Os dados foram exportados com sucesso para a pasta:")
+        print(pasta)
+        print(f"  {ARQUIVO_FATO}: {total_linhas} linhas ({tamanho_em_disco(os.path.join(pasta, ARQUIVO_FATO)) / (1024 * 1024):,.1f} MB)")
+        for dimensao, linhas in tamanhos_dimensoes.items():
+            print(f"  dim_{dimensao}.csv: {linhas} linhas")
+        novas = sum(len(valores) for valores in registradas.values()) - ja_registradas
+        print(f"Total: {tamanho_em_disco(pasta) / (1024 * 1024):,.1f} MB em {duracao:.1f}s "
+              f"({total_linhas / max(duracao, 1e-9):,.0f} linhas/s); {novas} chaves novas registradas.")
+
+    except Exception as e:
+        print(f"\n--- ERRO ---")
+        print(f"Ocorreu um erro durante a exportação em estrela: {e}")
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
 
 if __name__ == '__main__':
-    exportar_dados_para_csv()
+    parser = argparse.ArgumentParser(description="Exporta os pedidos, um item por linha, para o CSV do Power BI.")
+    parser.add_argument('--saida', help=f"Arquivo CSV de saída (padrão: {NOME_ARQUIVO_SAIDA} na pasta atual).")
+    parser.add_argument('--lote', type=int, help=f"Pedidos por lote lido e gravado (padrão: {TAMANHO_LOTE_EXPORTACAO}); "
+                                                 f"com --servidor, linhas (padrão: {TAMANHO_LOTE_LINHAS_SERVIDOR}).")
+    parser.add_argument('--servidor', action='store_true',
+                        help="O MongoDB achata os itens ($unwind + $project); o Python só grava as linhas.")
+    parser.add_argument('--formato', choices=['csv', 'parquet', 'ambos'], default='csv',
+                        help="Saída da exportação completa: CSV (padrão), Parquet particionado por ano e filial, "
+                             "ou os dois na mesma leitura.")
+    parser.add_argument('--pasta-parquet', help=f"Pasta da saída em Parquet (padrão: {PASTA_PARQUET} na pasta atual).")
+    parser.add_argument('--pasta-estrela', help=f"Pasta da exportação em estrela (padrão: {PASTA_ESTRELA} na pasta atual).")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument('--incremental', action='store_true',
+                      help="Grava só os pedidos carregados ou removidos desde a última exportação, em arquivos delta.")
+    modo.add_argument('--compactar', action='store_true', help="Aplica os arquivos delta ao arquivo de saída.")
+    modo.add_argument('--estrela', action='store_true',
+                      help="Exporta em esquema estrela: tabela fato com chaves inteiras e uma tabela por dimensão.")
+    args = parser.parse_args()
+
+    if args.incremental:
+        exportar_incremental(args.saida, args.lote)
+    elif args.compactar:
+        compactar_deltas(args.saida)
+    elif args.estrela:
+        exportar_estrela(args.pasta_estrela, args.lote, args.servidor)
+    else:
+        formatos = ['csv', 'parquet'] if args.formato == 'ambos' else [args.formato]
+        exportar_dados_para_csv(args.saida, args.lote, args.servidor, formatos, args.pasta_parquet)
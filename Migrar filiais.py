@@ -1,81 +1,237 @@
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import argparse
+from datetime import datetime
+from pymongo import ReplaceOne, DeleteOne, UpdateOne
+from pymongo.errors import ConnectionFailure, BulkWriteError
+
+from repositorio_vendas import CAMPO_CHAVE_LOGICA, obter_colecao, registrar_remocoes
+from resumo_vendas import PROJECAO_RESUMO, obter_resumo, atualizar_resumo
 
 # --- CONFIGURAÇÕES ---
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
 
 # MODO DE SEGURANÇA:
 # True  = Apenas simula e mostra o que SERIA feito. NENHUM DADO SERÁ ALTERADO.
 # False = Executa a migração permanentemente. Use apenas após verificar a simulação.
+# (--simular na linha de comando força a simulação.)
 DRY_RUN = False
+
+# Filiais a migrar: código de origem -> filial de destino, no mesmo formato do
+# MAPA_FILIAIS do processador_vendas. O pedido "<numero_pv>_<origem>" passa a
+# ser "<numero_pv>_<codigo_novo>"; se esse _id já existir (colisão), o
+# documento de destino é substituído pelo migrado.
+MAPA_MIGRACAO = {
+    "SS":  {"codigo_novo": "JF", "nome_novo": "Juiz de Fora"},
+    "SZM": {"codigo_novo": "JF", "nome_novo": "Juiz de Fora"},
+}
+
+# Pedidos por lote de escrita (bulk_write ordenado) e por checkpoint
+TAMANHO_LOTE_MIGRACAO = 1000
+
+# Coleção onde fica o progresso de cada migração, para retomá-la se for interrompida
+MONGO_COLLECTION_MIGRACOES = "migracoes_filiais"
 # --------------------
 
-def migrar_filiais():
-    """Encontra registros de SS e SZM e os funde em JF."""
+
+def nome_migracao(mapa):
+    """Identificador estável da migração no checkpoint, ex.: 'SS->JF,SZM->JF'."""
+    return ','.join(f"{origem}->{destino['codigo_novo']}" for origem, destino in sorted(mapa.items()))
+
+
+def validar_mapa(mapa):
+    """Uma filial de destino não pode ser também origem: o cursor voltaria a encontrar os pedidos migrados."""
+    destinos_na_origem = {destino['codigo_novo'] for destino in mapa.values()} & set(mapa)
+    if destinos_na_origem:
+        raise ValueError(f"Filiais de destino que também são origem no mapa: {sorted(destinos_na_origem)}")
+
+
+def id_destino(doc, mapa):
+    return f"{doc['numero_pv']}_{mapa[doc['filial_codigo']]['codigo_novo']}"
+
+
+def ler_lotes(collection, mapa, depois_de=None, tamanho_lote=TAMANHO_LOTE_MIGRACAO):
+    """
+    Percorre os pedidos das filiais de origem em ordem de _id, entregando
+    listas de até tamanho_lote documentos. depois_de retoma a partir do
+    último _id já migrado.
+    """
+    filtro = {'filial_codigo': {'$in': list(mapa)}}
+    if depois_de is not None:
+        filtro['_id'] = {'$gt': depois_de}
+    lote = []
+    for doc in collection.find(filtro, sort=[('_id', 1)], batch_size=tamanho_lote):
+        lote.append(doc)
+        if len(lote) == tamanho_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def migrar_lote(collection, resumo, lote, mapa):
+    """
+    Migra um lote com um único bulk_write ordenado: para cada pedido, grava o
+    documento com o novo _id (substituindo o destino, se existir) e apaga o
+    original. O hash da chave lógica (que não depende da filial) só volta ao
+    documento depois que o original sai, para não colidir no índice único.
+    O resumo diário desconta os originais e os destinos substituídos e soma
+    os migrados. Os migrados recebem nova data_carga e os originais ficam
+    registrados como removidos, para a exportação incremental do Power BI.
+
+    Se o bulk_write falhar no meio, as operações anteriores à que falhou já
+    estão gravadas: resumo e remoções são aplicados só a esses pedidos.
+    Retorna (migrados, colisões com pedidos já gravados no destino, falha),
+    com os migrados sempre no início do lote. falha é None ou um dict com os
+    erros do bulk_write e a etapa do pedido seguinte em que parou:
+    'gravacao' (nada gravado), 'remocao' (destino gravado, original ainda lá)
+    ou 'hash' (pedido migrado, mas sem o hash da chave lógica).
+    """
+    ids_novos = [id_destino(doc, mapa) for doc in lote]
+    destinos_existentes = list(collection.find({'_id': {'$in': ids_novos}}, PROJECAO_RESUMO))
+
+    operacoes = []
+    novos = []
+    indices_remocao = []
+    indices_hash = []
+    data_carga = datetime.now()
+    for doc, id_novo in zip(lote, ids_novos):
+        destino = mapa[doc['filial_codigo']]
+        novo = {**doc, '_id': id_novo, 'filial_codigo': destino['codigo_novo'], 'filial_nome': destino['nome_novo'],
+                'data_carga': data_carga}
+        chave_logica = novo.pop(CAMPO_CHAVE_LOGICA, None)
+        operacoes.append(ReplaceOne({'_id': id_novo}, novo, upsert=True))
+        indices_remocao.append(len(operacoes))
+        operacoes.append(DeleteOne({'_id': doc['_id']}))
+        if chave_logica is not None:
+            indices_hash.append(len(operacoes))
+            operacoes.append(UpdateOne({'_id': id_novo}, {'$set': {CAMPO_CHAVE_LOGICA: chave_logica}}))
+        novos.append(novo)
+
+    falha = None
     try:
-        client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
+        collection.bulk_write(operacoes, ordered=True)
+    except BulkWriteError as e:
+        # No bulk ordenado, tudo antes da operação que falhou foi gravado. Um pedido
+        # conta como migrado quando o original já saiu, mesmo que o hash não tenha voltado.
+        erros = e.details.get('writeErrors', [])
+        indice = erros[0]['index'] if erros else 0
+        concluidos = sum(1 for remocao in indices_remocao if remocao < indice)
+        etapa = 'remocao' if indice in indices_remocao else 'hash' if indice in indices_hash else 'gravacao'
+        falha = {'erros': erros, 'etapa': etapa}
+        lote, ids_novos, novos = lote[:concluidos], ids_novos[:concluidos], novos[:concluidos]
+        destinos_existentes = [doc for doc in destinos_existentes if doc['_id'] in set(ids_novos)]
+
+    # Duas origens com o mesmo destino no lote: vale a última, como no bulk ordenado
+    migrados = dict(zip(ids_novos, novos))
+    atualizar_resumo(resumo, lote + destinos_existentes, sinal=-1)
+    atualizar_resumo(resumo, list(migrados.values()))
+    registrar_remocoes(collection, [doc['_id'] for doc in lote], 'Migrar filiais')
+    return len(lote), len(destinos_existentes), falha
+
+
+def simular_migracao(collection, mapa, tamanho_lote=TAMANHO_LOTE_MIGRACAO):
+    """
+    Percorre os pedidos que seriam migrados sem alterar nada e conta, por
+    filial de origem, os pedidos e as colisões: destinos que já existem no
+    banco e destinos disputados por mais de um pedido de origem.
+    """
+    contagens = {origem: {'pedidos': 0, 'colisoes_banco': 0, 'colisoes_origem': 0} for origem in mapa}
+    destinos_vistos = set()
+    for lote in ler_lotes(collection, mapa, tamanho_lote=tamanho_lote):
+        ids_novos = [id_destino(doc, mapa) for doc in lote]
+        existentes = {doc['_id'] for doc in collection.find({'_id': {'$in': ids_novos}}, {'_id': 1})}
+        for doc, id_novo in zip(lote, ids_novos):
+            contagem = contagens[doc['filial_codigo']]
+            contagem['pedidos'] += 1
+            if id_novo in existentes:
+                contagem['colisoes_banco'] += 1
+                print(f"  Colisão: {doc['_id']} -> {id_novo} (já existe; seria substituído)")
+            elif id_novo in destinos_vistos:
+                contagem['colisoes_origem'] += 1
+                print(f"  Colisão: {doc['_id']} -> {id_novo} (outro pedido de origem vai para o mesmo _id)")
+            destinos_vistos.add(id_novo)
+
+    print("\n--- RESULTADO DA SIMULAÇÃO ---")
+    for origem, contagem in contagens.items():
+        print(f"{origem} -> {mapa[origem]['codigo_novo']}: {contagem['pedidos']} pedidos, "
+              f"{contagem['colisoes_banco']} colisões com pedidos do destino, "
+              f"{contagem['colisoes_origem']} colisões entre origens")
+    return contagens
+
+
+def relatar_falha(lote, migrados, falha, mapa):
+    """Explica onde o bulk_write parou e o que ficou pendente no pedido em que falhou."""
+    print(f"  -> ERRO ao migrar o lote iniciado em {lote[0]['_id']}: {falha['erros']}")
+    print(f"     Os {migrados} primeiros pedidos do lote foram migrados (resumo e remoções já aplicados).")
+    if falha['etapa'] == 'hash':
+        pedido = lote[migrados - 1]
+        print(f"     {pedido['_id']} -> {id_destino(pedido, mapa)} foi migrado sem o hash da chave lógica "
+              "(rode o preencher_chave_logica.py).")
+    elif falha['etapa'] == 'remocao':
+        pedido = lote[migrados]
+        print(f"     {id_destino(pedido, mapa)} foi gravado, mas o original {pedido['_id']} não foi apagado: "
+              "apague um dos dois, reconstrua o resumo ('python resumo_vendas.py --reconstruir') "
+              "e refaça a exportação completa do Power BI.")
+    print("Migração interrompida; rode o script de novo para retomar a partir do último pedido migrado.")
+
+
+def migrar_filiais(mapa=MAPA_MIGRACAO, simular=DRY_RUN, tamanho_lote=TAMANHO_LOTE_MIGRACAO, recomecar=False):
+    """
+    Funde as filiais de origem do mapa nas de destino, em lotes.
+
+    O progresso (último _id migrado e contagens) é gravado em
+    MONGO_COLLECTION_MIGRACOES após cada lote; uma nova execução com o mesmo
+    mapa continua de onde a anterior parou. recomecar=True ignora o
+    checkpoint (os pedidos já migrados não são mais encontrados na origem).
+    """
+    validar_mapa(mapa)
+    try:
+        collection = obter_colecao()
+        resumo = obter_resumo(collection)
         print("Conectado com sucesso ao MongoDB.")
     except ConnectionFailure as e:
         print(f"Não foi possível conectar ao MongoDB: {e}")
         return
 
-    filiais_para_migrar = ['SS', 'SZM']
-    query = {'filial_codigo': {'$in': filiais_para_migrar}}
-    
-    documentos_para_migrar = list(collection.find(query))
-    
-    if not documentos_para_migrar:
-        print(">> Nenhum documento das filiais 'SS' ou 'SZM' encontrado para migrar.")
+    descricao = nome_migracao(mapa)
+    if simular:
+        print(f"\n--- EXECUTANDO EM MODO DE SIMULAÇÃO (DRY RUN): {descricao} ---")
+        simular_migracao(collection, mapa, tamanho_lote)
+        print("Simulação finalizada. Para executar de verdade, rode sem --simular (com DRY_RUN = False).")
         return
 
-    print(f"Encontrados {len(documentos_para_migrar)} documentos de 'SS' e 'SZM' para fundir em 'JF'.")
-
-    if DRY_RUN:
-        print("\n--- EXECUTANDO EM MODO DE SIMULAÇÃO (DRY RUN) ---")
+    print(f"\n--- EXECUTANDO EM MODO REAL: {descricao} ---")
+    checkpoints = collection.database[MONGO_COLLECTION_MIGRACOES]
+    checkpoint = checkpoints.find_one({'_id': descricao})
+    if checkpoint and checkpoint['status'] == 'em_andamento' and not recomecar:
+        print(f"Retomando a migração após o pedido {checkpoint['ultimo_id']} "
+              f"({checkpoint['migrados']} já migrados em {checkpoint['atualizado_em']:%d/%m/%Y %H:%M}).")
+        print("Se a execução anterior caiu no meio de um lote, confira o resumo com "
+              "'python resumo_vendas.py --reconstruir'.")
     else:
-        print("\n--- EXECUTANDO EM MODO REAL ---")
-
-    for doc in documentos_para_migrar:
-        id_antigo = doc['_id']
-        id_novo = f"{doc['numero_pv']}_JF"
-        
-        print(f"Migrando doc {id_antigo} -> {id_novo}")
-
-        if not DRY_RUN:
-            try:
-                # Remove o _id antigo para que o MongoDB gere um novo se necessário
-                doc_original_id = doc.pop('_id')
-                
-                # Define os novos valores da filial
-                doc['filial_codigo'] = 'JF'
-                doc['filial_nome'] = 'Juiz de Fora'
-                
-                # Tenta atualizar (upsert) o documento com o novo _id
-                # Se um doc com id_novo já existe, ele será substituído (caso de merge)
-                # Se não existe, será criado.
-                collection.replace_one(
-                    {'_id': id_novo},
-                    doc,
-                    upsert=True
-                )
-                
-                # Se o id_antigo for diferente do id_novo, apaga o original
-                if doc_original_id != id_novo:
-                    collection.delete_one({'_id': doc_original_id})
-                
-                print(f"  -> SUCESSO: Documento {doc_original_id} migrado para {id_novo}.")
-
-            except Exception as e:
-                print(f"  -> ERRO ao migrar {id_antigo}: {e}")
+        checkpoint = {'_id': descricao, 'ultimo_id': None, 'migrados': 0, 'colisoes': 0, 'inicio': datetime.now()}
 
+    for lote in ler_lotes(collection, mapa, checkpoint['ultimo_id'], tamanho_lote):
+        migrados, colisoes, falha = migrar_lote(collection, resumo, lote, mapa)
+        if migrados:
+            checkpoint.update(ultimo_id=lote[migrados - 1]['_id'], migrados=checkpoint['migrados'] + migrados,
+                              colisoes=checkpoint['colisoes'] + colisoes, status='em_andamento',
+                              atualizado_em=datetime.now())
+            checkpoints.replace_one({'_id': descricao}, checkpoint, upsert=True)
+            print(f"  -> {checkpoint['migrados']} pedidos migrados ({checkpoint['colisoes']} destinos substituídos)...")
+        if falha is not None:
+            relatar_falha(lote, migrados, falha, mapa)
+            return
+
+    checkpoint.update(status='concluida', atualizado_em=datetime.now())
+    checkpoints.replace_one({'_id': descricao}, checkpoint, upsert=True)
     print("\n--- Migração Concluída ---")
-    if DRY_RUN:
-        print("Simulação finalizada. Para executar de verdade, mude DRY_RUN para False.")
+    print(f"Pedidos migrados: {checkpoint['migrados']} | Destinos já existentes substituídos: {checkpoint['colisoes']}")
+
 
 if __name__ == '__main__':
-    migrar_filiais()
+    parser = argparse.ArgumentParser(description="Funde os pedidos das filiais de MAPA_MIGRACAO nas filiais de destino.")
+    parser.add_argument('--simular', action='store_true', help="Só conta pedidos e colisões, sem alterar nada.")
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_MIGRACAO, help="Pedidos por bulk_write/checkpoint.")
+    parser.add_argument('--recomecar', action='store_true', help="Ignora o checkpoint de uma migração interrompida.")
+    args = parser.parse_args()
+
+    migrar_filiais(simular=DRY_RUN or args.simular, tamanho_lote=args.lote, recomecar=args.recomecar)
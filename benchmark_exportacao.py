@@ -0,0 +1,124 @@
+import io
+import os
+import time
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import repositorio_vendas
+import ExportBI
+from benchmark_leitura import pico_memoria_mb, popular_banco
+
+# --- CONFIGURAÇÕES ---
+# Banco usado pelo benchmark da exportação. NUNCA aponte para o banco de produção (vendas_db).
+MONGO_DATABASE_BENCHMARK = "vendas_benchmark_exportacao"
+# 1M pedidos x 10 itens = 10M linhas no CSV
+ITENS_POR_PEDIDO = 10
+# A cada INTERVALO_NULOS pedidos, o primeiro item fica sem código de produto e
+# com quantidade nula, para que a comparação dos arquivos dos modos inclua nulos
+INTERVALO_NULOS = 1000
+# Formas de achatar os pedidos comparadas:
+#   python:   find() dos pedidos e laço sobre os itens no Python (achatar_pedidos)
+#   servidor: $unwind + $project no MongoDB; o Python só grava as linhas
+MODOS = ['python', 'servidor']
+# --------------------
+
+
+def medir_exportacao(modo, mongo_uri, pasta):
+    """
+    Roda num processo novo (o pico de memória do processo não volta a cair):
+    exporta o CSV pelo modo pedido e mede tempo, memória e o arquivo gerado.
+    """
+    repositorio_vendas.configurar_conexao(mongo_uri, MONGO_DATABASE_BENCHMARK)
+    repositorio_vendas.obter_colecao(leitura_secundaria=True).find_one()  # abre a conexão antes da medição
+    memoria_inicial = pico_memoria_mb()
+    caminho = os.path.join(pasta, f"exportacao_{modo}.csv")
+
+    inicio = time.perf_counter()
+    # As mensagens de progresso de cada lote ficariam misturadas com a tabela do resultado
+    saida = io.StringIO()
+    with contextlib.redirect_stdout(saida):
+        ExportBI.exportar_dados_para_csv(caminho, servidor=(modo == 'servidor'))
+    tempo = time.perf_counter() - inicio
+
+    if not os.path.exists(caminho):
+        raise RuntimeError(f"A exportação '{modo}' não gerou o arquivo:\n{saida.getvalue()[-2000:]}")
+    memoria_final = pico_memoria_mb()
+    resumo = hashlib.sha1()
+    linhas = -1  # sem o cabeçalho
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+            resumo.update(bloco)
+            linhas += bloco.count(b'\n')
+    tamanho_mb = os.path.getsize(caminho) / (1024 * 1024)
+    os.remove(caminho)
+    return {
+        'modo': modo,
+        'linhas': linhas,
+        'tempo_s': tempo,
+        'pico_mb': None if memoria_inicial is None else memoria_final - memoria_inicial,
+        'arquivo_mb': tamanho_mb,
+        'sha1': resumo.hexdigest(),
+    }
+
+
+def semear_nulos(colecao):
+    """Tira o código e anula a quantidade do primeiro item de um a cada INTERVALO_NULOS pedidos."""
+    resultado = colecao.update_many({'numero_pv': {'$mod': [INTERVALO_NULOS, 0]}},
+                                    {'$unset': {'itens.0.cod_produto': ''}, '$set': {'itens.0.quantidade': None}})
+    print(f"  {resultado.modified_count} pedidos com um item sem código e sem quantidade")
+
+
+def executar_benchmark(qtd_pedidos, itens_por_pedido, mongo_uri, reaproveitar, modos):
+    repositorio_vendas.configurar_conexao(mongo_uri, MONGO_DATABASE_BENCHMARK)
+    colecao = repositorio_vendas.obter_colecao()
+    existentes = colecao.estimated_document_count()
+    if not (reaproveitar and existentes == qtd_pedidos):
+        print(f"--- Gravando {qtd_pedidos} pedidos de {itens_por_pedido} itens no banco '{MONGO_DATABASE_BENCHMARK}' ---")
+        colecao.drop()
+        popular_banco(colecao, qtd_pedidos, itens_por_pedido=itens_por_pedido)
+        semear_nulos(colecao)
+    else:
+        print(f"--- Reaproveitando os {existentes} pedidos já gravados ---")
+    repositorio_vendas.fechar_conexao()
+
+    resultados = []
+    contexto = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as pasta:
+        for modo in modos:
+            print(f"\nExportando pelo modo '{modo}'...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+                resultados.append(executor.submit(medir_exportacao, modo, mongo_uri, pasta).result())
+
+    base = next((resultado for resultado in resultados if resultado['modo'] == 'python'), resultados[0])
+    print("\n" + "=" * 78)
+    print(f"RESULTADO DO BENCHMARK DA EXPORTAÇÃO ({qtd_pedidos} pedidos, {base['linhas']} linhas)")
+    print("=" * 78)
+    print(f"{'Modo':<10} {'Linhas':>11} {'Tempo':>9} {'Linhas/s':>12} {'Ganho':>7} {'Pico memória':>14} {'CSV':>10}")
+    for resultado in resultados:
+        pico = f"{resultado['pico_mb']:,.0f} MB" if resultado['pico_mb'] is not None else 'n/d'
+        print(f"{resultado['modo']:<10} {resultado['linhas']:>11} {resultado['tempo_s']:>8.2f}s "
+              f"{resultado['linhas'] / resultado['tempo_s']:>12,.0f} {base['tempo_s'] / resultado['tempo_s']:>6.2f}x "
+              f"{pico:>14} {resultado['arquivo_mb']:>7,.0f} MB")
+    print(f"(Ganho: em relação ao modo '{base['modo']}'; Pico memória: quanto a exportação acrescentou ao pico do processo)")
+    if len({resultado['sha1'] for resultado in resultados}) > 1:
+        print("ATENÇÃO: os modos geraram arquivos diferentes!")
+    else:
+        print("Os arquivos gerados pelos modos são idênticos.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compara o achatamento dos itens no Python e no MongoDB na exportação para o Power BI.")
+    parser.add_argument('--pedidos', type=int, default=1_000_000)
+    parser.add_argument('--itens', type=int, default=ITENS_POR_PEDIDO, help="Itens por pedido.")
+    parser.add_argument('--mongo-uri', default=repositorio_vendas.MONGO_CONNECTION_STRING,
+                        help=f"MongoDB local para o teste; usa o banco '{MONGO_DATABASE_BENCHMARK}'.")
+    parser.add_argument('--reaproveitar', action='store_true',
+                        help="Não regrava os pedidos se o banco de benchmark já tiver a quantidade pedida.")
+    parser.add_argument('--modos', nargs='+', choices=MODOS, default=MODOS)
+    args = parser.parse_args()
+
+    executar_benchmark(args.pedidos, args.itens, args.mongo_uri, args.reaproveitar, args.modos)
@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+import processador_vendas
+import repositorio_vendas
+from gerador_exportacoes import gerar_exportacoes
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- CONFIGURAÇÕES ---
+# Banco usado pelo benchmark: é apagado no início e no fim de cada execução.
+# NUNCA aponte para o banco de produção (vendas_db).
+MONGO_DATABASE_BENCHMARK = "vendas_benchmark"
+# --------------------
+
+
+def pico_memoria_mb():
+    """Pico de memória residente do processo em MB, ou None quando indisponível."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def chave_documento(_id):
+    """_id como chave do dicionário: os do resumo diário são documentos (dia, filial, vendedor, parceiro)."""
+    return tuple(_id.items()) if isinstance(_id, dict) else _id
+
+
+def atende(valor, condicao):
+    """Confere um campo contra a condição do filtro: igualdade, {'$in': [...]} ou {'$lte': x}."""
+    if not isinstance(condicao, dict):
+        return valor == condicao
+    if '$in' in condicao:
+        return valor in condicao['$in']
+    return valor is not None and valor <= condicao['$lte']
+
+
+class ColecaoEmMemoria:
+    """
+    Coleção do modo --em-memoria: guarda os documentos num dicionário por _id
+    e conta as operações de escrita. Cada escrita custa O(1), ao contrário do
+    mongomock, que percorre a coleção a cada upsert. Dos operadores de
+    atualização só aplica $setOnInsert e $set; o $inc do resumo é só contado.
+    """
+
+    def __init__(self, banco):
+        self.database = banco
+        self.documentos = {}
+        self.escritas = 0
+
+    def _filtrados(self, filtro):
+        """Documentos que atendem ao filtro (igualdade, $in e $lte); o _id é buscado direto no dicionário."""
+        condicoes = dict(filtro)
+        ids = condicoes.pop('_id', None)
+        if ids is None:
+            candidatos = list(self.documentos.values())
+        else:
+            ids = ids['$in'] if isinstance(ids, dict) else [ids]
+            candidatos = [self.documentos[chave] for chave in map(chave_documento, ids) if chave in self.documentos]
+        return [documento for documento in candidatos
+                if all(atende(documento.get(campo), condicao) for campo, condicao in condicoes.items())]
+
+    def _atualizar(self, _id, atualizacao):
+        documento = self.documentos.get(chave_documento(_id))
+        inserido = documento is None
+        if inserido:
+            documento = self.documentos[chave_documento(_id)] = {'_id': _id, **atualizacao.get('$setOnInsert', {})}
+        documento.update(atualizacao.get('$set', {}))
+        self.escritas += 1
+        return inserido
+
+    def bulk_write(self, operacoes, ordered=True):
+        inseridos = {}
+        for indice, operacao in enumerate(operacoes):
+            if self._atualizar(operacao._filter['_id'], operacao._doc):
+                inseridos[indice] = operacao._filter['_id']
+        return SimpleNamespace(upserted_ids=inseridos)
+
+    def update_one(self, filtro, atualizacao, upsert=False):
+        self._atualizar(filtro['_id'], atualizacao)
+
+    def insert_many(self, documentos, ordered=True):
+        for documento in documentos:
+            self.documentos[documento.get('_id', len(self.documentos))] = documento
+        self.escritas += len(documentos)
+
+    def find(self, filtro=None, projecao=None, **opcoes):
+        return self._filtrados(filtro or {})
+
+    def delete_many(self, filtro):
+        apagados = [chave_documento(documento['_id']) for documento in self._filtrados(filtro)]
+        for chave in apagados:
+            del self.documentos[chave]
+        self.escritas += len(apagados)
+
+    def count_documents(self, filtro):
+        return len(self._filtrados(filtro))
+
+
+class BancoEmMemoria(dict):
+    """Banco do modo --em-memoria: cria as coleções (ColecaoEmMemoria) no primeiro acesso."""
+
+    def __missing__(self, nome):
+        colecao = self[nome] = ColecaoEmMemoria(self)
+        return colecao
+
+
+def preparar_banco(mongo_uri, em_memoria):
+    """Aponta o processador_vendas para o banco de benchmark (real ou em memória) e o esvazia."""
+    if em_memoria:
+        banco = BancoEmMemoria()
+        collection = banco[repositorio_vendas.MONGO_COLLECTION]
+        processador_vendas.conectar_mongodb = lambda: collection
+        return banco
+
+    repositorio_vendas.configurar_conexao(mongo_uri, MONGO_DATABASE_BENCHMARK)
+    collection = processador_vendas.conectar_mongodb()
+    if collection is None:
+        sys.exit("Não foi possível conectar ao MongoDB do benchmark.")
+    collection.database.client.drop_database(MONGO_DATABASE_BENCHMARK)
+    return collection.database
+
+
+def executar_benchmark(linhas, arquivos, formato, mongo_uri, em_memoria, streaming, workers, tamanho_lote, escritores,
+                       assincrono=False):
+    pasta_trabalho = tempfile.mkdtemp(prefix='benchmark_vendas_')
+    diretorio_original = os.getcwd()
+    # As pastas do processador são relativas: trabalhando no diretório
+    # temporário, entrada, arquivo, erro e staging ficam isolados.
+    os.chdir(pasta_trabalho)
+    banco = None
+    try:
+        for pasta in (processador_vendas.PASTA_ENTRADA, processador_vendas.PASTA_ARQUIVO, processador_vendas.PASTA_ERRO):
+            os.makedirs(pasta, exist_ok=True)
+
+        print(f"--- Gerando {linhas} linhas em {arquivos} arquivo(s) {formato} ---")
+        inicio = time.perf_counter()
+        gerar_exportacoes(linhas, arquivos, processador_vendas.PASTA_ENTRADA, formato)
+        tempo_geracao = time.perf_counter() - inicio
+
+        banco = preparar_banco(mongo_uri, em_memoria)
+
+        print("\n--- Executando o pipeline de ingestão ---")
+        inicio = time.perf_counter()
+        if streaming:
+            processador_vendas.processar_arquivos_streaming(tamanho_lote=tamanho_lote, escritores=escritores)
+        elif assincrono:
+            processador_vendas.processar_arquivos_assincrono(workers, tamanho_lote, escritores)
+        else:
+            processador_vendas.processar_arquivos(workers, tamanho_lote, escritores)
+        tempo_total = time.perf_counter() - inicio
+
+        pedidos = banco[repositorio_vendas.MONGO_COLLECTION].count_documents({})
+        memoria = pico_memoria_mb()
+        # Medições do próprio processador (as dos workers do pool já vêm somadas)
+        etapas = processador_vendas.medidor.resumo()['etapas']
+
+        print("\n" + "=" * 50)
+        print("RESULTADO DO BENCHMARK")
+        print("=" * 50)
+        modo = 'streaming' if streaming else f"{'assíncrono' if assincrono else 'lote'} ({workers} worker(s))"
+        print(f"Modo: {modo} | "
+              f"Banco: {'em memória' if em_memoria else mongo_uri}")
+        print(f"Geração dos arquivos (não entra na conta): {tempo_geracao:.2f}s")
+        print(f"Linhas: {linhas} | Pedidos gravados: {pedidos}")
+        print(f"Tempo total do pipeline: {tempo_total:.2f}s")
+        print(f"Linhas/s:  {linhas / tempo_total:,.0f}")
+        print(f"Pedidos/s: {pedidos / tempo_total:,.0f}")
+        print(f"Pico de memória: {f'{memoria:,.0f} MB' if memoria is not None else 'n/d neste sistema'}")
+        print("\nTempo por etapa:")
+        for etapa, registro in etapas.items():
+            print(f"  {etapa:<15} {registro['duracao_s']:>9.2f}s  ({registro['duracao_s'] / tempo_total:>6.1%})")
+        if workers > 1 and not streaming:
+            print("  (leitura, normalização e staging rodaram em paralelo nos workers: a soma passa do tempo total)")
+        if assincrono and not streaming:
+            print("  (gravação e esperas somam o tempo de cada escritor/produtor, que rodam ao mesmo tempo)")
+        if em_memoria:
+            escritas = sum(colecao.escritas for colecao in banco.values())
+            print(f"  (banco em memória: {escritas} operações de escrita; a gravação não representa um mongod)")
+    finally:
+        os.chdir(diretorio_original)
+        shutil.rmtree(pasta_trabalho, ignore_errors=True)
+        if banco is not None and not em_memoria:
+            banco.client.drop_database(MONGO_DATABASE_BENCHMARK)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Mede a vazão do pipeline do processador_vendas com exportações sintéticas.")
+    parser.add_argument('--linhas', type=int, default=100_000, help="Total de linhas de itens (ex.: 10000 a 5000000).")
+    parser.add_argument('--arquivos', type=int, default=len(processador_vendas.MAPA_FILIAIS))
+    parser.add_argument('--formato', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('--mongo-uri', default=repositorio_vendas.MONGO_CONNECTION_STRING,
+                        help=f"MongoDB local para o teste; usa o banco '{MONGO_DATABASE_BENCHMARK}'.")
+    parser.add_argument('--em-memoria', action='store_true',
+                        help="Usa uma coleção em memória no lugar de um mongod (bom para medir parsing/transformação).")
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--assincrono', action='store_true')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--lote-escrita', type=int, default=processador_vendas.TAMANHO_LOTE_ESCRITA)
+    parser.add_argument('--escritores', type=int, default=processador_vendas.ESCRITORES)
+    args = parser.parse_args()
+
+    executar_benchmark(args.linhas, args.arquivos, args.formato, args.mongo_uri, args.em_memoria,
+                       args.streaming, args.workers, args.lote_escrita, args.escritores, args.assincrono)
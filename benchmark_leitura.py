@@ -0,0 +1,140 @@
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import processador_vendas
+import repositorio_vendas
+import carregador_colunar
+from gerador_exportacoes import gerar_linhas, QTD_PRODUTOS, LINHAS_POR_BLOCO_CSV
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- CONFIGURAÇÕES ---
+# Banco usado pelo benchmark de leitura. NUNCA aponte para o banco de produção (vendas_db).
+MONGO_DATABASE_BENCHMARK = "vendas_benchmark_leitura"
+# Campos que os relatórios usam dos pedidos
+CAMPOS_RELATORIO = ['emissao', 'filial_nome', 'vendedor', 'parceiro', 'valor_total_pedido']
+# Formas de carregar os pedidos comparadas:
+#   documentos: list(find()) dos documentos inteiros + pd.DataFrame (como os scripts faziam)
+#   projecao:   list(find()) só com os campos usados + pd.DataFrame
+#   lotes:      carregador_colunar sem pymongoarrow (lotes já em colunas, montados no servidor)
+#   arrow:      carregador_colunar com pymongoarrow (BSON -> Arrow)
+METODOS = ['documentos', 'projecao', 'lotes', 'arrow']
+# --------------------
+
+
+def pico_memoria_mb():
+    """Pico de memória residente do processo em MB, ou None quando indisponível."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def popular_banco(colecao, qtd_pedidos, semente=42, itens_por_pedido=None):
+    """
+    Grava qtd_pedidos pedidos sintéticos, montados pelo próprio
+    processador_vendas. itens_por_pedido fixa a quantidade de itens de cada
+    pedido (por padrão ela varia como nas exportações geradas).
+    """
+    rng = np.random.default_rng(semente)
+    precos = np.round(rng.lognormal(3.5, 1.0, QTD_PRODUTOS + 1), 2)
+    codigos_filiais = list(processador_vendas.MAPA_FILIAIS.keys())
+    proximo_pv = 100000
+    gravados = 0
+    bloco = 0
+    while gravados < qtd_pedidos:
+        df, proximo_pv = gerar_linhas(rng, LINHAS_POR_BLOCO_CSV, proximo_pv, precos, itens_por_pedido)
+        df = processador_vendas.marcar_filial(df, codigos_filiais[bloco % len(codigos_filiais)])
+        pedidos = processador_vendas.transformar_em_pedidos(processador_vendas.normalizar_tipos(df))
+        pedidos = pedidos[:qtd_pedidos - gravados]
+        colecao.insert_many(pedidos, ordered=False)
+        gravados += len(pedidos)
+        bloco += 1
+        print(f"  {gravados}/{qtd_pedidos} pedidos gravados")
+
+
+def medir_carga(metodo, mongo_uri):
+    """
+    Roda num processo novo (o pico de memória do processo não volta a cair):
+    carrega os pedidos pelo método pedido e mede tempo e memória.
+    """
+    repositorio_vendas.configurar_conexao(mongo_uri, MONGO_DATABASE_BENCHMARK)
+    colecao = repositorio_vendas.obter_colecao()
+    colecao.find_one()  # abre a conexão antes da medição
+    memoria_inicial = pico_memoria_mb()
+
+    inicio = time.perf_counter()
+    if metodo == 'documentos':
+        df = pd.DataFrame(list(colecao.find({})))
+    elif metodo == 'projecao':
+        df = pd.DataFrame(list(colecao.find({}, {campo: 1 for campo in CAMPOS_RELATORIO} | {'_id': 0})))
+    else:
+        esquema = {campo: carregador_colunar.ESQUEMA_PEDIDOS[campo] for campo in CAMPOS_RELATORIO}
+        df = carregador_colunar.carregar_dataframe(colecao, esquema=esquema, usar_arrow=(metodo == 'arrow'))
+    tempo = time.perf_counter() - inicio
+
+    memoria_final = pico_memoria_mb()
+    return {
+        'metodo': metodo,
+        'linhas': len(df),
+        'tempo_s': tempo,
+        'pico_mb': None if memoria_inicial is None else memoria_final - memoria_inicial,
+        'dataframe_mb': df.memory_usage(deep=True).sum() / (1024 * 1024),
+    }
+
+
+def executar_benchmark(qtd_pedidos, mongo_uri, reaproveitar, metodos):
+    repositorio_vendas.configurar_conexao(mongo_uri, MONGO_DATABASE_BENCHMARK)
+    colecao = repositorio_vendas.obter_colecao()
+    existentes = colecao.estimated_document_count()
+    if not (reaproveitar and existentes == qtd_pedidos):
+        print(f"--- Gravando {qtd_pedidos} pedidos no banco '{MONGO_DATABASE_BENCHMARK}' ---")
+        colecao.drop()
+        popular_banco(colecao, qtd_pedidos)
+    else:
+        print(f"--- Reaproveitando os {existentes} pedidos já gravados ---")
+    repositorio_vendas.fechar_conexao()
+
+    if 'arrow' in metodos and not carregador_colunar.pymongoarrow_disponivel():
+        print("AVISO: pymongoarrow não instalado; o método 'arrow' foi ignorado (pip install pymongoarrow).")
+        metodos = [metodo for metodo in metodos if metodo != 'arrow']
+
+    resultados = []
+    contexto = multiprocessing.get_context('spawn')
+    for metodo in metodos:
+        print(f"\nCarregando pelo método '{metodo}'...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+            resultados.append(executor.submit(medir_carga, metodo, mongo_uri).result())
+
+    print("\n" + "=" * 70)
+    print(f"RESULTADO DO BENCHMARK DE LEITURA ({qtd_pedidos} pedidos, campos: {', '.join(CAMPOS_RELATORIO)})")
+    print("=" * 70)
+    print(f"{'Método':<12} {'Linhas':>10} {'Tempo':>9} {'Pedidos/s':>12} {'Pico memória':>14} {'DataFrame':>11}")
+    for resultado in resultados:
+        pico = f"{resultado['pico_mb']:,.0f} MB" if resultado['pico_mb'] is not None else 'n/d'
+        print(f"{resultado['metodo']:<12} {resultado['linhas']:>10} {resultado['tempo_s']:>8.2f}s "
+              f"{resultado['linhas'] / resultado['tempo_s']:>12,.0f} {pico:>14} {resultado['dataframe_mb']:>8,.0f} MB")
+    print("(Pico memória: quanto a carga acrescentou ao pico do processo; DataFrame: tamanho final em memória)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compara o tempo e a memória de carregar pedidos do MongoDB num DataFrame.")
+    parser.add_argument('--pedidos', type=int, default=1_000_000)
+    parser.add_argument('--mongo-uri', default=repositorio_vendas.MONGO_CONNECTION_STRING,
+                        help=f"MongoDB local para o teste; usa o banco '{MONGO_DATABASE_BENCHMARK}'.")
+    parser.add_argument('--reaproveitar', action='store_true',
+                        help="Não regrava os pedidos se o banco de benchmark já tiver a quantidade pedida.")
+    parser.add_argument('--metodos', nargs='+', choices=METODOS, default=METODOS)
+    args = parser.parse_args()
+
+    executar_benchmark(args.pedidos, args.mongo_uri, args.reaproveitar, args.metodos)
@@ -0,0 +1,155 @@
+import pandas as pd
+
+from repositorio_vendas import filtro_pedidos, obter_colecao
+
+try:
+    import pyarrow as pa
+    from pymongoarrow.api import Schema, find_arrow_all
+except ImportError:  # pymongoarrow é opcional
+    find_arrow_all = None
+
+# --- CONFIGURAÇÕES ---
+# Tipo de cada campo do pedido quando carregado num DataFrame:
+#   data      -> datetime64[ms]
+#   numero    -> float64 (ausente vira NaN)
+#   inteiro   -> Int64 (inteiro que aceita ausente)
+#   categoria -> category (textos repetidos: filial, vendedor, parceiro...)
+#   texto     -> str
+# Só os campos pedidos são lidos do MongoDB; os itens nunca são trazidos.
+ESQUEMA_PEDIDOS = {
+    '_id': 'texto',
+    'numero_pv': 'inteiro',
+    'filial_codigo': 'categoria',
+    'filial_nome': 'categoria',
+    'parceiro': 'categoria',
+    'emissao': 'data',
+    'vendedor': 'categoria',
+    'condicao_pagamento': 'categoria',
+    'valor_total_pedido': 'numero',
+    'data_carga': 'data',
+}
+# Pedidos por lote colunar montado no servidor (só no modo sem pymongoarrow)
+TAMANHO_LOTE_LEITURA = 10_000
+# --------------------
+
+
+def pymongoarrow_disponivel():
+    return find_arrow_all is not None
+
+
+def _tipo_arrow(tipo):
+    if tipo == 'data':
+        return pa.timestamp('ms')
+    if tipo == 'numero':
+        return pa.float64()
+    if tipo == 'inteiro':
+        return pa.int64()
+    return pa.string()
+
+
+def _converter_coluna(valores, tipo):
+    """Converte uma coluna (lista ou Series vinda do Arrow) para o dtype do esquema."""
+    if tipo == 'data':
+        return pd.to_datetime(pd.Series(valores, dtype='object'), errors='coerce').astype('datetime64[ms]')
+    if tipo == 'numero':
+        return pd.to_numeric(pd.Series(valores, dtype='object'), errors='coerce').astype('float64')
+    if tipo == 'inteiro':
+        return pd.Series(valores, dtype='Int64')
+    if tipo == 'categoria':
+        return pd.Series(valores, dtype='category')
+    return pd.Series(valores, dtype='str')
+
+
+def _carregar_arrow(colecao, filtro, esquema, ordenar, limite):
+    """Decodifica o BSON direto em colunas Arrow (pymongoarrow), sem criar um dict por documento."""
+    tabela = find_arrow_all(colecao, filtro, schema=Schema({campo: _tipo_arrow(tipo) for campo, tipo in esquema.items()}),
+                            sort=ordenar, limit=limite)
+    for indice, (campo, tipo) in enumerate(esquema.items()):
+        if tipo == 'categoria':
+            tabela = tabela.set_column(indice, campo, tabela.column(campo).dictionary_encode())
+    df = tabela.to_pandas()
+    for campo, tipo in esquema.items():
+        if tipo in ('inteiro', 'texto'):
+            df[campo] = _converter_coluna(df[campo], tipo)
+    return df
+
+
+def _lotes_colunares(colecao, filtro, esquema, ordenar, limite, tamanho_lote):
+    """
+    Lotes já em colunas, montadas pelo servidor: cada lote de até tamanho_lote
+    pedidos chega como um único documento com uma lista por campo ($group +
+    $push), então nenhum dict é criado por pedido. Sem ordenar, os lotes
+    seguem o _id (cada um começa após o último _id do anterior); com ordenar
+    e limite, a ordem pedida é paginada com $skip.
+    """
+    # Os nomes c0, c1... evitam conflito com o _id do $group
+    agrupamento = {'_id': None, '_ultimo': {'$last': '$_id'}}
+    for indice, campo in enumerate(esquema):
+        agrupamento[f"c{indice}"] = {'$push': {'$ifNull': [f"${campo}", None]}}
+
+    lidos = 0
+    ultimo = None
+    while not limite or lidos < limite:
+        quantidade = tamanho_lote if not limite else min(tamanho_lote, limite - lidos)
+        if ordenar and limite:
+            etapas = [{'$match': filtro}, {'$sort': dict(list(ordenar) + [('_id', 1)])}, {'$skip': lidos}]
+        else:
+            etapas = [{'$match': filtro if ultimo is None else {'$and': [filtro, {'_id': {'$gt': ultimo}}]}},
+                      {'$sort': {'_id': 1}}]
+        lote = next(colecao.aggregate(etapas + [{'$limit': quantidade}, {'$group': agrupamento}], allowDiskUse=True), None)
+        if lote is None:
+            return
+        colunas = [lote[f"c{indice}"] for indice in range(len(esquema))]
+        yield colunas
+        lidos += len(colunas[0])
+        ultimo = lote['_ultimo']
+        if len(colunas[0]) < quantidade:
+            return
+
+
+def _carregar_lotes(colecao, filtro, esquema, ordenar, limite, tamanho_lote):
+    """
+    Junta os lotes colunares (_lotes_colunares) numa lista por campo. Sem
+    limite, a ordem pedida é aplicada no DataFrame (os campos de ordenar
+    precisam estar no esquema).
+    """
+    colunas = {campo: [] for campo in esquema}
+    for lote in _lotes_colunares(colecao, filtro, esquema, ordenar, limite, tamanho_lote):
+        for valores, valores_lote in zip(colunas.values(), lote):
+            valores.extend(valores_lote)
+    df = pd.DataFrame({campo: _converter_coluna(valores, esquema[campo]) for campo, valores in colunas.items()})
+    if ordenar and not limite:
+        df = df.sort_values([campo for campo, _ in ordenar], ascending=[direcao > 0 for _, direcao in ordenar],
+                            kind='stable', ignore_index=True)
+    return df
+
+
+def carregar_dataframe(colecao, filtro=None, esquema=ESQUEMA_PEDIDOS, ordenar=None, limite=0,
+                       tamanho_lote=TAMANHO_LOTE_LEITURA, usar_arrow=None):
+    """
+    Carrega o resultado de um find() num DataFrame colunar, com uma coluna por
+    campo do esquema ({campo: tipo}, ver ESQUEMA_PEDIDOS) já no dtype certo.
+
+    Com o pymongoarrow instalado o BSON é decodificado direto em Arrow; sem
+    ele, o servidor devolve cada lote já como uma lista por campo. Nos dois
+    casos só os campos do esquema são trazidos do servidor.
+    usar_arrow=False força o segundo modo (para comparação no benchmark).
+    """
+    filtro = filtro or {}
+    if usar_arrow is None:
+        usar_arrow = pymongoarrow_disponivel()
+    if usar_arrow:
+        return _carregar_arrow(colecao, filtro, esquema, ordenar, limite)
+    return _carregar_lotes(colecao, filtro, esquema, ordenar, limite, tamanho_lote)
+
+
+def carregar_pedidos(inicio=None, fim=None, filiais=None, vendedores=None, campos=None,
+                     ordenar=None, limite=0, colecao=None):
+    """
+    Pedidos que atendem a filtro_pedidos(...) num DataFrame colunar.
+    campos: lista de campos de ESQUEMA_PEDIDOS a carregar (None = todos).
+    """
+    if colecao is None:
+        colecao = obter_colecao(leitura_secundaria=True)
+    esquema = ESQUEMA_PEDIDOS if campos is None else {campo: ESQUEMA_PEDIDOS[campo] for campo in campos}
+    return carregar_dataframe(colecao, filtro_pedidos(inicio, fim, filiais, vendedores), esquema, ordenar, limite)
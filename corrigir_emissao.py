@@ -0,0 +1,144 @@
+import os
+import argparse
+from datetime import datetime
+from pymongo import UpdateOne
+
+import processador_vendas as pv
+from repositorio_vendas import CAMPO_CHAVE_LOGICA, calcular_chave_logica
+from resumo_vendas import PROJECAO_RESUMO, obter_resumo, atualizar_resumo
+from preencher_chave_logica import gravar_lote as gravar_hashes
+
+# --- CONFIGURAÇÕES ---
+# Script de uso único. Até a Emissão ser lida com o FORMATO_EMISSAO
+# (dd/mm/aaaa), o pandas lia a Emissão dos CSVs como mm/dd/aaaa: nos pedidos
+# com dia até 12 gravou dia e mês trocados, e os demais foram descartados na
+# carga. As planilhas com células de data não foram afetadas.
+# Relê os arquivos já processados (pasta Processados) com a leitura atual e,
+# para cada pedido gravado com a data trocada, corrige a emissão, recalcula o
+# hash da chave lógica, move o pedido no resumo diário e atualiza a
+# data_carga, para a exportação incremental do ExportBI reenviá-lo. Os
+# pedidos descartados são inseridos e o staging do arquivo é regravado.
+# Pode ser rodado de novo: pedidos já corrigidos não são alterados.
+TAMANHO_LOTE_CORRECAO = 5000
+# --------------------
+
+
+def data_trocada(data):
+    """A data como a leitura mm/dd/aaaa a gravou, ou None se o dia passa de 12."""
+    if data.day > 12:
+        return None
+    return data.replace(month=data.day, day=data.month)
+
+
+def corrigir_lote(collection, pedidos, simular):
+    """
+    Corrige os pedidos do lote gravados com a emissão trocada.
+    Retorna (corrigidos, hashes recusados por duplicata, ids não encontrados no banco).
+    """
+    corretos = {pedido['_id']: pedido for pedido in pedidos}
+    gravados = {pedido['_id']: pedido for pedido in collection.find(
+        {'_id': {'$in': list(corretos)}}, {**PROJECAO_RESUMO, 'numero_pv': 1})}
+    trocados = []
+    for _id, gravado in gravados.items():
+        emissao = corretos[_id]['emissao']
+        if gravado.get('emissao') != emissao and gravado.get('emissao') == data_trocada(emissao):
+            trocados.append(gravado)
+    ausentes = [_id for _id in corretos if _id not in gravados]
+    if simular or not trocados:
+        return len(trocados), 0, ausentes
+
+    # Primeiro a emissão, sem o hash antigo: o índice único só confere o novo
+    agora = datetime.now()
+    collection.bulk_write([
+        UpdateOne({'_id': gravado['_id'], 'emissao': gravado['emissao']},
+                  {'$set': {'emissao': corretos[gravado['_id']]['emissao'], 'data_carga': agora},
+                   '$unset': {CAMPO_CHAVE_LOGICA: ''}})
+        for gravado in trocados
+    ], ordered=False)
+    resumo = obter_resumo(collection)
+    atualizar_resumo(resumo, trocados, sinal=-1)
+    atualizar_resumo(resumo, [{**gravado, 'emissao': corretos[gravado['_id']]['emissao']} for gravado in trocados])
+
+    operacoes = [
+        UpdateOne({'_id': gravado['_id']},
+                  {'$set': {CAMPO_CHAVE_LOGICA: calcular_chave_logica(
+                      gravado['numero_pv'], gravado.get('parceiro'), corretos[gravado['_id']]['emissao'],
+                      gravado.get('valor_total_pedido'))}})
+        for gravado in trocados
+    ]
+    _, recusados = gravar_hashes(collection, operacoes)
+    return len(trocados), recusados, ausentes
+
+
+def corrigir_arquivo(collection, caminho_arquivo, simular, tamanho_lote):
+    """Corrige os pedidos de um arquivo processado. Retorna (corrigidos, recusados, inseridos)."""
+    codigo_filial = pv.identificar_filial(os.path.basename(caminho_arquivo))
+    if not codigo_filial:
+        print(f"  -> Filial não identificada em '{caminho_arquivo}'. Ignorado.")
+        return 0, 0, 0
+
+    df = pv.ler_arquivo(caminho_arquivo)
+    pv.marcar_filial(df, codigo_filial)
+    pv.normalizar_tipos(df)
+    pedidos = pv.transformar_em_pedidos(df)
+
+    corrigidos = recusados = 0
+    ausentes = []
+    for i in range(0, len(pedidos), tamanho_lote):
+        resultado = corrigir_lote(collection, pedidos[i:i + tamanho_lote], simular)
+        corrigidos, recusados = corrigidos + resultado[0], recusados + resultado[1]
+        ausentes.extend(resultado[2])
+
+    if simular:
+        print(f"  -> {corrigidos} pedidos com a emissão trocada; {len(ausentes)} não estão no banco.")
+        return corrigidos, 0, len(ausentes)
+
+    ids_ausentes = set(ausentes)
+    inseridos = pv.gravar_pedidos(collection, [pedido for pedido in pedidos if pedido['_id'] in ids_ausentes],
+                                  tamanho_lote, escritores=1)
+    if pv.staging_disponivel():
+        pv.gravar_staging(df, pv.calcular_chave_arquivo(caminho_arquivo), codigo_filial)
+    print(f"  -> {corrigidos} pedidos corrigidos; {inseridos} descartados na carga foram inseridos.")
+    return corrigidos, recusados, inseridos
+
+
+def corrigir_emissao(arquivos=None, simular=True, tamanho_lote=TAMANHO_LOTE_CORRECAO):
+    collection = pv.conectar_mongodb()
+    if collection is None:
+        return
+
+    if not arquivos:
+        arquivos = sorted(os.path.join(pv.PASTA_ARQUIVO, arquivo) for arquivo in os.listdir(pv.PASTA_ARQUIVO)
+                          if arquivo.endswith('.csv'))
+    if simular:
+        print("\n--- MODO SIMULAÇÃO: nada será alterado ---")
+
+    total_corrigidos = total_recusados = total_inseridos = 0
+    for caminho_arquivo in arquivos:
+        print(f"\nRelendo '{caminho_arquivo}'...")
+        corrigidos, recusados, inseridos = corrigir_arquivo(collection, caminho_arquivo, simular, tamanho_lote)
+        total_corrigidos += corrigidos
+        total_recusados += recusados
+        total_inseridos += inseridos
+
+    print("\n--- RESUMO DA CORREÇÃO ---")
+    print(f"Arquivos relidos: {len(arquivos)}")
+    print(f"Pedidos com a emissão trocada: {total_corrigidos}")
+    print(f"Pedidos que faltavam no banco: {total_inseridos}")
+    if total_recusados:
+        print(f"Pedidos sem o hash (duplicatas lógicas de pedidos já gravados): {total_recusados}")
+        print("Rode o remover_duplicata e depois o preencher_chave_logica.")
+    if simular:
+        print("Para aplicar a correção, rode com --executar.")
+    elif total_corrigidos or total_inseridos:
+        print("Rode o ExportBI (incremental ou completo) para atualizar o Power BI.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Corrige a emissão dos pedidos carregados dos CSVs com dia e mês trocados.")
+    parser.add_argument('arquivos', nargs='*', help="Arquivos a reler (padrão: os CSVs da pasta Processados)")
+    parser.add_argument('--executar', action='store_true', help="Aplica a correção (sem ele, só simula)")
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_CORRECAO)
+    args = parser.parse_args()
+
+    corrigir_emissao(args.arquivos, simular=not args.executar, tamanho_lote=args.lote)
@@ -1,59 +1,42 @@
-from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 
+from repositorio_vendas import MONGO_DATABASE, obter_colecao, buscar_duplicatas_logicas, escolher_pedido_mantido
+from gerenciar_indices import situacao_chave_logica
+
 # --- CONFIGURAÇÕES ---
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
 # --------------------
 
 def encontrar_duplicatas_logicas():
     """Conecta ao MongoDB e procura por documentos que são funcionalmente idênticos."""
     try:
-        client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
+        collection = obter_colecao(leitura_secundaria=True)
         print(f"Conectado com sucesso ao banco '{MONGO_DATABASE}'.")
     except ConnectionFailure as e:
         print(f"Não foi possível conectar ao MongoDB: {e}")
         return
 
-    # Pipeline de agregação para encontrar duplicatas com base nos dados de negócio
-    pipeline = [
-        {
-            # Passo 1: Agrupa por campos que definem uma duplicata lógica
-            "$group": {
-                "_id": {
-                    "numero_pv": "$numero_pv",
-                    "parceiro": "$parceiro",
-                    "emissao": "$emissao",
-                    "valor": "$valor_total_pedido"
-                },
-                # Coleta os _ids e filial_codigo de todos os documentos no grupo
-                "documentos_encontrados": {
-                    "$push": {
-                        "_id": "$_id",
-                        "filial_codigo": "$filial_codigo",
-                        "data_carga": "$data_carga"
-                    }
-                },
-                "count": {"$sum": 1}
-            }
-        },
-        {
-            # Passo 2: Filtra apenas os grupos que têm mais de um documento (duplicatas)
-            "$match": {
-                "count": {"$gt": 1}
-            }
-        }
-    ]
-
     print("\n--- Procurando por duplicatas lógicas avançadas...")
     print("(Pedidos com mesmo número, parceiro, data de emissão e valor total)")
-    
-    duplicatas = list(collection.aggregate(pipeline))
 
+    indice_ativo, total, com_chave = situacao_chave_logica(collection)
+    if indice_ativo:
+        # O índice único garante que os pedidos com o hash não se repetem;
+        # só os pedidos sem o hash precisam ser conferidos.
+        print(f"Índice único da chave lógica ativo: {com_chave} de ~{total} pedidos protegidos.")
+    else:
+        print("AVISO: índice único da chave lógica ausente (rode 'python preencher_chave_logica.py'); "
+              "calculando a chave de todos os pedidos.")
+    # A chave é a mesma do índice e do remover_duplicata: parceiro, emissão e valor normalizados
+    duplicatas = [] if indice_ativo and com_chave >= total else [
+        {'_id': {'numero_pv': pedidos[0]['numero_pv'], 'parceiro': pedidos[0].get('parceiro'),
+                 'valor': pedidos[0].get('valor_total_pedido')},
+         'documentos_encontrados': pedidos}
+        for pedidos in buscar_duplicatas_logicas(collection)
+    ]
+    imprimir_duplicatas(duplicatas)
+
+
+def imprimir_duplicatas(duplicatas):
     if not duplicatas:
         print("\n>> Nenhuma duplicata encontrada com a verificação avançada.")
         print("Isso é muito estranho, dado o aumento nos valores. O problema pode ser outro.")
@@ -63,13 +46,16 @@ def encontrar_duplicatas_logicas():
         for grupo in duplicatas:
             info = grupo['_id']
             docs = grupo['documentos_encontrados']
+            valor = f"R${info['valor']:,.2f}" if info['valor'] is not None else 'sem valor'
+            mantido = escolher_pedido_mantido(docs)
             print("-" * 50)
-            print(f"Pedido Duplicado: Nº {info['numero_pv']} | Parceiro: {info['parceiro']} | Valor: R${info['valor']:,.2f}")
+            print(f"Pedido Duplicado: Nº {info['numero_pv']} | Parceiro: {info['parceiro']} | Valor: {valor}")
             print("Documentos no Banco de Dados:")
             for doc in docs:
-                print(f"  - _id: {doc['_id']} (Filial: {doc['filial_codigo']}) | Carregado em: {doc['data_carga']}")
+                destino = 'fica' if doc is mantido else 'sai'
+                print(f"  - _id: {doc['_id']} (Filial: {doc.get('filial_codigo')}) | Carregado em: {doc.get('data_carga')} "
+                      f"| remover_duplicata: {destino}")
 
-    client.close()
 
 if __name__ == '__main__':
     encontrar_duplicatas_logicas()
\ No newline at end of file
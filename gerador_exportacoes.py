@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import os
+import argparse
+from datetime import datetime
+
+from processador_vendas import (
+    MAPA_FILIAIS, PASTA_ENTRADA,
+    COL_NUMERO_PV, COL_EMISSAO, COL_PARCEIRO, COL_VENDEDOR, COL_PRODUTO,
+    COL_PRODUTO_DESC, COL_QTD, COL_UNITARIO, COL_TOTAL_ITEM, COL_COND_PAGTO
+)
+
+# --- CONFIGURAÇÕES ---
+# Tamanho dos cadastros fictícios usados para sortear os valores das linhas
+QTD_PARCEIROS = 5000
+QTD_VENDEDORES = 40
+QTD_PRODUTOS = 20000
+CONDICOES_PAGAMENTO = ["A VISTA", "28 DD", "30/60 DD", "30/60/90 DD", "BOLETO 45 DD", "CARTAO"]
+MAX_ITENS_POR_PEDIDO = 12
+MESES_DE_HISTORICO = 24
+# O Excel não comporta mais do que 1.048.576 linhas por planilha
+MAX_LINHAS_XLSX = 1_048_575
+LINHAS_POR_BLOCO_CSV = 500_000
+# --------------------
+
+
+def gerar_linhas(rng, qtd_linhas, primeiro_pv, precos, itens_por_pedido_fixo=None):
+    """
+    Gera um DataFrame com qtd_linhas itens de venda no layout da exportação do ERP.
+
+    Os itens de cada pedido ficam em linhas consecutivas e compartilham
+    emissão, parceiro, vendedor e condição de pagamento; a quantidade de itens
+    por pedido segue uma distribuição concentrada em pedidos pequenos.
+    precos é a tabela de preço unitário indexada pelo código do produto.
+    itens_por_pedido_fixo, se informado, dá a todos os pedidos essa mesma
+    quantidade de itens (útil para benchmarks com uma proporção exata).
+    Retorna o DataFrame e o próximo número de PV livre.
+    """
+    # Pedidos suficientes para cobrir as linhas pedidas (cada um tem ao menos 1 item)
+    if itens_por_pedido_fixo:
+        itens_por_pedido = np.full(qtd_linhas, itens_por_pedido_fixo)
+    else:
+        itens_por_pedido = np.minimum(rng.geometric(0.35, size=qtd_linhas), MAX_ITENS_POR_PEDIDO)
+    ultimo_pedido = np.searchsorted(np.cumsum(itens_por_pedido), qtd_linhas)
+    itens_por_pedido = itens_por_pedido[:ultimo_pedido + 1]
+    itens_por_pedido[-1] -= itens_por_pedido.sum() - qtd_linhas
+    qtd_pedidos = len(itens_por_pedido)
+
+    hoje = pd.Timestamp(datetime.now().date())
+    dias_historico = MESES_DE_HISTORICO * 30
+    emissoes = hoje - pd.to_timedelta(rng.integers(0, dias_historico, qtd_pedidos), unit='D')
+
+    pedidos = pd.DataFrame({
+        COL_NUMERO_PV: np.arange(primeiro_pv, primeiro_pv + qtd_pedidos),
+        COL_EMISSAO: emissoes.strftime('%d/%m/%Y'),
+        COL_PARCEIRO: np.char.add('CLIENTE COMERCIAL LTDA ', rng.zipf(1.3, qtd_pedidos).clip(max=QTD_PARCEIROS).astype(str)),
+        COL_VENDEDOR: np.char.add('VENDEDOR ', rng.integers(1, QTD_VENDEDORES + 1, qtd_pedidos).astype(str)),
+        COL_COND_PAGTO: rng.choice(CONDICOES_PAGAMENTO, qtd_pedidos),
+    })
+
+    df = pedidos.loc[pedidos.index.repeat(itens_por_pedido)].reset_index(drop=True)
+
+    produtos = rng.integers(1, QTD_PRODUTOS + 1, qtd_linhas)
+    quantidades = rng.integers(1, 20, qtd_linhas)
+
+    df[COL_PRODUTO] = produtos
+    df[COL_PRODUTO_DESC] = np.char.add('PRODUTO DE TESTE ', produtos.astype(str))
+    df[COL_QTD] = quantidades
+    df[COL_UNITARIO] = precos[produtos]
+    df[COL_TOTAL_ITEM] = np.round(quantidades * precos[produtos], 2)
+
+    colunas = [COL_NUMERO_PV, COL_EMISSAO, COL_PARCEIRO, COL_VENDEDOR, COL_PRODUTO, COL_PRODUTO_DESC,
+               COL_QTD, COL_UNITARIO, COL_TOTAL_ITEM, COL_COND_PAGTO]
+    return df[colunas], primeiro_pv + qtd_pedidos
+
+
+def gerar_exportacoes(total_linhas, qtd_arquivos=1, pasta=PASTA_ENTRADA, formato='csv', semente=42):
+    """
+    Grava qtd_arquivos exportações sintéticas somando total_linhas itens, com
+    o código da filial (chaves do MAPA_FILIAIS) no nome de cada arquivo.
+    Retorna a lista de caminhos gerados.
+    """
+    if formato == 'xlsx' and total_linhas / qtd_arquivos > MAX_LINHAS_XLSX:
+        raise ValueError(f"Arquivos .xlsx comportam no máximo {MAX_LINHAS_XLSX} linhas; aumente --arquivos ou use csv.")
+
+    os.makedirs(pasta, exist_ok=True)
+    rng = np.random.default_rng(semente)
+    # Preço fixo por produto, para que o mesmo código tenha sempre o mesmo unitário
+    precos = np.round(rng.lognormal(3.5, 1.0, QTD_PRODUTOS + 1), 2)
+    codigos_filiais = list(MAPA_FILIAIS.keys())
+    linhas_por_arquivo = [total_linhas // qtd_arquivos + (1 if i < total_linhas % qtd_arquivos else 0)
+                          for i in range(qtd_arquivos)]
+
+    caminhos = []
+    proximo_pv = 100000
+    for indice, qtd_linhas in enumerate(linhas_por_arquivo):
+        codigo_filial = codigos_filiais[indice % len(codigos_filiais)]
+        caminho = os.path.join(pasta, f"exportacao_{codigo_filial}_{indice + 1:03d}.{formato}")
+        print(f"Gerando {caminho} ({qtd_linhas} linhas)...")
+
+        if formato == 'xlsx':
+            df, proximo_pv = gerar_linhas(rng, qtd_linhas, proximo_pv, precos)
+            df.to_excel(caminho, index=False)
+        else:
+            # CSV grandes são gerados e gravados em blocos para não estourar a memória
+            restantes = qtd_linhas
+            primeiro_bloco = True
+            while restantes > 0:
+                df, proximo_pv = gerar_linhas(rng, min(restantes, LINHAS_POR_BLOCO_CSV), proximo_pv, precos)
+                df.to_csv(caminho, sep=';', decimal=',', index=False, encoding='utf-8',
+                          mode='w' if primeiro_bloco else 'a', header=primeiro_bloco)
+                restantes -= len(df)
+                primeiro_bloco = False
+        caminhos.append(caminho)
+
+    return caminhos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gera exportações de vendas sintéticas no layout esperado pelo processador_vendas.")
+    parser.add_argument('--linhas', type=int, default=100_000, help="Total de linhas de itens (ex.: 10000 a 5000000).")
+    parser.add_argument('--arquivos', type=int, default=len(MAPA_FILIAIS), help="Quantidade de arquivos a gerar.")
+    parser.add_argument('--pasta', default=PASTA_ENTRADA, help=f"Pasta de destino (padrão: {PASTA_ENTRADA}).")
+    parser.add_argument('--formato', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('--semente', type=int, default=42, help="Semente do gerador aleatório, para repetir a mesma massa.")
+    args = parser.parse_args()
+
+    gerar_exportacoes(args.linhas, args.arquivos, args.pasta, args.formato, args.semente)
+    print("Geração concluída!")
@@ -1,5 +1,4 @@
 import pandas as pd
-from pymongo import MongoClient
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
@@ -9,10 +8,10 @@ from dateutil.relativedelta import relativedelta
 import os
 import locale
 
+from repositorio_vendas import obter_colecao, totalizar_vendas
+from carregador_colunar import carregar_pedidos
+
 # --- CONFIGURAÇÕES GERAIS E DE ESTILO ---
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
 COR_PRINCIPAL = "#003f5c"
 COR_SECUNDARIA = "#2f4f4f"
 COR_FUNDO_KPI = "#f0f0f0"
@@ -85,22 +84,37 @@ class PDF(FPDF):
             self.ln()
         return self.get_y()
 
-def buscar_dados_mongodb():
-    print("Buscando dados do MongoDB...")
-    client = MongoClient(MONGO_CONNECTION_STRING)
-    db = client[MONGO_DATABASE]
-    collection = db[MONGO_COLLECTION]
-    dados = list(collection.find({}))
-    if not dados: return pd.DataFrame()
-    df = pd.DataFrame(dados)
-    df['emissao'] = pd.to_datetime(df['emissao'])
-    print(f"{len(df)} registros encontrados.")
-    return df
+def buscar_vendas_por_filial(inicio, fim=None):
+    """
+    Total vendido por filial no período [inicio, fim), somado no MongoDB
+    (a partir do resumo diário, quando disponível).
+    Retorna (Series filial_nome -> total, primeira emissão, última emissão).
+    """
+    linhas = totalizar_vendas(['filial_nome'], inicio, fim)
+    vendas = pd.Series({linha['filial_nome']: linha['total'] for linha in linhas}, dtype='float64')
+    if not linhas:
+        return vendas, None, None
+    return vendas, min(linha['primeira_emissao'] for linha in linhas), max(linha['ultima_emissao'] for linha in linhas)
+
+def buscar_vendas_mensais(inicio, fim):
+    """Total por mês e filial no período [inicio, fim), somado no MongoDB (uma linha por mês × filial)."""
+    linhas = totalizar_vendas(['filial_nome'], inicio, fim, por_mes=True)
+    if not linhas: return pd.DataFrame(columns=['emissao', 'filial_nome', 'valor_total_pedido'])
+    df = pd.DataFrame(linhas)
+    df['emissao'] = pd.to_datetime({'year': df['ano'], 'month': df['mes'], 'day': 1})
+    return df.rename(columns={'total': 'valor_total_pedido'})[['emissao', 'filial_nome', 'valor_total_pedido']]
+
+def buscar_ultimas_vendas(filial, limite=10):
+    """Últimas vendas da filial num DataFrame, trazendo do MongoDB só os campos exibidos na tabela."""
+    return carregar_pedidos(filiais=filial, campos=['emissao', 'parceiro', 'vendedor', 'valor_total_pedido'],
+                            ordenar=[('emissao', -1)], limite=limite)
+
+def completar_meses(serie_ou_df):
+    """Preenche com zero os meses sem venda entre o primeiro e o último mês da série."""
+    meses = pd.date_range(serie_ou_df.index.min(), serie_ou_df.index.max(), freq='MS')
+    return serie_ou_df.reindex(meses, fill_value=0)
 
-def criar_grafico_vendas_filial(df_dados, titulo, nome_arquivo, tamanho='largo'):
-    vendas_por_filial = pd.Series(dtype='float64')
-    if not df_dados.empty:
-        vendas_por_filial = df_dados.groupby('filial_nome')['valor_total_pedido'].sum()
+def criar_grafico_vendas_filial(vendas_por_filial, titulo, nome_arquivo, tamanho='largo'):
     vendas_por_filial = vendas_por_filial.reindex(FILIAIS_ORDEM).fillna(0)
     fig_size = (10, 4.5) if tamanho == 'largo' else (5, 4.5)
     plt.style.use('seaborn-v0_8-whitegrid')
@@ -126,18 +140,10 @@ def criar_grafico_vendas_filial(df_dados, titulo, nome_arquivo, tamanho='largo')
     plt.close()
     return True
 
-def criar_grafico_evolucao_mensal(df, nome_arquivo):
-    if df.empty: return False
-    # <<< LÓGICA DE DATAS CORRIGIDA >>>
-    hoje = datetime.now()
-    primeiro_dia_mes_atual = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    fim_periodo = primeiro_dia_mes_atual - relativedelta(microseconds=1)
-    inicio_periodo = primeiro_dia_mes_atual - relativedelta(months=12)
-    # <<< FIM DA CORREÇÃO >>>
-    
-    df_periodo = df[(df['emissao'] >= inicio_periodo) & (df['emissao'] <= fim_periodo)]
-    if df_periodo.empty: return False
-    vendas_mensais = df_periodo.groupby(pd.Grouper(key='emissao', freq='M'))['valor_total_pedido'].sum()
+def criar_grafico_evolucao_mensal(df_mensal, nome_arquivo):
+    # df_mensal já vem restrito aos últimos 12 meses completos (buscar_vendas_mensais)
+    if df_mensal.empty: return False
+    vendas_mensais = completar_meses(df_mensal.groupby('emissao')['valor_total_pedido'].sum())
     plt.style.use('seaborn-v0_8-whitegrid')
     fig, ax = plt.subplots(figsize=(10, 5))
     sns.lineplot(x=vendas_mensais.index, y=vendas_mensais.values, marker='o', color=COR_PRINCIPAL, ax=ax)
@@ -157,19 +163,10 @@ def criar_grafico_evolucao_mensal(df, nome_arquivo):
     plt.close()
     return True
 
-def criar_grafico_evolucao_por_filial(df, nome_arquivo):
-    if df.empty: return False
-    # <<< LÓGICA DE DATAS CORRIGIDA >>>
-    hoje = datetime.now()
-    primeiro_dia_mes_atual = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    fim_periodo = primeiro_dia_mes_atual - relativedelta(microseconds=1)
-    inicio_periodo = primeiro_dia_mes_atual - relativedelta(months=12)
-    # <<< FIM DA CORREÇÃO >>>
-
-    df_periodo = df[(df['emissao'] >= inicio_periodo) & (df['emissao'] <= fim_periodo)]
-    if df_periodo.empty: return False
-    vendas_por_mes_filial = df_periodo.groupby([pd.Grouper(key='emissao', freq='M'), 'filial_nome'])['valor_total_pedido'].sum()
-    df_pivot = vendas_por_mes_filial.unstack(fill_value=0)
+def criar_grafico_evolucao_por_filial(df_mensal, nome_arquivo):
+    if df_mensal.empty: return False
+    df_pivot = completar_meses(df_mensal.pivot_table(index='emissao', columns='filial_nome',
+                                                     values='valor_total_pedido', aggfunc='sum', fill_value=0))
     plt.style.use('seaborn-v0_8-whitegrid')
     fig, ax = plt.subplots(figsize=(10, 5))
     sns.lineplot(data=df_pivot, marker='o', ax=ax, palette=CORES_GRAFICOS)
@@ -190,38 +187,40 @@ def criar_grafico_evolucao_por_filial(df, nome_arquivo):
     return True
 
 def gerar_relatorio():
-    df = buscar_dados_mongodb()
-    if df.empty: return
+    print("Buscando dados do MongoDB...")
+    if obter_colecao(leitura_secundaria=True).find_one({}, {'_id': 1}) is None: return
 
     hoje = datetime.now()
     mes_atual_inicio = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     ano_atual_inicio = hoje.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    mes_passado_fim = mes_atual_inicio - relativedelta(microseconds=1)
-    mes_passado_inicio = mes_passado_fim.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    mes_passado_inicio = mes_atual_inicio - relativedelta(months=1)
+    inicio_evolucao = mes_atual_inicio - relativedelta(months=12)
     
-    df_mes_atual = df[df['emissao'] >= mes_atual_inicio]
-    df_mes_passado = df[(df['emissao'] >= mes_passado_inicio) & (df['emissao'] <= mes_passado_fim)]
-    df_ano_atual = df[df['emissao'] >= ano_atual_inicio]
+    # Só os totais agregados saem do servidor: uma linha por filial (ou por mês × filial)
+    vendas_filial_mes_atual, _, _ = buscar_vendas_por_filial(mes_atual_inicio)
+    vendas_filial_mes_passado, _, _ = buscar_vendas_por_filial(mes_passado_inicio, mes_atual_inicio)
+    vendas_filial_ano, primeira_emissao_ano, ultima_emissao_ano = buscar_vendas_por_filial(ano_atual_inicio)
+    df_evolucao = buscar_vendas_mensais(inicio_evolucao, mes_atual_inicio)
     
-    vendas_mes_atual = df_mes_atual['valor_total_pedido'].sum() if not df_mes_atual.empty else 0
-    vendas_mes_passado = df_mes_passado['valor_total_pedido'].sum() if not df_mes_passado.empty else 0
-    vendas_ano_atual = df_ano_atual['valor_total_pedido'].sum() if not df_ano_atual.empty else 0
+    vendas_mes_atual = vendas_filial_mes_atual.sum()
+    vendas_mes_passado = vendas_filial_mes_passado.sum()
+    vendas_ano_atual = vendas_filial_ano.sum()
 
     kpi_mes_atual = f"R$ {vendas_mes_atual:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
     kpi_mes_passado = f"R$ {vendas_mes_passado:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
     kpi_ano_atual = f"R$ {vendas_ano_atual:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
     
     titulo_grafico_ano = f"Acumulado do Ano ({hoje.year})"
-    if not df_ano_atual.empty:
-        data_inicio_ano = df_ano_atual['emissao'].min().strftime('%d/%m/%Y')
-        data_fim_ano = df_ano_atual['emissao'].max().strftime('%d/%m/%Y')
+    if primeira_emissao_ano is not None:
+        data_inicio_ano = primeira_emissao_ano.strftime('%d/%m/%Y')
+        data_fim_ano = ultima_emissao_ano.strftime('%d/%m/%Y')
         titulo_grafico_ano = f"Acumulado do Ano (de {data_inicio_ano} a {data_fim_ano})"
 
-    grafico_ano_ok = criar_grafico_vendas_filial(df_ano_atual, titulo_grafico_ano, 'grafico_ano.png', tamanho='largo')
-    grafico_mes_atual_ok = criar_grafico_vendas_filial(df_mes_atual, f"Mês Atual ({hoje.strftime('%B')})", 'grafico_mes_atual.png', tamanho='largo')
-    grafico_mes_passado_ok = criar_grafico_vendas_filial(df_mes_passado, f"Mês Anterior ({mes_passado_inicio.strftime('%B')})", 'grafico_mes_passado.png', tamanho='largo')
-    grafico_evolucao_geral_ok = criar_grafico_evolucao_mensal(df, 'grafico_evolucao_geral.png')
-    grafico_evolucao_filial_ok = criar_grafico_evolucao_por_filial(df, 'grafico_evolucao_filial.png')
+    grafico_ano_ok = criar_grafico_vendas_filial(vendas_filial_ano, titulo_grafico_ano, 'grafico_ano.png', tamanho='largo')
+    grafico_mes_atual_ok = criar_grafico_vendas_filial(vendas_filial_mes_atual, f"Mês Atual ({hoje.strftime('%B')})", 'grafico_mes_atual.png', tamanho='largo')
+    grafico_mes_passado_ok = criar_grafico_vendas_filial(vendas_filial_mes_passado, f"Mês Anterior ({mes_passado_inicio.strftime('%B')})", 'grafico_mes_passado.png', tamanho='largo')
+    grafico_evolucao_geral_ok = criar_grafico_evolucao_mensal(df_evolucao, 'grafico_evolucao_geral.png')
+    grafico_evolucao_filial_ok = criar_grafico_evolucao_por_filial(df_evolucao, 'grafico_evolucao_filial.png')
 
     pdf = PDF('P', 'mm', 'A4')
     
@@ -252,14 +251,14 @@ def gerar_relatorio():
     header_tabela = ['Emissão', 'Parceiro', 'Vendedor', 'Valor']
     col_widths = [18, 40, 20, 20]
     for filial in FILIAIS_ORDEM[:2]: 
-        df_filial = df[df['filial_nome'] == filial].sort_values(by='emissao', ascending=False).head(10)
-        if not df_filial.empty:
-            dados = [[row['emissao'].strftime('%d/%m/%y'), row['parceiro'], row['vendedor'], f"R${row['valor_total_pedido']:,.0f}"] for _, row in df_filial.iterrows()]
+        ultimas_vendas = buscar_ultimas_vendas(filial)
+        if not ultimas_vendas.empty:
+            dados = [[row.emissao.strftime('%d/%m/%y'), row.parceiro, row.vendedor, f"R${row.valor_total_pedido:,.0f}"] for row in ultimas_vendas.itertuples()]
             y_coluna_esquerda_atual = pdf.criar_tabela(MARGEM, y_coluna_esquerda_atual, f"Últimas Vendas: {filial}", header_tabela, dados, col_widths)
     for filial in FILIAIS_ORDEM[2:]:
-        df_filial = df[df['filial_nome'] == filial].sort_values(by='emissao', ascending=False).head(10)
-        if not df_filial.empty:
-            dados = [[row['emissao'].strftime('%d/%m/%y'), row['parceiro'], row['vendedor'], f"R${row['valor_total_pedido']:,.0f}"] for _, row in df_filial.iterrows()]
+        ultimas_vendas = buscar_ultimas_vendas(filial)
+        if not ultimas_vendas.empty:
+            dados = [[row.emissao.strftime('%d/%m/%y'), row.parceiro, row.vendedor, f"R${row.valor_total_pedido:,.0f}"] for row in ultimas_vendas.itertuples()]
             y_coluna_direita_atual = pdf.criar_tabela(A4_LARGURA / 2 + 2, y_coluna_direita_atual, f"Últimas Vendas: {filial}", header_tabela, dados, col_widths)
 
     if grafico_evolucao_geral_ok or grafico_evolucao_filial_ok:
@@ -0,0 +1,188 @@
+import argparse
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+from repositorio_vendas import (MONGO_COLLECTION, MONGO_COLLECTION_RESUMO, MONGO_COLLECTION_REMOVIDOS, CAMPO_CHAVE_LOGICA,
+                                obter_colecao, filtro_pedidos)
+
+# --- CONFIGURAÇÕES ---
+# Índices da coleção de pedidos: nome -> campos. garantir_indices cria os que
+# faltam e nunca apaga nada; um índice com o mesmo nome e campos diferentes é
+# só relatado, para ser corrigido manualmente.
+INDICES_PEDIDOS = {
+    # Período (vendas_anuais, relatórios), opcionalmente por filial
+    'emissao_filial': [('emissao', ASCENDING), ('filial_nome', ASCENDING)],
+    # Vendas de um vendedor num período
+    'vendedor_emissao': [('vendedor', ASCENDING), ('emissao', ASCENDING)],
+    # Últimas vendas de uma filial (ordenadas pela emissão, mais recentes primeiro)
+    'filial_emissao': [('filial_nome', ASCENDING), ('emissao', DESCENDING)],
+    # Migração de filiais (filtra pelo código antigo)
+    'filial_codigo': [('filial_codigo', ASCENDING)],
+    # Chave das duplicatas lógicas (diagnosticoavancdo / remover_duplicata)
+    'chave_logica': [('numero_pv', ASCENDING), ('parceiro', ASCENDING),
+                     ('emissao', ASCENDING), ('valor_total_pedido', ASCENDING)],
+    # Hash da chave lógica gravado pela carga: único, recusa duplicatas na inserção
+    CAMPO_CHAVE_LOGICA: [(CAMPO_CHAVE_LOGICA, ASCENDING)],
+}
+# Índices do resumo diário (resumo_vendas.py); o _id já é a chave dia × filial × vendedor × parceiro
+INDICES_RESUMO = {
+    'dia_filial': [('dia', ASCENDING), ('filial_nome', ASCENDING)],
+}
+# Índices dos registros de pedidos apagados (registrar_remocoes)
+INDICES_REMOVIDOS = {
+    # Remoções desde a última exportação incremental do Power BI (ExportBI --incremental)
+    'removido_em': [('removido_em', ASCENDING)],
+}
+# Opções dos índices que não são simples (por nome). O índice do hash é
+# parcial: pedidos antigos, ainda sem o hash, não entram nele (ver
+# preencher_chave_logica.py).
+OPCOES_INDICES = {
+    CAMPO_CHAVE_LOGICA: {'unique': True, 'partialFilterExpression': {CAMPO_CHAVE_LOGICA: {'$exists': True}}},
+}
+# Opções conferidas nos índices que já existem, com o valor que o MongoDB
+# assume quando a opção não é informada
+PADROES_OPCOES_INDICES = {'unique': False, 'sparse': False, 'partialFilterExpression': None}
+# --------------------
+
+
+def opcoes_indice(opcoes):
+    """As opções de PADROES_OPCOES_INDICES de um índice (do index_information ou de OPCOES_INDICES)."""
+    return {opcao: opcoes.get(opcao, padrao) for opcao, padrao in PADROES_OPCOES_INDICES.items()}
+
+
+def garantir_indices(collection, indices=INDICES_PEDIDOS, silencioso=False):
+    """
+    Cria os índices que ainda não existem e confere os que já existem.
+    Pode ser chamada a cada execução: se tudo já estiver criado, é só uma
+    consulta à lista de índices.
+    Retorna {nome: 'ok' | 'criado' | 'divergente' | 'erro'}; 'erro' é um índice
+    que o MongoDB recusou criar (ex.: índice único com duplicatas na coleção).
+    """
+    existentes = collection.index_information()
+    situacao = {}
+    faltando = []
+    for nome, campos in indices.items():
+        if nome not in existentes:
+            faltando.append(IndexModel(campos, name=nome, **OPCOES_INDICES.get(nome, {})))
+            situacao[nome] = 'criado'
+        elif ([tuple(campo) for campo in existentes[nome]['key']] != [tuple(campo) for campo in campos]
+              or opcoes_indice(existentes[nome]) != opcoes_indice(OPCOES_INDICES.get(nome, {}))):
+            situacao[nome] = 'divergente'
+        else:
+            situacao[nome] = 'ok'
+
+    # Um a um, para que a recusa de um índice não impeça a criação dos demais
+    erros = {}
+    for modelo in faltando:
+        try:
+            collection.create_indexes([modelo])
+        except OperationFailure as e:
+            nome = modelo.document['name']
+            situacao[nome] = 'erro'
+            erros[nome] = e
+
+    for nome, estado in situacao.items():
+        if estado == 'divergente':
+            print(f"  -> AVISO: o índice '{nome}' existe com campos {existentes[nome]['key']} "
+                  f"{opcoes_indice(existentes[nome])}, diferentes de {indices[nome]} "
+                  f"{opcoes_indice(OPCOES_INDICES.get(nome, {}))}. Apague-o para que seja recriado.")
+        elif estado == 'erro':
+            print(f"  -> ERRO: o índice '{nome}' não pôde ser criado: {erros[nome]}")
+        elif estado == 'criado' or not silencioso:
+            print(f"  -> Índice '{nome}': {estado}.")
+    return situacao
+
+
+def situacao_chave_logica(collection):
+    """
+    Quantos pedidos estão protegidos pelo índice único do hash da chave
+    lógica, contando só pelo índice (sem varrer a coleção).
+    Retorna (índice ativo?, total estimado de pedidos, pedidos com o hash).
+    """
+    indice = collection.index_information().get(CAMPO_CHAVE_LOGICA)
+    if not indice or not indice.get('unique'):
+        return False, collection.estimated_document_count(), 0
+    com_chave = collection.count_documents({CAMPO_CHAVE_LOGICA: {'$exists': True}}, hint=CAMPO_CHAVE_LOGICA)
+    return True, collection.estimated_document_count(), com_chave
+
+
+def resumir_plano(plano):
+    """Descreve a árvore do plano vencedor numa linha, ex.: 'LIMIT <- FETCH <- IXSCAN(emissao_filial)'."""
+    etapas = []
+    while plano:
+        descricao = plano.get('stage', '?')
+        if 'indexName' in plano:
+            descricao += f"({plano['indexName']})"
+        etapas.append(descricao)
+        filhos = plano.get('inputStages') or ([plano['inputStage']] if 'inputStage' in plano else [])
+        plano = filhos[0] if filhos else None
+    return ' <- '.join(etapas)
+
+
+def consultas_principais(collection):
+    """
+    Consultas usadas pelos scripts, com valores reais tirados do pedido mais
+    recente da coleção (para que o otimizador escolha o plano de verdade).
+    """
+    exemplo = collection.find_one({}, sort=[('emissao', DESCENDING)]) or {}
+    emissao = exemplo.get('emissao') or datetime.now()
+    inicio_ano, fim_ano = datetime(emissao.year, 1, 1), datetime(emissao.year + 1, 1, 1)
+
+    return {
+        'vendas_anuais: pedidos do ano': (filtro_pedidos(inicio_ano, fim_ano), None, 0),
+        'verifica_periodo: emissão mais antiga': ({'emissao': {'$type': 'date'}}, [('emissao', ASCENDING)], 1),
+        'pedidos do ano de uma filial': (filtro_pedidos(inicio_ano, fim_ano, filiais=exemplo.get('filial_nome', '')), None, 0),
+        'pedidos do ano de um vendedor': (filtro_pedidos(inicio_ano, fim_ano, vendedores=exemplo.get('vendedor', '')), None, 0),
+        'últimas 10 vendas de uma filial': ({'filial_nome': exemplo.get('filial_nome', '')}, [('emissao', DESCENDING)], 10),
+        'pedido pela chave lógica': ({'numero_pv': exemplo.get('numero_pv'), 'parceiro': exemplo.get('parceiro'),
+                                      'emissao': exemplo.get('emissao'),
+                                      'valor_total_pedido': exemplo.get('valor_total_pedido')}, None, 0),
+        'pedido pelo hash da chave lógica': ({CAMPO_CHAVE_LOGICA: exemplo.get(CAMPO_CHAVE_LOGICA)}, None, 0),
+    }
+
+
+def explicar_consultas(collection):
+    """Imprime o plano escolhido pelo MongoDB e o custo de cada consulta principal."""
+    print("\n--- Planos das consultas principais ---")
+    for descricao, (filtro, ordenacao, limite) in consultas_principais(collection).items():
+        cursor = collection.find(filtro)
+        if ordenacao:
+            cursor = cursor.sort(ordenacao)
+        if limite:
+            cursor = cursor.limit(limite)
+        explicacao = cursor.explain()
+
+        plano = explicacao['queryPlanner']['winningPlan']
+        plano = plano.get('queryPlan', plano)  # MongoDB 7+ (SBE) aninha o plano aqui
+        estatisticas = explicacao.get('executionStats', {})
+        resumo = resumir_plano(plano)
+        print(f"\n{descricao}")
+        print(f"  Plano: {resumo}")
+        print(f"  Retornados: {estatisticas.get('nReturned', '?')} | "
+              f"Chaves lidas: {estatisticas.get('totalKeysExamined', '?')} | "
+              f"Documentos lidos: {estatisticas.get('totalDocsExamined', '?')} | "
+              f"Tempo: {estatisticas.get('executionTimeMillis', '?')} ms")
+        if 'COLLSCAN' in resumo:
+            print("  !! COLLSCAN: a consulta está varrendo a coleção inteira.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cria e confere os índices das coleções de vendas.")
+    parser.add_argument('--sem-explain', action='store_true',
+                        help="Só garante os índices, sem mostrar os planos das consultas.")
+    args = parser.parse_args()
+
+    try:
+        collection = obter_colecao()
+    except ConnectionFailure as e:
+        print(f"Não foi possível conectar ao MongoDB: {e}")
+    else:
+        print(f"Conferindo os índices da coleção '{MONGO_COLLECTION}'...")
+        garantir_indices(collection)
+        print(f"Conferindo os índices da coleção '{MONGO_COLLECTION_RESUMO}'...")
+        garantir_indices(obter_colecao(MONGO_COLLECTION_RESUMO), INDICES_RESUMO)
+        print(f"Conferindo os índices da coleção '{MONGO_COLLECTION_REMOVIDOS}'...")
+        garantir_indices(obter_colecao(MONGO_COLLECTION_REMOVIDOS), INDICES_REMOVIDOS)
+        if not args.sem_explain:
+            explicar_consultas(collection)
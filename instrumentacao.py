@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import socket
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+
+class MedidorExecucao:
+    """
+    Acumula, para cada etapa de uma execução, a duração total, o número de
+    chamadas e contadores livres (linhas, bytes, pedidos...). No fim da
+    execução o resumo pode ser gravado em JSON e no formato textfile do
+    Prometheus (node_exporter).
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.inicio = datetime.now()
+        self._inicio_relogio = time.perf_counter()
+        self.etapas = {}
+        self.contadores = {}
+        self._trava = threading.Lock()
+
+    def _registro(self, etapa):
+        return self.etapas.setdefault(etapa, {'duracao_s': 0.0, 'chamadas': 0})
+
+    def registrar(self, etapa, duracao_s, **contadores):
+        """Soma uma medição já feita (ex.: vinda de um processo do pool) à etapa."""
+        registro = self._registro(etapa)
+        registro['duracao_s'] += duracao_s
+        registro['chamadas'] += 1
+        for nome, valor in contadores.items():
+            registro[nome] = registro.get(nome, 0) + valor
+
+    def mesclar(self, etapas):
+        """Soma ao medidor as etapas de outro medidor (ex.: o de um processo do pool)."""
+        for etapa, registro in etapas.items():
+            destino = self._registro(etapa)
+            for nome, valor in registro.items():
+                destino[nome] = destino.get(nome, 0) + valor
+
+    @contextmanager
+    def etapa(self, etapa, **contadores):
+        """
+        Mede o bloco `with` como uma chamada da etapa. O dicionário devolvido
+        pode receber contadores conhecidos só no fim do bloco, ex.:
+
+            with medidor.etapa('transformacao', linhas=len(df)) as medida:
+                pedidos = transformar_em_pedidos(df)
+                medida['pedidos'] = len(pedidos)
+        """
+        medida = dict(contadores)
+        inicio = time.perf_counter()
+        try:
+            yield medida
+        finally:
+            self.registrar(etapa, time.perf_counter() - inicio, **medida)
+
+    def incrementar(self, contador, valor=1):
+        """Soma valor a um contador geral da execução (não ligado a uma etapa). Pode ser chamado de várias threads."""
+        with self._trava:
+            self.contadores[contador] = self.contadores.get(contador, 0) + valor
+
+    def resumo(self):
+        """Retorna o resumo da execução como um dicionário serializável em JSON."""
+        return {
+            'execucao': self.nome,
+            'host': socket.gethostname(),
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'duracao_total_s': round(time.perf_counter() - self._inicio_relogio, 3),
+            'etapas': {etapa: {nome: round(valor, 4) if isinstance(valor, float) else valor
+                               for nome, valor in registro.items()}
+                       for etapa, registro in self.etapas.items()},
+            'contadores': dict(self.contadores),
+        }
+
+    def imprimir_resumo(self):
+        resumo = self.resumo()
+        print(f"\n--- Tempo por etapa ({resumo['duracao_total_s']:.2f}s no total) ---")
+        for etapa, registro in resumo['etapas'].items():
+            extras = ', '.join(f"{nome}={valor}" for nome, valor in registro.items() if nome not in ('duracao_s', 'chamadas'))
+            print(f"  {etapa:<15} {registro['duracao_s']:>9.2f}s  {registro['chamadas']:>5}x  {extras}")
+        if resumo['contadores']:
+            print("  " + ', '.join(f"{nome}={valor}" for nome, valor in resumo['contadores'].items()))
+
+    def gravar_json(self, pasta):
+        """
+        Grava o resumo em <pasta>/ultima_<nome>.json (sobrescrito a cada
+        execução) e acrescenta uma linha em <pasta>/historico_<nome>.jsonl.
+        """
+        os.makedirs(pasta, exist_ok=True)
+        resumo = self.resumo()
+        _gravar_atomico(os.path.join(pasta, f"ultima_{self.nome}.json"), json.dumps(resumo, ensure_ascii=False, indent=2))
+        with open(os.path.join(pasta, f"historico_{self.nome}.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(resumo, ensure_ascii=False) + '\n')
+
+    def gravar_prometheus(self, caminho):
+        """Grava as métricas no formato textfile do Prometheus (coletor textfile do node_exporter)."""
+        resumo = self.resumo()
+        prefixo = f"vendas_{self.nome}"
+        linhas = [
+            f"# HELP {prefixo}_duracao_segundos Duração total da última execução.",
+            f"# TYPE {prefixo}_duracao_segundos gauge",
+            f"{prefixo}_duracao_segundos {resumo['duracao_total_s']}",
+            f"# HELP {prefixo}_ultima_execucao_timestamp_segundos Início da última execução (epoch).",
+            f"# TYPE {prefixo}_ultima_execucao_timestamp_segundos gauge",
+            f"{prefixo}_ultima_execucao_timestamp_segundos {self.inicio.timestamp():.0f}",
+        ]
+
+        # Um gauge por contador das etapas, com a etapa como label
+        nomes_contadores = sorted({nome for registro in resumo['etapas'].values() for nome in registro})
+        for nome in nomes_contadores:
+            metrica = f"{prefixo}_etapa_{'duracao_segundos' if nome == 'duracao_s' else nome}"
+            linhas.append(f"# TYPE {metrica} gauge")
+            for etapa, registro in resumo['etapas'].items():
+                if nome in registro:
+                    linhas.append(f'{metrica}{{etapa="{etapa}"}} {registro[nome]}')
+
+        for nome, valor in resumo['contadores'].items():
+            linhas.append(f"# TYPE {prefixo}_{nome} gauge")
+            linhas.append(f"{prefixo}_{nome} {valor}")
+
+        _gravar_atomico(caminho, '\n'.join(linhas) + '\n')
+
+
+def _gravar_atomico(caminho, conteudo):
+    """Grava em arquivo temporário e renomeia, para que leitores nunca vejam o arquivo pela metade."""
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    caminho_temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(caminho_temporario, 'w', encoding='utf-8') as f:
+        f.write(conteudo)
+    os.replace(caminho_temporario, caminho)
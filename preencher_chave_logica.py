@@ -0,0 +1,79 @@
+import time
+import argparse
+from pymongo import UpdateOne
+from pymongo.errors import ConnectionFailure, BulkWriteError
+
+from repositorio_vendas import MONGO_DATABASE, CAMPO_CHAVE_LOGICA, obter_colecao, calcular_chave_logica
+from gerenciar_indices import garantir_indices, situacao_chave_logica
+
+# --- CONFIGURAÇÕES ---
+# Script de uso único: grava o hash da chave lógica nos pedidos carregados
+# antes de a carga passar a calculá-lo. O índice único é garantido antes,
+# então de cada grupo de duplicatas lógicas só o primeiro pedido recebe o
+# hash; os demais são contados como duplicatas e ficam sem o campo.
+# Por isso, rode antes o remover_duplicata.
+TAMANHO_LOTE_PREENCHIMENTO = 5000
+CAMPOS_CHAVE = {'numero_pv': 1, 'parceiro': 1, 'emissao': 1, 'valor_total_pedido': 1}
+# --------------------
+
+
+def gravar_lote(collection, operacoes):
+    """Grava um lote de $set do hash; retorna (gravados, recusados por duplicata)."""
+    try:
+        return collection.bulk_write(operacoes, ordered=False).modified_count, 0
+    except BulkWriteError as e:
+        erros = e.details.get('writeErrors', [])
+        if any(erro.get('code') != 11000 for erro in erros):
+            raise
+        return e.details.get('nModified', 0), len(erros)
+
+
+def preencher_chave_logica(tamanho_lote=TAMANHO_LOTE_PREENCHIMENTO):
+    try:
+        collection = obter_colecao()
+        print(f"Conectado com sucesso ao banco '{MONGO_DATABASE}'.")
+    except ConnectionFailure as e:
+        print(f"Não foi possível conectar ao MongoDB: {e}")
+        return
+
+    # Com o índice já criado, cada $set é conferido contra os pedidos que já têm o hash
+    garantir_indices(collection, silencioso=True)
+
+    print(f"\nPreenchendo '{CAMPO_CHAVE_LOGICA}' nos pedidos que ainda não o têm...")
+    inicio = time.perf_counter()
+    gravados = 0
+    duplicatas = 0
+    sem_dados = 0
+    operacoes = []
+    for pedido in collection.find({CAMPO_CHAVE_LOGICA: {'$exists': False}}, CAMPOS_CHAVE, batch_size=tamanho_lote):
+        if pedido.get('numero_pv') is None or pedido.get('emissao') is None:
+            sem_dados += 1
+            continue
+        chave = calcular_chave_logica(pedido['numero_pv'], pedido.get('parceiro'), pedido['emissao'],
+                                      pedido.get('valor_total_pedido'))
+        operacoes.append(UpdateOne({'_id': pedido['_id']}, {'$set': {CAMPO_CHAVE_LOGICA: chave}}))
+        if len(operacoes) == tamanho_lote:
+            resultado = gravar_lote(collection, operacoes)
+            gravados, duplicatas = gravados + resultado[0], duplicatas + resultado[1]
+            operacoes = []
+            print(f"  -> {gravados} pedidos preenchidos...")
+    if operacoes:
+        resultado = gravar_lote(collection, operacoes)
+        gravados, duplicatas = gravados + resultado[0], duplicatas + resultado[1]
+
+    indice_ativo, total, com_chave = situacao_chave_logica(collection)
+    print("\n--- RESUMO DO PREENCHIMENTO ---")
+    print(f"Pedidos preenchidos: {gravados} em {time.perf_counter() - inicio:.1f}s")
+    print(f"Sem número do PV ou emissão (ficam sem o hash): {sem_dados}")
+    print(f"Duplicatas lógicas de pedidos já preenchidos (ficam sem o hash): {duplicatas}")
+    print(f"Índice único ativo: {'sim' if indice_ativo else 'NÃO'} | Pedidos protegidos: {com_chave} de ~{total}")
+    if duplicatas:
+        print("Rode o remover_duplicata para limpar as duplicatas e depois este script de novo.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Grava o hash da chave lógica nos pedidos antigos e cria o índice único.")
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_PREENCHIMENTO)
+    args = parser.parse_args()
+
+    preencher_chave_logica(args.lote)
@@ -1,8 +1,24 @@
 import pandas as pd
+import numpy as np
 import os
+import argparse
 import shutil
-from pymongo import MongoClient
+import hashlib
+import time
+import threading
+import asyncio
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from pandas.api.types import union_categoricals
+
+from instrumentacao import MedidorExecucao
+from repositorio_vendas import (MONGO_COLLECTION_REMOVIDOS, CAMPO_CHAVE_LOGICA, obter_colecao, calcular_chave_logica,
+                                registrar_remocoes)
+from gerenciar_indices import garantir_indices, INDICES_RESUMO, INDICES_REMOVIDOS
+from resumo_vendas import PROJECAO_RESUMO, obter_resumo, atualizar_resumo, inicializar_resumo
 
 # --- CONFIGURAÇÕES - AJUSTE ESTA SEÇÃO ---
 
@@ -22,9 +38,8 @@ MAPA_FILIAIS = {
 
 
 # 3. Configurações do MongoDB
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
+#    Servidor, banco e pool de conexões ficam em repositorio_vendas.py,
+#    compartilhados com os demais scripts.
 
 # 4. Nomes das colunas do arquivo exportado
 COL_NUMERO_PV = "Numero PV"
@@ -37,144 +52,1194 @@ COL_QTD = "Quantidade"
 COL_UNITARIO = "Unitário"
 COL_TOTAL_ITEM = "Total"
 COL_COND_PAGTO = "CONDPAGTO"
+
+# 5. Modo streaming (--streaming)
+#    Teto aproximado de memória, em MB, usado para dimensionar os blocos de
+#    linhas lidos de cada arquivo. Cada linha lida vira DataFrame, item e
+#    documento do pedido; FATOR_EXPANSAO_MEMORIA cobre essas cópias.
+LIMITE_MEMORIA_MB = 512
+LINHAS_AMOSTRA_MEMORIA = 2000
+FATOR_EXPANSAO_MEMORIA = 4
+
+# 6. Gravação no MongoDB
+#    Os pedidos são gravados em lotes de upserts não ordenados ($setOnInsert):
+#    o próprio servidor ignora os _id que já existem, sem consulta prévia.
+TAMANHO_LOTE_ESCRITA = 1000
+ESCRITORES = 4
+#    No modo assíncrono (--assincrono), lotes prontos aguardando um escritor.
+#    Com a fila cheia a leitura dos próximos arquivos espera (backpressure),
+#    o que limita a memória quando o MongoDB é mais lento que o parsing.
+TAMANHO_FILA_LOTES = 8
+
+# 7. Manifesto de arquivos já carregados
+#    Cada arquivo é identificado pelo hash SHA-256 do conteúdo + tamanho.
+#    Arquivos com carga concluída são ignorados se voltarem para a entrada;
+#    os que ficaram "em_andamento" (execução interrompida) são reprocessados.
+MONGO_COLLECTION_MANIFESTO = "arquivos_processados"
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+# 8. Modo monitoramento (--monitorar)
+#    A pasta de entrada é vigiada continuamente (inotify via pacote watchdog,
+#    quando instalado, ou varredura periódica). Um arquivo só é carregado
+#    depois de ficar TEMPO_ESTABILIDADE segundos sem mudar de tamanho.
+INTERVALO_MONITORAMENTO = 2
+TEMPO_ESTABILIDADE = 1
+MAX_ARQUIVOS_POR_LOTE = 10
+
+# 9. Staging em Parquet
+#    Cada exportação lida é salva uma única vez como Parquet tipado (com as
+#    colunas da filial), com o nome igual à chave do manifesto + filial. Releituras,
+#    reprocessamentos e análises usam essa cópia em vez do CSV/XLSX original.
+#    Requer o pacote pyarrow; sem ele o staging é simplesmente desativado.
+PASTA_STAGING = 'Staging'
+#    O Parquet exige um tipo por coluna. Uma coluna com tipos misturados (ex.:
+#    códigos de produto ora numéricos, ora alfanuméricos) é gravada em duas:
+#    os textos na própria coluna e os números em "<coluna>__numero". Ao ler o
+#    staging, as duas voltam a ser uma só, com cada valor no tipo original.
+SUFIXO_NUMERICO_STAGING = '__numero'
+
+# 10. Esquema de leitura das exportações
+#    Só as colunas usadas pelo processador são lidas. Os textos que se repetem
+#    em muitas linhas (parceiro, vendedor, descrição, condição de pagamento e
+#    filial) ficam como categóricos, e a Emissão já é convertida na leitura.
+#    O ERP exporta a Emissão como dd/mm/aaaa. Sem o formato explícito o pandas
+#    lê mm/dd/aaaa: troca dia e mês quando o dia é até 12 e descarta o resto.
+#    Os pedidos carregados dos CSVs antes desse formato são corrigidos com o
+#    corrigir_emissao.py (emissão, hash da chave lógica, resumo e exportação).
+FORMATO_EMISSAO = '%d/%m/%Y'
+COLUNAS_EXPORTACAO = [COL_NUMERO_PV, COL_EMISSAO, COL_PARCEIRO, COL_VENDEDOR, COL_PRODUTO,
+                      COL_PRODUTO_DESC, COL_QTD, COL_UNITARIO, COL_TOTAL_ITEM, COL_COND_PAGTO]
+COLUNAS_CATEGORICAS = [COL_PARCEIRO, COL_VENDEDOR, COL_PRODUTO_DESC, COL_COND_PAGTO, 'filial_codigo', 'filial_nome']
+OPCOES_LEITURA = {
+    'usecols': COLUNAS_EXPORTACAO,
+    'dtype': {coluna: 'category' for coluna in (COL_PARCEIRO, COL_VENDEDOR, COL_PRODUTO_DESC, COL_COND_PAGTO)},
+    'parse_dates': [COL_EMISSAO],
+    'date_format': FORMATO_EMISSAO,
+}
+OPCOES_LEITURA_CSV = {'sep': ';', 'decimal': ',', **OPCOES_LEITURA}
+
+# 11. Métricas da execução
+#    Ao fim de cada execução (ou de cada lote, no modo monitoramento) o tempo,
+#    as linhas e os bytes de cada etapa são gravados em JSON nesta pasta.
+#    Com --prometheus-textfile o mesmo resumo vai para o coletor do Prometheus.
+PASTA_METRICAS = 'Metricas'
 # --- FIM DAS CONFIGURAÇÕES ---
 
+# Medidor da execução corrente; recriado por iniciar_medicao() a cada execução.
+medidor = MedidorExecucao('ingestao')
+
+
+def iniciar_medicao():
+    """Começa a medir uma nova execução (descarta as medições anteriores)."""
+    global medidor
+    medidor = MedidorExecucao('ingestao')
+    return medidor
+
+
+def finalizar_medicao(arquivo_prometheus=None):
+    """Imprime o tempo por etapa e grava o resumo em JSON (e, se pedido, no textfile do Prometheus)."""
+    medidor.imprimir_resumo()
+    try:
+        medidor.gravar_json(PASTA_METRICAS)
+        if arquivo_prometheus:
+            medidor.gravar_prometheus(arquivo_prometheus)
+    except OSError as e:
+        print(f"AVISO: não foi possível gravar as métricas da execução: {e}")
+
 
 def conectar_mongodb():
-    """Estabelece a conexão com o MongoDB e retorna a coleção."""
+    """Estabelece a conexão com o MongoDB, garante os índices e retorna a coleção."""
     try:
-        client = MongoClient(MONGO_CONNECTION_STRING)
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
-        client.admin.command('ping')
+        collection = obter_colecao()
         print("Conexão com o MongoDB bem-sucedida!")
-        return collection
     except Exception as e:
         print(f"Erro ao conectar ao MongoDB: {e}")
         return None
 
+    try:
+        garantir_indices(collection, silencioso=True)
+        garantir_indices(obter_resumo(collection), INDICES_RESUMO, silencioso=True)
+        garantir_indices(collection.database[MONGO_COLLECTION_REMOVIDOS], INDICES_REMOVIDOS, silencioso=True)
+    except Exception as e:
+        # Sem os índices a carga funciona; só as consultas dos relatórios ficam lentas.
+        print(f"AVISO: não foi possível conferir os índices da coleção: {e}")
+
+    try:
+        inicializar_resumo(collection)
+    except Exception as e:
+        print(f"Erro ao montar o resumo diário: {e}")
+        return None
+    return collection
+
 def transformar_em_pedidos(df):
-    """Agrupa as linhas de itens em documentos de pedido únicos."""
+    """
+    Agrupa as linhas de itens em documentos de pedido únicos.
+
+    Em vez de percorrer cada grupo com iterrows(), ordena o DataFrame uma única
+    vez pela chave do pedido (número do PV + filial) e recorta os blocos
+    contíguos de itens de cada pedido. O resultado tem o mesmo formato
+    (_id, valor_total_pedido, itens...) do agrupamento anterior.
+    """
     print("Transformando dados de itens para o formato de pedido...")
-    
-    pedidos_formatados = []
 
-    # Agrupa o DataFrame pelo número do pedido e pelas informações da filial
-    for (numero_pv, filial_cod), grupo in df.groupby([COL_NUMERO_PV, 'filial_codigo']):
-        
-        info_pedido = grupo.iloc[0]
-        
-        itens_do_pedido = []
-        for _, item_row in grupo.iterrows():
-            item = {
-                "cod_produto": item_row[COL_PRODUTO],
-                "descricao": item_row[COL_PRODUTO_DESC],
-                "quantidade": item_row[COL_QTD],
-                "unitario": item_row[COL_UNITARIO],
-                "total_item": item_row[COL_TOTAL_ITEM]
-            }
-            itens_do_pedido.append(item)
-            
-        pedido_doc = {
+    if df.empty:
+        print("Transformação concluída. 0 pedidos únicos encontrados.")
+        return []
+
+    # Ordenação estável: mantém a ordem original dos itens dentro de cada pedido,
+    # exatamente como o groupby fazia.
+    df_ordenado = df.sort_values([COL_NUMERO_PV, 'filial_codigo'], kind='mergesort')
+
+    numeros_pv = df_ordenado[COL_NUMERO_PV].to_numpy()
+    filiais = df_ordenado['filial_codigo'].to_numpy()
+
+    # Índice da primeira linha de cada pedido (onde a chave muda)
+    mudou_chave = (numeros_pv[1:] != numeros_pv[:-1]) | (filiais[1:] != filiais[:-1])
+    inicios = np.flatnonzero(np.concatenate(([True], mudou_chave)))
+    fins = np.append(inicios[1:], len(df_ordenado))
+
+    # Soma dos itens por pedido de uma só vez (NaN conta como zero, como no .sum())
+    totais_item = np.nan_to_num(df_ordenado[COL_TOTAL_ITEM].to_numpy(dtype='float64'))
+    valores_totais = np.add.reduceat(totais_item, inicios).tolist()
+
+    # Todos os itens são montados numa única passada pelas colunas
+    itens = [
+        {
+            "cod_produto": cod_produto,
+            "descricao": descricao,
+            "quantidade": quantidade,
+            "unitario": unitario,
+            "total_item": total_item
+        }
+        for cod_produto, descricao, quantidade, unitario, total_item in zip(
+            df_ordenado[COL_PRODUTO].tolist(),
+            df_ordenado[COL_PRODUTO_DESC].tolist(),
+            df_ordenado[COL_QTD].tolist(),
+            df_ordenado[COL_UNITARIO].tolist(),
+            df_ordenado[COL_TOTAL_ITEM].tolist()
+        )
+    ]
+
+    # Informações do pedido vêm da primeira linha de cada bloco
+    cabecalhos = df_ordenado.iloc[inicios]
+    data_carga = datetime.now()
+
+    pedidos_formatados = [
+        {
             "_id": f"{int(numero_pv)}_{filial_cod}", # Chave única com o código da filial
             "numero_pv": int(numero_pv),
             "filial_codigo": filial_cod,
-            "filial_nome": info_pedido['filial_nome'], # Campo com o nome completo
-            "parceiro": info_pedido[COL_PARCEIRO],
-            "emissao": info_pedido[COL_EMISSAO],
-            "vendedor": info_pedido[COL_VENDEDOR],
-            "condicao_pagamento": info_pedido[COL_COND_PAGTO],
-            "valor_total_pedido": grupo[COL_TOTAL_ITEM].sum(),
-            "itens": itens_do_pedido,
-            "data_carga": datetime.now()
+            "filial_nome": filial_nome, # Campo com o nome completo
+            "parceiro": parceiro,
+            "emissao": emissao,
+            "vendedor": vendedor,
+            "condicao_pagamento": condicao_pagamento,
+            "valor_total_pedido": valor_total,
+            CAMPO_CHAVE_LOGICA: calcular_chave_logica(numero_pv, parceiro, emissao, valor_total),
+            "itens": itens[inicio:fim],
+            "data_carga": data_carga
         }
-        
-        pedidos_formatados.append(pedido_doc)
-        
+        for numero_pv, filial_cod, filial_nome, parceiro, emissao, vendedor, condicao_pagamento, valor_total, inicio, fim in zip(
+            cabecalhos[COL_NUMERO_PV].tolist(),
+            cabecalhos['filial_codigo'].tolist(),
+            cabecalhos['filial_nome'].tolist(),
+            cabecalhos[COL_PARCEIRO].tolist(),
+            cabecalhos[COL_EMISSAO].tolist(),
+            cabecalhos[COL_VENDEDOR].tolist(),
+            cabecalhos[COL_COND_PAGTO].tolist(),
+            valores_totais,
+            inicios.tolist(),
+            fins.tolist()
+        )
+    ]
+
     print(f"Transformação concluída. {len(pedidos_formatados)} pedidos únicos encontrados.")
     return pedidos_formatados
 
 
-def processar_arquivos():
-    """Função principal que orquestra todo o processo."""
+def listar_arquivos_entrada():
+    """Lista os arquivos de exportação (.csv/.xlsx) presentes na pasta de entrada."""
+    return [f for f in os.listdir(PASTA_ENTRADA) if f.endswith(('.csv', '.xlsx'))]
+
+
+def identificar_filial(arquivo):
+    """Retorna o código original da filial encontrado no nome do arquivo, ou None."""
+    for codigo_original in MAPA_FILIAIS.keys():
+        if codigo_original in arquivo:
+            return codigo_original
+    return None
+
+
+def marcar_filial(df, codigo_original):
+    """Adiciona ao DataFrame as colunas da filial já convertida pelo MAPA_FILIAIS."""
+    dados_fusao = MAPA_FILIAIS[codigo_original]
+    df['filial_codigo'] = pd.Series(dados_fusao['codigo_novo'], index=df.index, dtype='category')
+    df['filial_nome'] = pd.Series(dados_fusao['nome_novo'], index=df.index, dtype='category')
+    return df
+
+
+def ler_arquivo(caminho_arquivo):
+    """Lê um arquivo de exportação inteiro para um DataFrame, segundo o esquema OPCOES_LEITURA."""
+    if caminho_arquivo.endswith('.csv'):
+        return pd.read_csv(caminho_arquivo, **OPCOES_LEITURA_CSV)
+    return pd.read_excel(caminho_arquivo, **OPCOES_LEITURA)
+
+
+def concatenar_exportacoes(lista_dfs):
+    """
+    Concatena DataFrames de exportação preservando as colunas categóricas.
+
+    O pd.concat converte para texto as colunas categóricas cujas categorias
+    diferem entre os DataFrames; por isso as categorias são unificadas antes.
+    """
+    for coluna in COLUNAS_CATEGORICAS:
+        series = [df[coluna] for df in lista_dfs if coluna in df]
+        if len(series) != len(lista_dfs) or not all(isinstance(s.dtype, pd.CategoricalDtype) for s in series):
+            continue
+        categorias = union_categoricals(series).categories
+        for df in lista_dfs:
+            df[coluna] = df[coluna].cat.set_categories(categorias)
+    return pd.concat(lista_dfs, ignore_index=True)
+
+
+def converter_emissao(serie):
+    """
+    Converte a Emissão para data. Além do FORMATO_EMISSAO, aceita datas ISO
+    (células de data do Excel misturadas com texto chegam assim) e dd/mm/aaaa
+    com hora. O dayfirst não serve para tudo: o dateutil o aplica também às
+    datas ISO e lê 2024-03-05 como 3 de maio.
+    """
+    datas = pd.to_datetime(serie, format=FORMATO_EMISSAO, errors='coerce')
+    for opcoes in ({'format': 'ISO8601'}, {'format': 'mixed', 'dayfirst': True}):
+        restantes = datas.isna() & serie.notna()
+        if not restantes.any():
+            break
+        datas[restantes] = pd.to_datetime(serie[restantes], errors='coerce', **opcoes)
+    return datas
+
+
+def normalizar_tipos(df):
+    """Converte data e valor dos itens e descarta as linhas sem os campos obrigatórios."""
+    df[COL_EMISSAO] = converter_emissao(df[COL_EMISSAO])
+    df[COL_TOTAL_ITEM] = pd.to_numeric(df[COL_TOTAL_ITEM], errors='coerce')
+    df.dropna(subset=[COL_NUMERO_PV, COL_EMISSAO, COL_TOTAL_ITEM], inplace=True)
+    return df
+
+
+def gravar_lote(collection, lote):
+    """
+    Grava um lote de pedidos com upserts não ordenados e soma ao resumo
+    diário apenas os que foram inseridos agora. Retorna quantos eram novos.
+
+    Um pedido com _id novo mas com a chave lógica de um pedido já gravado é
+    recusado pelo índice único (E11000); as recusas são contadas em
+    duplicatas_rejeitadas e o restante do lote é gravado normalmente.
+    """
+    operacoes = [
+        UpdateOne(
+            {'_id': pedido['_id']},
+            {'$setOnInsert': {campo: valor for campo, valor in pedido.items() if campo != '_id'}},
+            upsert=True
+        )
+        for pedido in lote
+    ]
+    try:
+        ids_inseridos = set(collection.bulk_write(operacoes, ordered=False).upserted_ids.values())
+    except BulkWriteError as e:
+        erros = e.details.get('writeErrors', [])
+        if any(erro.get('code') != 11000 for erro in erros):
+            raise
+        ids_inseridos = {inserido['_id'] for inserido in e.details.get('upserted', [])}
+        medidor.incrementar('duplicatas_rejeitadas', len(erros))
+    if ids_inseridos:
+        atualizar_resumo(obter_resumo(collection), [pedido for pedido in lote if pedido['_id'] in ids_inseridos])
+    return len(ids_inseridos)
+
+
+def gravar_pedidos(collection, pedidos, tamanho_lote=TAMANHO_LOTE_ESCRITA, escritores=ESCRITORES):
+    """
+    Grava os pedidos em lotes de tamanho_lote, com até `escritores` lotes em
+    paralelo. Pedidos cujo _id já existe no banco não são alterados.
+    Retorna quantos pedidos novos foram inseridos.
+    """
+    if not pedidos:
+        return 0
+
+    print(f"Gravando {len(pedidos)} pedidos no MongoDB (lotes de {tamanho_lote}, {escritores} escritor(es))...")
+    inicio = time.perf_counter()
+
+    lotes = [pedidos[i:i + tamanho_lote] for i in range(0, len(pedidos), tamanho_lote)]
+    if escritores > 1 and len(lotes) > 1:
+        with ThreadPoolExecutor(max_workers=escritores) as pool:
+            inseridos = sum(pool.map(lambda lote: gravar_lote(collection, lote), lotes))
+    else:
+        inseridos = sum(gravar_lote(collection, lote) for lote in lotes)
+
+    duracao = time.perf_counter() - inicio
+    print(f"{inseridos} novos pedidos inseridos; {len(pedidos) - inseridos} já existiam no banco (mesmo _id ou mesma chave lógica).")
+    print(f"Gravação concluída em {duracao:.2f}s ({len(pedidos) / max(duracao, 1e-9):.0f} documentos/s).")
+    return inseridos
+
+
+def arquivar_arquivo(arquivo):
+    """Move o arquivo processado para a pasta de arquivo, com a data/hora no nome."""
+    caminho_origem = os.path.join(PASTA_ENTRADA, arquivo)
+    if os.path.exists(caminho_origem):
+        shutil.move(caminho_origem, os.path.join(PASTA_ARQUIVO, f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{arquivo}"))
+
+
+def calcular_chave_arquivo(caminho_arquivo):
+    """Retorna a chave do arquivo no manifesto: '<sha256 do conteúdo>_<tamanho em bytes>'."""
+    sha256 = hashlib.sha256()
+    with open(caminho_arquivo, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            sha256.update(bloco)
+    return f"{sha256.hexdigest()}_{os.path.getsize(caminho_arquivo)}"
+
+
+def obter_manifesto(collection):
+    """Retorna a coleção do manifesto, no mesmo banco da coleção de pedidos."""
+    return collection.database[MONGO_COLLECTION_MANIFESTO]
+
+
+def registrar_arquivo(manifesto, chave, arquivo, status, **contagens):
+    """Grava no manifesto o status do arquivo (em_andamento, concluido, erro ou ignorado) e suas contagens."""
+    manifesto.update_one(
+        {'_id': chave},
+        {
+            '$set': {'nome_arquivo': arquivo, 'status': status, 'atualizado_em': datetime.now(), **contagens},
+            '$setOnInsert': {'primeira_tentativa': datetime.now()}
+        },
+        upsert=True
+    )
+
+
+def filtrar_arquivos_novos(manifesto, arquivos):
+    """
+    Consulta o manifesto e separa os arquivos que precisam ser processados.
+
+    Arquivos já concluídos são arquivados sem nova leitura, assim como os
+    já ignorados por não terem filial conhecida que voltam com o mesmo
+    conteúdo e o mesmo nome (renomeado com a filial, o arquivo é lido).
+    Retorna um dicionário {arquivo: chave} com os arquivos restantes, que
+    passam a constar no manifesto como "em_andamento".
+    """
+    chaves = {arquivo: calcular_chave_arquivo(os.path.join(PASTA_ENTRADA, arquivo)) for arquivo in arquivos}
+    registros = {doc['_id']: doc for doc in manifesto.find({'_id': {'$in': list(chaves.values())}})}
+
+    arquivos_novos = {}
+    for arquivo, chave in chaves.items():
+        registro = registros.get(chave)
+        if registro and registro['status'] == 'concluido':
+            print(f"  -> '{arquivo}' já foi carregado em {registro['atualizado_em']:%d/%m/%Y %H:%M} "
+                  f"(como '{registro['nome_arquivo']}'). Arquivo ignorado.")
+            arquivar_arquivo(arquivo)
+            continue
+        if registro and registro['status'] == 'ignorado' and registro['nome_arquivo'] == arquivo:
+            print(f"  -> '{arquivo}' já foi ignorado em {registro['atualizado_em']:%d/%m/%Y %H:%M} "
+                  f"(filial desconhecida). Arquivo arquivado sem nova leitura.")
+            arquivar_arquivo(arquivo)
+            continue
+        if registro and registro['status'] == 'em_andamento':
+            print(f"  -> Retomando '{arquivo}', cuja carga anterior não foi concluída.")
+        registrar_arquivo(manifesto, chave, arquivo, 'em_andamento')
+        arquivos_novos[arquivo] = chave
+    return arquivos_novos
+
+
+def staging_disponivel():
+    """Indica se o pyarrow está instalado para ler e gravar o staging em Parquet."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def caminho_staging(chave, codigo_filial):
+    """
+    Caminho do Parquet de staging de um arquivo: chave do manifesto + código
+    original da filial (o mesmo conteúdo salvo com outra filial no nome gera
+    dados diferentes).
+    """
+    return os.path.join(PASTA_STAGING, f"{chave}_{codigo_filial}.parquet")
+
+
+def separar_colunas_mistas(df):
+    """
+    Grava em duas colunas (texto e número) as colunas object com tipos
+    misturados, sem alterar o df recebido. Retorna o DataFrame a gravar.
+    """
+    df_staging = df.copy()
+    for coluna in df.columns[df.dtypes == object]:
+        if not pd.api.types.infer_dtype(df[coluna], skipna=True).startswith('mixed'):
+            continue
+        eh_numero = df[coluna].map(lambda valor: isinstance(valor, (int, float, np.number)) and not isinstance(valor, bool))
+        numeros = df[coluna].where(eh_numero)
+        inteiros = numeros.dropna().map(lambda valor: isinstance(valor, (int, np.integer))).all()
+        df_staging[coluna] = df[coluna].where(~eh_numero).astype('string')
+        df_staging[coluna + SUFIXO_NUMERICO_STAGING] = pd.to_numeric(numeros).astype('Int64' if inteiros else 'float64')
+    return df_staging
+
+
+def juntar_colunas_mistas(df):
+    """Desfaz o separar_colunas_mistas: cada valor volta ao tipo original, numa coluna object."""
+    for coluna_numerica in [c for c in df.columns if c.endswith(SUFIXO_NUMERICO_STAGING)]:
+        coluna = coluna_numerica[:-len(SUFIXO_NUMERICO_STAGING)]
+        textos = df[coluna].astype(object).where(df[coluna].notna(), np.nan)
+        numeros = df.pop(coluna_numerica).astype(object).where(lambda serie: serie.notna(), np.nan)
+        df[coluna] = textos.where(textos.notna(), numeros).astype(object)
+    return df
+
+
+def gravar_staging(df, chave, codigo_filial):
+    """
+    Salva o DataFrame já preparado (filial marcada, tipos normalizados) no staging.
+    Colunas com tipos misturados são separadas em texto e número (ver
+    SUFIXO_NUMERICO_STAGING).
+    """
+    os.makedirs(PASTA_STAGING, exist_ok=True)
+    df_staging = separar_colunas_mistas(df)
+
+    # Grava em arquivo temporário e renomeia, para nunca deixar um Parquet pela metade.
+    caminho_final = caminho_staging(chave, codigo_filial)
+    caminho_temporario = f"{caminho_final}.{os.getpid()}.tmp"
+    df_staging.to_parquet(caminho_temporario, index=False, compression='zstd')
+    os.replace(caminho_temporario, caminho_final)
+
+
+def ler_staging(caminho, colunas=None, filtros=None):
+    """Lê um Parquet do staging com os tipos de quando foi gravado."""
+    if colunas is not None:
+        import pyarrow.parquet as pq
+        existentes = set(pq.read_schema(caminho).names)
+        colunas = list(colunas) + [c + SUFIXO_NUMERICO_STAGING for c in colunas if c + SUFIXO_NUMERICO_STAGING in existentes]
+    return juntar_colunas_mistas(pd.read_parquet(caminho, columns=colunas, filters=filtros))
+
+
+def carregar_staging(colunas=None, filtros=None):
+    """
+    Carrega todo o staging como um único DataFrame, para reprocessamentos e
+    análises ad hoc. colunas e filtros são repassados ao pd.read_parquet, ex.:
+    carregar_staging([COL_EMISSAO, COL_TOTAL_ITEM], [('filial_codigo', '==', 'JF')]).
+    Os arquivos são lidos um a um, pois o esquema de cada um depende dos tipos
+    que vieram na exportação.
+    """
+    arquivos = sorted(f for f in os.listdir(PASTA_STAGING) if f.endswith('.parquet'))
+    return concatenar_exportacoes([ler_staging(os.path.join(PASTA_STAGING, arquivo), colunas, filtros)
+                                   for arquivo in arquivos])
+
+
+def preparar_arquivo(arquivo, chave=None):
+    """
+    Lê um arquivo da pasta de entrada, marca a filial e normaliza os tipos.
+
+    Se o staging já tem o Parquet desse conteúdo (chave do manifesto), ele é
+    lido no lugar do CSV/XLSX; caso contrário o Parquet é gerado após a leitura.
+
+    Não depende de estado do processo principal, por isso pode rodar nos
+    processos do pool (--workers). Retorna (arquivo, codigo_filial, df, erro,
+    etapas): codigo_filial é None quando o nome do arquivo não tem filial
+    conhecida, erro traz a mensagem quando a leitura falha e etapas traz as
+    medições de leitura/normalização/staging, a serem somadas ao medidor.
+    """
+    medidor_arquivo = MedidorExecucao('arquivo')
+    codigo_filial = identificar_filial(arquivo)
+    if not codigo_filial:
+        return arquivo, None, None, None, medidor_arquivo.etapas
+
+    caminho_arquivo = os.path.join(PASTA_ENTRADA, arquivo)
+    usar_staging = chave is not None and staging_disponivel()
+    try:
+        if usar_staging and os.path.exists(caminho_staging(chave, codigo_filial)):
+            with medidor_arquivo.etapa('leitura_staging', bytes=os.path.getsize(caminho_staging(chave, codigo_filial))) as medida:
+                df = ler_staging(caminho_staging(chave, codigo_filial))
+                medida['linhas'] = len(df)
+            return arquivo, codigo_filial, df, None, medidor_arquivo.etapas
+
+        with medidor_arquivo.etapa('leitura', bytes=os.path.getsize(caminho_arquivo)) as medida:
+            df = ler_arquivo(caminho_arquivo)
+            medida['linhas'] = len(df)
+        with medidor_arquivo.etapa('normalizacao', linhas_entrada=len(df)) as medida:
+            marcar_filial(df, codigo_filial)
+            normalizar_tipos(df)
+            medida['linhas'] = len(df)
+    except Exception as e:
+        return arquivo, codigo_filial, None, str(e), medidor_arquivo.etapas
+
+    if usar_staging:
+        try:
+            with medidor_arquivo.etapa('staging', linhas=len(df)):
+                gravar_staging(df, chave, codigo_filial)
+        except Exception as e:
+            # O staging é só um cache: uma falha aqui não impede a carga.
+            print(f"  -> AVISO: não foi possível gravar o staging de '{arquivo}': {e}")
+    return arquivo, codigo_filial, df, None, medidor_arquivo.etapas
+
+
+def processar_arquivos(workers=1, tamanho_lote=TAMANHO_LOTE_ESCRITA, escritores=ESCRITORES, arquivo_prometheus=None):
+    """
+    Função principal que orquestra todo o processo.
+
+    Com workers > 1 os arquivos são lidos e preparados em paralelo por um pool
+    de processos; a consolidação, a transformação e a gravação continuam no
+    processo principal.
+    """
     print("Iniciando o processador de vendas...")
     
     collection = conectar_mongodb()
     if collection is None:
         return
 
-    arquivos_para_processar = [f for f in os.listdir(PASTA_ENTRADA) if f.endswith(('.csv', '.xlsx'))]
-    
-    if not arquivos_para_processar:
-        print("Nenhum arquivo encontrado para processar.")
+    iniciar_medicao()
+    try:
+        with medidor.etapa('listagem') as medida:
+            arquivos_para_processar = listar_arquivos_entrada()
+            medida['arquivos'] = len(arquivos_para_processar)
+
+        if not arquivos_para_processar:
+            print("Nenhum arquivo encontrado para processar.")
+            return
+
+        processar_lote(collection, arquivos_para_processar, workers, tamanho_lote, escritores)
+    finally:
+        finalizar_medicao(arquivo_prometheus)
+
+
+def processar_lote(collection, arquivos_para_processar, workers=1, tamanho_lote=TAMANHO_LOTE_ESCRITA,
+                   escritores=ESCRITORES):
+    """Lê, transforma, grava e arquiva um conjunto de arquivos da pasta de entrada."""
+    manifesto = obter_manifesto(collection)
+    with medidor.etapa('manifesto', arquivos=len(arquivos_para_processar)) as medida:
+        chaves_arquivos = filtrar_arquivos_novos(manifesto, arquivos_para_processar)
+        medida['arquivos_novos'] = len(chaves_arquivos)
+    if not chaves_arquivos:
+        print("Todos os arquivos da entrada já haviam sido carregados.")
         return
+    arquivos_para_processar = list(chaves_arquivos)
 
     lista_dfs = []
-    for arquivo in arquivos_para_processar:
-        caminho_arquivo = os.path.join(PASTA_ENTRADA, arquivo)
-        try:
+    contagens_arquivos = {}
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as pool:
+        if pool is not None:
+            print(f"Lendo {len(arquivos_para_processar)} arquivos com {workers} processos...")
+            resultados = pool.map(preparar_arquivo, arquivos_para_processar, chaves_arquivos.values())
+        else:
+            resultados = map(preparar_arquivo, arquivos_para_processar, chaves_arquivos.values())
+
+        for arquivo, codigo_filial_encontrado, df_temp, erro, etapas_arquivo in resultados:
             print(f"Processando arquivo: {arquivo}")
-            if arquivo.endswith('.csv'):
-                df_temp = pd.read_csv(caminho_arquivo, sep=';', decimal=',')
-            else:
-                df_temp = pd.read_excel(caminho_arquivo)
+            medidor.mesclar(etapas_arquivo)
 
             # <<< LÓGICA DE EXTRAÇÃO DE FILIAL ATUALIZADA PARA A FUSÃO >>>
-            codigo_filial_encontrado = None
-            for codigo_original in MAPA_FILIAIS.keys():
-                if codigo_original in arquivo:
-                    codigo_filial_encontrado = codigo_original
-                    break
-            
-            if codigo_filial_encontrado:
-                dados_fusao = MAPA_FILIAIS[codigo_filial_encontrado]
-                df_temp['filial_codigo'] = dados_fusao['codigo_novo']
-                df_temp['filial_nome'] = dados_fusao['nome_novo']
-                print(f"  -> Filial original '{codigo_filial_encontrado}' mapeada para '{dados_fusao['nome_novo']}'.")
-                lista_dfs.append(df_temp)
-            else:
+            if not codigo_filial_encontrado:
                 print(f"  -> AVISO: Nenhuma filial conhecida encontrada no nome do arquivo '{arquivo}'. Arquivo ignorado.")
+                registrar_arquivo(manifesto, chaves_arquivos[arquivo], arquivo, 'ignorado')
+                medidor.incrementar('arquivos_ignorados')
+                # Arquivado já aqui: se nenhum arquivo do lote for lido, o arquivamento do fim não é alcançado
+                arquivar_arquivo(arquivo)
+                continue
             # <<< FIM DA ATUALIZAÇÃO >>>
-            
-           
-        except Exception as e:
-            print(f"Erro ao ler o arquivo {arquivo}: {e}")
-            shutil.move(caminho_arquivo, os.path.join(PASTA_ERRO, arquivo))
+
+            if erro is not None:
+                print(f"Erro ao ler o arquivo {arquivo}: {erro}")
+                medidor.incrementar('arquivos_com_erro')
+                registrar_arquivo(manifesto, chaves_arquivos[arquivo], arquivo, 'erro', mensagem_erro=erro)
+                shutil.move(os.path.join(PASTA_ENTRADA, arquivo), os.path.join(PASTA_ERRO, arquivo))
+                continue
+
+            print(f"  -> Filial original '{codigo_filial_encontrado}' mapeada para '{MAPA_FILIAIS[codigo_filial_encontrado]['nome_novo']}'.")
+            lista_dfs.append(df_temp)
+            contagens_arquivos[arquivo] = {'linhas': len(df_temp), 'pedidos': int(df_temp[COL_NUMERO_PV].nunique())}
             
     if not lista_dfs:
         print("Nenhum arquivo foi lido com sucesso.")
         return
         
-    df_consolidado = pd.concat(lista_dfs, ignore_index=True)
+    with medidor.etapa('consolidacao', arquivos=len(lista_dfs)) as medida:
+        df_consolidado = concatenar_exportacoes(lista_dfs)
+        medida['linhas'] = len(df_consolidado)
     print("Colunas encontradas no arquivo:", df_consolidado.columns)
+    
+    with medidor.etapa('transformacao', linhas=len(df_consolidado)) as medida:
+        pedidos_para_processar = transformar_em_pedidos(df_consolidado)
+        medida['pedidos'] = len(pedidos_para_processar)
+    with medidor.etapa('gravacao', documentos=len(pedidos_para_processar)) as medida:
+        medida['novos'] = gravar_pedidos(collection, pedidos_para_processar, tamanho_lote, escritores)
 
-    df_consolidado[COL_EMISSAO] = pd.to_datetime(df_consolidado[COL_EMISSAO], errors='coerce')
-    df_consolidado[COL_TOTAL_ITEM] = pd.to_numeric(df_consolidado[COL_TOTAL_ITEM], errors='coerce')
-    df_consolidado.dropna(subset=[COL_NUMERO_PV, COL_EMISSAO, COL_TOTAL_ITEM], inplace=True)
+    # Só depois da gravação os arquivos contam como concluídos no manifesto;
+    # se a execução cair antes disso, eles serão retomados na próxima.
+    for arquivo, contagens in contagens_arquivos.items():
+        registrar_arquivo(manifesto, chaves_arquivos[arquivo], arquivo, 'concluido', **contagens)
+    medidor.incrementar('arquivos_carregados', len(contagens_arquivos))
     
-    pedidos_para_processar = transformar_em_pedidos(df_consolidado)
+    with medidor.etapa('arquivamento', arquivos=len(arquivos_para_processar)):
+        for arquivo in arquivos_para_processar:
+            arquivar_arquivo(arquivo)
 
-    if pedidos_para_processar:
-        chaves_do_lote = [p['_id'] for p in pedidos_para_processar]
-        documentos_existentes = collection.find({'_id': {'$in': chaves_do_lote}}, {'_id': 1})
-        chaves_existentes = {doc['_id'] for doc in documentos_existentes}
-        print(f"Encontradas {len(chaves_existentes)} chaves de pedidos já existentes no banco.")
+    print("Processo concluído!")
 
-        pedidos_para_inserir = [p for p in pedidos_para_processar if p['_id'] not in chaves_existentes]
 
-        if pedidos_para_inserir:
-            print(f"Inserindo {len(pedidos_para_inserir)} novos pedidos no MongoDB...")
-            collection.insert_many(pedidos_para_inserir)
-            print("Novos pedidos inseridos com sucesso.")
-        else:
-            print("Nenhum pedido novo para inserir.")
-    
-    for arquivo in arquivos_para_processar:
-        caminho_origem = os.path.join(PASTA_ENTRADA, arquivo)
-        if os.path.exists(caminho_origem):
-             shutil.move(caminho_origem, os.path.join(PASTA_ARQUIVO, f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{arquivo}"))
+def estimar_linhas_por_bloco(caminho_arquivo, limite_memoria_mb):
+    """
+    Estima quantas linhas cabem em um bloco sem ultrapassar o limite de memória,
+    a partir do tamanho médio das linhas de uma pequena amostra do arquivo.
+    """
+    if caminho_arquivo.endswith('.csv'):
+        amostra = pd.read_csv(caminho_arquivo, nrows=LINHAS_AMOSTRA_MEMORIA, **OPCOES_LEITURA_CSV)
+    else:
+        amostra = pd.read_excel(caminho_arquivo, nrows=LINHAS_AMOSTRA_MEMORIA, **OPCOES_LEITURA)
+
+    if amostra.empty:
+        return LINHAS_AMOSTRA_MEMORIA
+
+    bytes_por_linha = amostra.memory_usage(deep=True).sum() / len(amostra)
+    linhas = int(limite_memoria_mb * 1024 * 1024 / (bytes_por_linha * FATOR_EXPANSAO_MEMORIA))
+    return max(LINHAS_AMOSTRA_MEMORIA, linhas)
+
+
+def ler_em_blocos(caminho_arquivo, linhas_por_bloco):
+    """Lê o arquivo de exportação em blocos de DataFrame, sem carregá-lo inteiro."""
+    if caminho_arquivo.endswith('.csv'):
+        yield from pd.read_csv(caminho_arquivo, chunksize=linhas_por_bloco, **OPCOES_LEITURA_CSV)
+        return
+
+    # pd.read_excel não lê em blocos; o openpyxl em modo read_only percorre as linhas sob demanda.
+    from openpyxl import load_workbook
+    planilha = load_workbook(caminho_arquivo, read_only=True, data_only=True)
+    try:
+        linhas = planilha.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        faltando = set(COLUNAS_EXPORTACAO) - set(cabecalho)
+        if faltando:
+            raise ValueError(f"Colunas ausentes na planilha: {sorted(faltando)}")
+        bloco = []
+        for linha in linhas:
+            bloco.append(linha)
+            if len(bloco) >= linhas_por_bloco:
+                yield pd.DataFrame(bloco, columns=cabecalho)[COLUNAS_EXPORTACAO]
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=cabecalho)[COLUNAS_EXPORTACAO]
+    finally:
+        planilha.close()
+
+
+def processar_arquivo_streaming(collection, arquivo, codigo_filial, limite_memoria_mb,
+                                tamanho_lote=TAMANHO_LOTE_ESCRITA, escritores=ESCRITORES):
+    """
+    Lê um arquivo em blocos e grava no MongoDB os pedidos já completos de cada bloco.
+
+    As linhas do último pedido de cada bloco ficam retidas e são juntadas ao
+    bloco seguinte, pois os itens desse pedido podem continuar depois da
+    fronteira do bloco. Assim nenhum pedido é dividido em dois documentos,
+    desde que (como nas exportações do ERP) os itens de um pedido venham em
+    linhas consecutivas.
+
+    Se não vierem, a primeira parte do pedido já foi gravada quando o resto
+    aparece e o $setOnInsert não a completa. Nesse caso os pedidos divididos
+    inseridos por esta carga são apagados e o arquivo falha com ValueError
+    (fica como "erro" no manifesto), para ser carregado de novo sem --streaming.
+    """
+    caminho_arquivo = os.path.join(PASTA_ENTRADA, arquivo)
+    linhas_por_bloco = estimar_linhas_por_bloco(caminho_arquivo, limite_memoria_mb)
+    print(f"  -> Lendo em blocos de até {linhas_por_bloco} linhas (limite de {limite_memoria_mb} MB).")
+
+    pedidos_retidos = None
+    chaves_gravadas = set()
+    pedidos_divididos = set()
+    cargas = set()
+    total_linhas = 0
+    total_inseridos = 0
+
+    def gravar(df_completo):
+        nonlocal total_inseridos
+        if df_completo.empty:
+            return
+        with medidor.etapa('transformacao', linhas=len(df_completo)) as medida:
+            pedidos = transformar_em_pedidos(df_completo)
+            medida['pedidos'] = len(pedidos)
+        chaves = {p['_id'] for p in pedidos}
+        pedidos_divididos.update(chaves & chaves_gravadas)
+        chaves_gravadas.update(chaves)
+        cargas.update(p['data_carga'] for p in pedidos[:1])
+        with medidor.etapa('gravacao', documentos=len(pedidos)) as medida:
+            medida['novos'] = gravar_pedidos(collection, pedidos, tamanho_lote, escritores)
+        total_inseridos += medida['novos']
+
+    # A leitura é medida bloco a bloco: cada next() do gerador lê um bloco do
+    # arquivo. O tamanho do arquivo entra só na primeira medição.
+    bytes_arquivo = os.path.getsize(caminho_arquivo)
+    blocos = ler_em_blocos(caminho_arquivo, linhas_por_bloco)
+    while True:
+        with medidor.etapa('leitura', bytes=bytes_arquivo) as medida:
+            bloco = next(blocos, None)
+            medida['linhas'] = 0 if bloco is None else len(bloco)
+        bytes_arquivo = 0
+        if bloco is None:
+            break
+        total_linhas += len(bloco)
+        with medidor.etapa('normalizacao', linhas_entrada=len(bloco)) as medida:
+            marcar_filial(bloco, codigo_filial)
+            normalizar_tipos(bloco)
+            medida['linhas'] = len(bloco)
+
+        if pedidos_retidos is not None:
+            bloco = concatenar_exportacoes([pedidos_retidos, bloco])
+        if bloco.empty:
+            continue
+
+        # A filial é a mesma no arquivo inteiro, então o número do PV identifica o pedido.
+        ultimo_pv = bloco[COL_NUMERO_PV].iloc[-1]
+        do_ultimo_pedido = bloco[COL_NUMERO_PV] == ultimo_pv
+        pedidos_retidos = bloco[do_ultimo_pedido]
+        gravar(bloco[~do_ultimo_pedido])
+
+    if pedidos_retidos is not None:
+        gravar(pedidos_retidos)
+
+    if pedidos_divididos:
+        apagados = descartar_pedidos_divididos(collection, pedidos_divididos, cargas)
+        raise ValueError(f"{len(pedidos_divididos)} pedido(s) com itens em linhas não consecutivas "
+                         f"(ex.: {sorted(pedidos_divididos)[:5]}). Os {apagados} gravados só em parte por esta carga "
+                         f"foram apagados; mova o arquivo de '{PASTA_ERRO}' para '{PASTA_ENTRADA}' e carregue-o sem --streaming.")
+
+    print(f"  -> {total_linhas} linhas lidas, {total_inseridos} novos pedidos inseridos.")
+    return {'linhas': total_linhas, 'pedidos': len(chaves_gravadas), 'pedidos_novos': total_inseridos}
+
+
+def descartar_pedidos_divididos(collection, ids, cargas):
+    """
+    Apaga os pedidos de ids inseridos pelas cargas (data_carga) do arquivo
+    atual, descontando-os do resumo diário e registrando as remoções.
+    Pedidos que já existiam antes não são tocados. Retorna quantos apagou.
+    """
+    filtro = {'_id': {'$in': list(ids)}, 'data_carga': {'$in': list(cargas)}}
+    pedidos = list(collection.find(filtro, PROJECAO_RESUMO))
+    if not pedidos:
+        return 0
+    collection.delete_many({'_id': {'$in': [pedido['_id'] for pedido in pedidos]}})
+    atualizar_resumo(obter_resumo(collection), pedidos, sinal=-1)
+    registrar_remocoes(collection, [pedido['_id'] for pedido in pedidos], 'processador_vendas --streaming')
+    return len(pedidos)
+
+
+def processar_arquivos_streaming(limite_memoria_mb=LIMITE_MEMORIA_MB, tamanho_lote=TAMANHO_LOTE_ESCRITA,
+                                 escritores=ESCRITORES, arquivo_prometheus=None):
+    """
+    Variante de processar_arquivos para backlogs grandes: cada arquivo é lido
+    em blocos e os pedidos são gravados à medida que ficam completos, sem
+    consolidar todos os arquivos em memória.
+    """
+    print(f"Iniciando o processador de vendas em modo streaming (limite de {limite_memoria_mb} MB)...")
+
+    collection = conectar_mongodb()
+    if collection is None:
+        return
+
+    iniciar_medicao()
+    try:
+        carregar_arquivos_streaming(collection, limite_memoria_mb, tamanho_lote, escritores)
+    finally:
+        finalizar_medicao(arquivo_prometheus)
+
+
+def carregar_arquivos_streaming(collection, limite_memoria_mb, tamanho_lote, escritores):
+    """Carrega, arquivo a arquivo e em blocos, tudo o que estiver na pasta de entrada."""
+    with medidor.etapa('listagem') as medida:
+        arquivos_para_processar = listar_arquivos_entrada()
+        medida['arquivos'] = len(arquivos_para_processar)
+
+    if not arquivos_para_processar:
+        print("Nenhum arquivo encontrado para processar.")
+        return
+
+    manifesto = obter_manifesto(collection)
+    with medidor.etapa('manifesto', arquivos=len(arquivos_para_processar)) as medida:
+        chaves_arquivos = filtrar_arquivos_novos(manifesto, arquivos_para_processar)
+        medida['arquivos_novos'] = len(chaves_arquivos)
+    if not chaves_arquivos:
+        print("Todos os arquivos da entrada já haviam sido carregados.")
+        return
+
+    for arquivo, chave in chaves_arquivos.items():
+        caminho_arquivo = os.path.join(PASTA_ENTRADA, arquivo)
+        print(f"Processando arquivo: {arquivo}")
+
+        codigo_filial_encontrado = identificar_filial(arquivo)
+        if not codigo_filial_encontrado:
+            print(f"  -> AVISO: Nenhuma filial conhecida encontrada no nome do arquivo '{arquivo}'. Arquivo ignorado.")
+            registrar_arquivo(manifesto, chave, arquivo, 'ignorado')
+            medidor.incrementar('arquivos_ignorados')
+            arquivar_arquivo(arquivo)
+            continue
+
+        print(f"  -> Filial original '{codigo_filial_encontrado}' mapeada para '{MAPA_FILIAIS[codigo_filial_encontrado]['nome_novo']}'.")
+        try:
+            contagens = processar_arquivo_streaming(collection, arquivo, codigo_filial_encontrado, limite_memoria_mb,
+                                                    tamanho_lote, escritores)
+        except Exception as e:
+            print(f"Erro ao processar o arquivo {arquivo}: {e}")
+            registrar_arquivo(manifesto, chave, arquivo, 'erro', mensagem_erro=str(e))
+            medidor.incrementar('arquivos_com_erro')
+            shutil.move(caminho_arquivo, os.path.join(PASTA_ERRO, arquivo))
+            continue
+
+        registrar_arquivo(manifesto, chave, arquivo, 'concluido', **contagens)
+        medidor.incrementar('arquivos_carregados')
+        with medidor.etapa('arquivamento', arquivos=1):
+            arquivar_arquivo(arquivo)
 
     print("Processo concluído!")
 
+
+def processar_arquivos_assincrono(workers=1, tamanho_lote=TAMANHO_LOTE_ESCRITA, escritores=ESCRITORES,
+                                  arquivo_prometheus=None):
+    """
+    Variante de processar_arquivos que sobrepõe a leitura e a gravação: cada
+    arquivo é lido e transformado enquanto os lotes dos anteriores ainda
+    estão sendo gravados no MongoDB.
+    """
+    print("Iniciando o processador de vendas em modo assíncrono...")
+
+    collection = conectar_mongodb()
+    if collection is None:
+        return
+
+    iniciar_medicao()
+    try:
+        with medidor.etapa('listagem') as medida:
+            arquivos_para_processar = listar_arquivos_entrada()
+            medida['arquivos'] = len(arquivos_para_processar)
+
+        if not arquivos_para_processar:
+            print("Nenhum arquivo encontrado para processar.")
+            return
+
+        asyncio.run(carregar_assincrono(collection, arquivos_para_processar, workers, tamanho_lote, escritores))
+    finally:
+        finalizar_medicao(arquivo_prometheus)
+
+
+async def carregar_assincrono(collection, arquivos_para_processar, workers, tamanho_lote, escritores):
+    """
+    Pipeline produtor/consumidor da carga assíncrona.
+
+    Os produtores (um por worker) leem e transformam um arquivo por vez e
+    colocam seus pedidos, em lotes de tamanho_lote, numa fila limitada a
+    TAMANHO_FILA_LOTES; os escritores retiram os lotes e gravam cada um numa
+    thread com gravar_lote. Quando a fila enche, os produtores esperam.
+
+    Cada arquivo é transformado separadamente, como no modo streaming: um
+    mesmo pedido em dois arquivos da mesma filial não é unificado.
+    """
+    manifesto = obter_manifesto(collection)
+    with medidor.etapa('manifesto', arquivos=len(arquivos_para_processar)) as medida:
+        chaves_arquivos = filtrar_arquivos_novos(manifesto, arquivos_para_processar)
+        medida['arquivos_novos'] = len(chaves_arquivos)
+    if not chaves_arquivos:
+        print("Todos os arquivos da entrada já haviam sido carregados.")
+        return
+
+    loop = asyncio.get_running_loop()
+    fila_arquivos = asyncio.Queue()
+    for arquivo_e_chave in chaves_arquivos.items():
+        fila_arquivos.put_nowait(arquivo_e_chave)
+    fila_lotes = asyncio.Queue(maxsize=TAMANHO_FILA_LOTES)
+
+    contagens_arquivos = {}
+    lotes_pendentes = {}
+    arquivos_com_falha = set()
+    inicio = time.perf_counter()
+
+    def concluir_arquivo(arquivo):
+        # Só depois do último lote gravado o arquivo conta como concluído no
+        # manifesto; se a execução cair antes, ele é retomado na próxima.
+        registrar_arquivo(manifesto, chaves_arquivos[arquivo], arquivo, 'concluido', **contagens_arquivos[arquivo])
+        medidor.incrementar('arquivos_carregados')
+        with medidor.etapa('arquivamento', arquivos=1):
+            arquivar_arquivo(arquivo)
+        print(f"  -> '{arquivo}' carregado: {contagens_arquivos[arquivo]['pedidos']} pedidos, "
+              f"{contagens_arquivos[arquivo]['pedidos_novos']} novos.")
+
+    async def produtor(executor):
+        while not fila_arquivos.empty():
+            arquivo, chave = fila_arquivos.get_nowait()
+            arquivo, codigo_filial_encontrado, df, erro, etapas_arquivo = await loop.run_in_executor(
+                executor, preparar_arquivo, arquivo, chave)
+            print(f"Processando arquivo: {arquivo}")
+            medidor.mesclar(etapas_arquivo)
+
+            if not codigo_filial_encontrado:
+                print(f"  -> AVISO: Nenhuma filial conhecida encontrada no nome do arquivo '{arquivo}'. Arquivo ignorado.")
+                registrar_arquivo(manifesto, chave, arquivo, 'ignorado')
+                medidor.incrementar('arquivos_ignorados')
+                arquivar_arquivo(arquivo)
+                continue
+
+            if erro is not None:
+                print(f"Erro ao ler o arquivo {arquivo}: {erro}")
+                medidor.incrementar('arquivos_com_erro')
+                registrar_arquivo(manifesto, chave, arquivo, 'erro', mensagem_erro=erro)
+                shutil.move(os.path.join(PASTA_ENTRADA, arquivo), os.path.join(PASTA_ERRO, arquivo))
+                continue
+
+            with medidor.etapa('transformacao', linhas=len(df)) as medida:
+                pedidos = await asyncio.to_thread(transformar_em_pedidos, df)
+                medida['pedidos'] = len(pedidos)
+            contagens_arquivos[arquivo] = {'linhas': len(df), 'pedidos': len(pedidos), 'pedidos_novos': 0}
+            del df
+
+            lotes = [pedidos[i:i + tamanho_lote] for i in range(0, len(pedidos), tamanho_lote)]
+            if not lotes:
+                concluir_arquivo(arquivo)
+                continue
+            lotes_pendentes[arquivo] = len(lotes)
+            for lote in lotes:
+                with medidor.etapa('espera_produtor'):
+                    await fila_lotes.put((arquivo, lote))
+
+    async def escritor():
+        while True:
+            with medidor.etapa('espera_escritor'):
+                item = await fila_lotes.get()
+            if item is None:
+                return
+            arquivo, lote = item
+            try:
+                with medidor.etapa('gravacao', documentos=len(lote)) as medida:
+                    medida['novos'] = await asyncio.to_thread(gravar_lote, collection, lote)
+            except Exception as e:
+                # Ex.: MongoDB fora do ar. O arquivo fica na entrada e é retomado na próxima execução.
+                if arquivo not in arquivos_com_falha:
+                    print(f"Erro ao gravar os pedidos do arquivo {arquivo}: {e}")
+                arquivos_com_falha.add(arquivo)
+            else:
+                contagens_arquivos[arquivo]['pedidos_novos'] += medida['novos']
+
+            lotes_pendentes[arquivo] -= 1
+            if lotes_pendentes[arquivo] == 0 and arquivo not in arquivos_com_falha:
+                concluir_arquivo(arquivo)
+
+    produtores = max(1, workers)
+    print(f"Lendo com {produtores} produtor(es) e gravando com {escritores} escritor(es) "
+          f"(fila de até {TAMANHO_FILA_LOTES} lotes de {tamanho_lote} pedidos)...")
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else ThreadPoolExecutor(max_workers=1) as executor:
+        tarefas_escritores = [asyncio.create_task(escritor()) for _ in range(escritores)]
+        await asyncio.gather(*(produtor(executor) for _ in range(produtores)))
+        for _ in tarefas_escritores:
+            await fila_lotes.put(None)
+        await asyncio.gather(*tarefas_escritores)
+
+    duracao = time.perf_counter() - inicio
+    total_pedidos = sum(contagens['pedidos'] for contagens in contagens_arquivos.values())
+    total_novos = sum(contagens['pedidos_novos'] for contagens in contagens_arquivos.values())
+    print(f"{total_novos} novos pedidos inseridos; {total_pedidos - total_novos} já existiam no banco (mesmo _id ou mesma chave lógica).")
+    print(f"Carga concluída em {duracao:.2f}s ({total_pedidos / duracao if duracao else 0:,.0f} pedidos/s).")
+    if arquivos_com_falha:
+        print(f"AVISO: {len(arquivos_com_falha)} arquivo(s) não foram gravados por completo e continuam na "
+              f"entrada para a próxima execução: {', '.join(sorted(arquivos_com_falha))}")
+    print("Processo concluído!")
+
+
+def reprocessar_staging(tamanho_lote=TAMANHO_LOTE_ESCRITA, escritores=ESCRITORES, arquivo_prometheus=None):
+    """
+    Recarrega no MongoDB todos os arquivos do staging, sem reler os CSV/XLSX
+    originais (ex.: para repovoar uma coleção restaurada de backup).
+    Pedidos que já existem no banco não são alterados.
+    """
+    print("Reprocessando os arquivos do staging...")
+
+    if not staging_disponivel():
+        print("O pacote pyarrow não está instalado; não é possível ler o staging.")
+        return
+    if not os.path.isdir(PASTA_STAGING):
+        print(f"A pasta de staging '{PASTA_STAGING}' não existe.")
+        return
+
+    collection = conectar_mongodb()
+    if collection is None:
+        return
+
+    arquivos_staging = sorted(f for f in os.listdir(PASTA_STAGING) if f.endswith('.parquet'))
+    if not arquivos_staging:
+        print("Nenhum arquivo encontrado no staging.")
+        return
+
+    iniciar_medicao()
+    total_inseridos = 0
+    for arquivo in arquivos_staging:
+        print(f"Processando staging: {arquivo}")
+        caminho_arquivo = os.path.join(PASTA_STAGING, arquivo)
+        with medidor.etapa('leitura_staging', bytes=os.path.getsize(caminho_arquivo)) as medida:
+            df = ler_staging(caminho_arquivo)
+            medida['linhas'] = len(df)
+        with medidor.etapa('transformacao', linhas=len(df)) as medida:
+            pedidos = transformar_em_pedidos(df)
+            medida['pedidos'] = len(pedidos)
+        with medidor.etapa('gravacao', documentos=len(pedidos)) as medida:
+            medida['novos'] = gravar_pedidos(collection, pedidos, tamanho_lote, escritores)
+        total_inseridos += medida['novos']
+    finalizar_medicao(arquivo_prometheus)
+
+    print(f"Reprocessamento concluído! {total_inseridos} pedidos novos inseridos a partir de {len(arquivos_staging)} arquivo(s).")
+
+
+def arquivo_liberado(caminho_arquivo):
+    """Indica se o arquivo pode ser aberto, isto é, se outro programa já terminou de gravá-lo."""
+    try:
+        with open(caminho_arquivo, 'rb'):
+            return True
+    except OSError:
+        return False
+
+
+def arquivos_prontos(estado_arquivos, agora):
+    """
+    Retorna os arquivos da entrada que estão estáveis há TEMPO_ESTABILIDADE segundos.
+
+    estado_arquivos guarda, para cada arquivo ainda na entrada, a última
+    assinatura (tamanho, mtime) e desde quando ela não muda. Arquivos que
+    saíram da pasta são removidos do estado, que nunca cresce além do
+    conteúdo atual da entrada.
+    """
+    arquivos_atuais = set(listar_arquivos_entrada())
+    for arquivo in list(estado_arquivos):
+        if arquivo not in arquivos_atuais:
+            del estado_arquivos[arquivo]
+
+    prontos = []
+    for arquivo in sorted(arquivos_atuais):
+        caminho_arquivo = os.path.join(PASTA_ENTRADA, arquivo)
+        try:
+            info = os.stat(caminho_arquivo)
+        except FileNotFoundError:
+            continue
+
+        assinatura = (info.st_size, info.st_mtime_ns)
+        anterior = estado_arquivos.get(arquivo)
+        if anterior is None or anterior[0] != assinatura:
+            estado_arquivos[arquivo] = (assinatura, agora)
+            continue
+
+        if info.st_size > 0 and agora - anterior[1] >= TEMPO_ESTABILIDADE and arquivo_liberado(caminho_arquivo):
+            prontos.append(arquivo)
+    return prontos
+
+
+def criar_observador(sinal_mudanca):
+    """
+    Liga o observador do watchdog (inotify no Linux) à pasta de entrada.
+    Retorna None quando o pacote não está instalado; nesse caso o
+    monitoramento cai para a varredura periódica da pasta.
+    """
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class AvisarMudanca(FileSystemEventHandler):
+        def on_any_event(self, event):
+            sinal_mudanca.set()
+
+    observador = Observer()
+    observador.schedule(AvisarMudanca(), PASTA_ENTRADA, recursive=False)
+    observador.start()
+    return observador
+
+
+def monitorar_pasta(workers=1, tamanho_lote=TAMANHO_LOTE_ESCRITA, escritores=ESCRITORES,
+                    intervalo=INTERVALO_MONITORAMENTO, arquivo_prometheus=None):
+    """
+    Modo serviço: vigia a pasta de entrada e carrega os arquivos novos em
+    pequenos lotes assim que terminam de ser gravados, usando a mesma
+    conexão com o MongoDB durante toda a execução. As métricas são gravadas
+    ao fim de cada lote.
+    """
+    print("Iniciando o processador de vendas em modo monitoramento...")
+
+    collection = conectar_mongodb()
+    if collection is None:
+        return
+
+    sinal_mudanca = threading.Event()
+    observador = criar_observador(sinal_mudanca)
+    if observador is not None:
+        print(f"Vigiando '{PASTA_ENTRADA}' por eventos do sistema de arquivos. Ctrl+C para encerrar.")
+    else:
+        print(f"Pacote watchdog não instalado; varrendo '{PASTA_ENTRADA}' a cada {intervalo}s. Ctrl+C para encerrar.")
+
+    estado_arquivos = {}
+    try:
+        while True:
+            prontos = arquivos_prontos(estado_arquivos, time.monotonic())
+            for inicio in range(0, len(prontos), MAX_ARQUIVOS_POR_LOTE):
+                lote = prontos[inicio:inicio + MAX_ARQUIVOS_POR_LOTE]
+                print(f"\n[{datetime.now():%d/%m/%Y %H:%M:%S}] {len(lote)} arquivo(s) pronto(s) para carga.")
+                iniciar_medicao()
+                try:
+                    processar_lote(collection, lote, workers, tamanho_lote, escritores)
+                except Exception as e:
+                    # Ex.: MongoDB fora do ar. Os arquivos continuam na entrada e são tentados de novo.
+                    print(f"Erro ao carregar o lote: {e}. Nova tentativa em {intervalo}s.")
+                    medidor.incrementar('lotes_com_erro')
+                    break
+                finally:
+                    finalizar_medicao(arquivo_prometheus)
+
+            # Há arquivos aguardando estabilizar: verifica de novo logo após o tempo de estabilidade.
+            espera = TEMPO_ESTABILIDADE if len(estado_arquivos) > len(prontos) else intervalo
+            if observador is not None and not estado_arquivos:
+                espera = None  # nada pendente: dorme até o próximo evento
+            sinal_mudanca.wait(espera)
+            sinal_mudanca.clear()
+    except KeyboardInterrupt:
+        print("\nMonitoramento encerrado.")
+    finally:
+        if observador is not None:
+            observador.stop()
+            observador.join()
+
+
 if __name__ == "__main__":
-    processar_arquivos()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carrega as exportações de vendas da pasta de entrada no MongoDB.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Lê os arquivos em blocos e grava os pedidos aos poucos (para backlogs grandes).")
+    parser.add_argument('--limite-memoria-mb', type=int, default=LIMITE_MEMORIA_MB,
+                        help=f"Teto aproximado de memória por bloco no modo streaming (padrão: {LIMITE_MEMORIA_MB}).")
+    parser.add_argument('--monitorar', action='store_true',
+                        help="Fica em execução vigiando a pasta de entrada e carrega os arquivos assim que chegam.")
+    parser.add_argument('--assincrono', action='store_true',
+                        help="Lê os próximos arquivos enquanto os pedidos dos anteriores são gravados no MongoDB.")
+    parser.add_argument('--reprocessar-staging', action='store_true',
+                        help="Recarrega no MongoDB os arquivos Parquet da pasta de staging, sem usar a entrada.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Número de processos para ler e preparar os arquivos em paralelo (padrão: 1).")
+    parser.add_argument('--lote-escrita', type=int, default=TAMANHO_LOTE_ESCRITA,
+                        help=f"Pedidos por lote de gravação no MongoDB (padrão: {TAMANHO_LOTE_ESCRITA}).")
+    parser.add_argument('--escritores', type=int, default=ESCRITORES,
+                        help=f"Lotes gravados em paralelo no MongoDB (padrão: {ESCRITORES}).")
+    parser.add_argument('--prometheus-textfile', metavar='CAMINHO',
+                        help="Grava também as métricas da execução neste arquivo .prom (coletor textfile do node_exporter).")
+    args = parser.parse_args()
+
+    if args.streaming and args.workers > 1:
+        parser.error("--workers não pode ser combinado com --streaming.")
+    if args.streaming and args.monitorar:
+        parser.error("--monitorar não pode ser combinado com --streaming.")
+    if args.assincrono and (args.streaming or args.monitorar):
+        parser.error("--assincrono não pode ser combinado com --streaming nem com --monitorar.")
+
+    if args.reprocessar_staging:
+        reprocessar_staging(args.lote_escrita, args.escritores, args.prometheus_textfile)
+    elif args.monitorar:
+        monitorar_pasta(args.workers, args.lote_escrita, args.escritores, arquivo_prometheus=args.prometheus_textfile)
+    elif args.assincrono:
+        processar_arquivos_assincrono(args.workers, args.lote_escrita, args.escritores, args.prometheus_textfile)
+    elif args.streaming:
+        processar_arquivos_streaming(args.limite_memoria_mb, args.lote_escrita, args.escritores, args.prometheus_textfile)
+    else:
+        processar_arquivos(args.workers, args.lote_escrita, args.escritores, args.prometheus_textfile)
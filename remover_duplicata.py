@@ -1,17 +1,20 @@
-from pymongo import MongoClient
+import time
+import argparse
+from pymongo import UpdateOne
 from pymongo.errors import ConnectionFailure
 
+from repositorio_vendas import (MONGO_DATABASE, CAMPO_CHAVE_LOGICA, obter_colecao, registrar_remocoes,
+                                buscar_duplicatas_logicas, escolher_pedido_mantido, calcular_chave_logica)
+from resumo_vendas import PROJECAO_RESUMO, obter_resumo, atualizar_resumo
+
 # --- CONFIGURAÇÕES ---
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
 
 # -----------------------------------------------------------------------------
 # MODO DE SEGURANÇA (DRY RUN)
 # -----------------------------------------------------------------------------
 # True  = MODO DE SIMULAÇÃO. NENHUM DADO SERÁ APAGADO.
-#         O script apenas mostrará quais documentos seriam mantidos e quais seriam deletados.
-#         (RECOMENDADO PARA A PRIMEIRA EXECUÇÃO)
+#         O script apenas mostrará quantos documentos seriam mantidos e quantos seriam deletados.
+#         (RECOMENDADO PARA A PRIMEIRA EXECUÇÃO; --simular na linha de comando tem o mesmo efeito)
 #
 # False = MODO REAL. O script APAGARÁ PERMANENTEMENTE os dados marcados.
 #         (Use apenas DEPOIS de verificar a simulação)
@@ -19,87 +22,140 @@ MONGO_COLLECTION = "pedidos"
 DRY_RUN = False
 # -----------------------------------------------------------------------------
 
+# _ids apagados por delete_many (cada lote também é descontado do resumo diário)
+TAMANHO_LOTE_REMOCAO = 5000
+# Grupos mostrados como exemplo no resumo final
+EXEMPLOS_NO_RESUMO = 5
+# --------------------
+
+
+def grupos_duplicatas(collection, tamanho_lote=TAMANHO_LOTE_REMOCAO):
+    """
+    Grupos de duplicatas lógicas pela chave do índice único (a mesma do
+    diagnosticoavancdo e do verificar_duplicata: parceiro, emissão e valor
+    normalizados), já com a decisão tomada por escolher_pedido_mantido.
+    'hash' é a chave a gravar no pedido mantido, se ele ainda não a tem.
+    """
+    for pedidos in buscar_duplicatas_logicas(collection, tamanho_lote):
+        mantido = escolher_pedido_mantido(pedidos)
+        yield {
+            '_id': {'numero_pv': mantido['numero_pv'], 'parceiro': mantido.get('parceiro')},
+            'manter': mantido['_id'],
+            'data_carga': mantido.get('data_carga'),
+            'apagar': [pedido['_id'] for pedido in pedidos if pedido is not mantido],
+            'hash': None if CAMPO_CHAVE_LOGICA in mantido else calcular_chave_logica(
+                mantido['numero_pv'], mantido.get('parceiro'), mantido['emissao'], mantido.get('valor_total_pedido')),
+        }
+
+
+def gravar_hashes(collection, hashes):
+    """
+    Grava o hash nos pedidos mantidos que não o tinham ({_id: hash}). Os demais
+    pedidos do grupo não tinham o hash, então o índice único não os recusa.
+    """
+    if hashes:
+        collection.bulk_write([UpdateOne({'_id': _id, CAMPO_CHAVE_LOGICA: {'$exists': False}},
+                                         {'$set': {CAMPO_CHAVE_LOGICA: chave}}) for _id, chave in hashes.items()],
+                              ordered=False)
+
 
-def limpar_duplicatas_definitivo():
-    """Encontra e limpa duplicatas lógicas, mantendo o registro mais recente."""
+def apagar_lote(collection, ids_para_deletar):
+    """
+    Apaga um lote de _ids com um único delete_many, desconta os documentos do
+    resumo diário e registra as remoções para a exportação incremental.
+    """
+    # Lê o que vai ser apagado para descontar do resumo diário
+    documentos_apagados = list(collection.find({"_id": {"$in": ids_para_deletar}}, PROJECAO_RESUMO))
+    resultado = collection.delete_many({"_id": {"$in": ids_para_deletar}})
+    atualizar_resumo(obter_resumo(collection), documentos_apagados, sinal=-1)
+    registrar_remocoes(collection, [doc['_id'] for doc in documentos_apagados], 'remover_duplicata')
+    return resultado.deleted_count
+
+
+def limpar_duplicatas_definitivo(simular=DRY_RUN, tamanho_lote=TAMANHO_LOTE_REMOCAO):
+    """
+    Encontra e limpa duplicatas lógicas, mantendo o pedido da primeira carga
+    (escolher_pedido_mantido), que passa a ter o hash da chave lógica.
+    """
     try:
-        client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
+        collection = obter_colecao()
         print(f"Conectado com sucesso ao banco '{MONGO_DATABASE}'.")
     except ConnectionFailure as e:
         print(f"Não foi possível conectar ao MongoDB: {e}")
         return
 
-    # Pipeline para encontrar os grupos de duplicatas lógicas (mesmo do diagnóstico avançado)
-    pipeline = [
-        {"$group": {
-            "_id": {
-                "numero_pv": "$numero_pv", "parceiro": "$parceiro",
-                "emissao": "$emissao", "valor": "$valor_total_pedido"
-            },
-            "documentos": {"$push": {"_id": "$_id", "data_carga": "$data_carga"}},
-            "count": {"$sum": 1}
-        }},
-        {"$match": {"count": {"$gt": 1}}}
-    ]
-    
+    if simular:
+        print("\n--- EXECUTANDO EM MODO DE SIMULAÇÃO (DRY RUN) ---")
+        print("Nenhum dado será apagado. Apenas contando o que seria limpo.")
+    else:
+        print("\n--- EXECUTANDO EM MODO REAL ---")
+        print("OS DADOS MARCADOS PARA DELEÇÃO SERÃO APAGADOS PERMANENTEMENTE.")
+
     print("\nProcurando por grupos de pedidos duplicados para limpeza...")
-    grupos_duplicados = list(collection.aggregate(pipeline))
+    inicio = time.perf_counter()
+    grupos = 0
+    marcados = 0
+    removidos = 0
+    lotes_com_erro = 0
+    exemplos = []
+    pendentes = []
+    hashes = {}
+
+    def esvaziar_pendentes():
+        nonlocal removidos, lotes_com_erro
+        try:
+            removidos += apagar_lote(collection, pendentes)
+        except Exception as e:
+            lotes_com_erro += 1
+            print(f"  -> ERRO ao deletar um lote de {len(pendentes)} documentos: {e}")
+        pendentes.clear()
 
-    if not grupos_duplicados:
+    for grupo in grupos_duplicatas(collection, tamanho_lote):
+        grupos += 1
+        marcados += len(grupo['apagar'])
+        if len(exemplos) < EXEMPLOS_NO_RESUMO:
+            exemplos.append(grupo)
+        if simular:
+            continue
+        pendentes.extend(grupo['apagar'])
+        if grupo['hash']:
+            hashes[grupo['manter']] = grupo['hash']
+        if len(pendentes) >= tamanho_lote:
+            esvaziar_pendentes()
+    if pendentes:
+        esvaziar_pendentes()
+    if hashes and not lotes_com_erro:
+        gravar_hashes(collection, hashes)
+
+    if not grupos:
         print(">> Nenhuma duplicata encontrada para limpar. O banco de dados já está correto.")
-        client.close()
         return
 
-    print(f"Encontrados {len(grupos_duplicados)} grupos de duplicatas para processar.")
-    total_documentos_removidos = 0
-
-    if DRY_RUN:
-        print("\n--- EXECUTANDO EM MODO DE SIMULAÇÃO (DRY RUN) ---")
-        print("Nenhum dado será apagado. Apenas mostrando o plano de limpeza.")
-    else:
-        print("\n--- EXECUTANDO EM MODO REAL ---")
-        print("OS DADOS MARCADOS PARA DELEÇÃO SERÃO APAGADOS PERMANENTEMENTE.")
+    print("\n--- RESUMO DA LIMPEZA ---")
+    print(f"Grupos de duplicatas: {grupos}")
+    print(f"Documentos mantidos (primeira carga): {grupos}")
+    print(f"Documentos {'que seriam apagados' if simular else 'marcados para deleção'}: {marcados}")
+    if not simular:
+        print(f"Documentos removidos: {removidos}" + (f" | Lotes com erro: {lotes_com_erro}" if lotes_com_erro else ""))
+    print(f"Tempo: {time.perf_counter() - inicio:.1f}s")
+    print(f"\nExemplos (primeiros {len(exemplos)} grupos):")
+    for grupo in exemplos:
+        print(f"  Pedido Nº {grupo['_id']['numero_pv']} | Parceiro: {grupo['_id']['parceiro']} -> "
+              f"mantém {grupo['manter']} (carregado em {grupo['data_carga']}), apaga {grupo['apagar']}")
 
-    # Itera sobre cada grupo de duplicatas
-    for grupo in grupos_duplicados:
-        print("-" * 50)
-        info_pedido = grupo['_id']
-        print(f"Processando Pedido Nº: {info_pedido['numero_pv']} | Parceiro: {info_pedido['parceiro']}")
-        
-        # Ordena os documentos pela data de carga, do mais recente para o mais antigo
-        documentos_ordenados = sorted(grupo['documentos'], key=lambda x: x['data_carga'], reverse=True)
-        
-        # O primeiro da lista é o que vamos manter
-        documento_para_manter = documentos_ordenados[0]
-        
-        # Todos os outros são para deletar
-        documentos_para_deletar = documentos_ordenados[1:]
-        
-        print(f"  -> MANTER (mais recente): _id = {documento_para_manter['_id']} (carregado em {documento_para_manter['data_carga']})")
-        
-        if documentos_para_deletar:
-            ids_para_deletar = [doc['_id'] for doc in documentos_para_deletar]
-            print(f"  -> DELETAR (mais antigos): {len(ids_para_deletar)} documento(s) com os _ids: {ids_para_deletar}")
-
-            if not DRY_RUN:
-                try:
-                    resultado = collection.delete_many({"_id": {"$in": ids_para_deletar}})
-                    print(f"  -> SUCESSO: {resultado.deleted_count} documento(s) removido(s).")
-                    total_documentos_removidos += resultado.deleted_count
-                except Exception as e:
-                    print(f"  -> ERRO ao deletar: {e}")
-        
-    print("-" * 50)
-
-    if DRY_RUN:
-        print("\nSimulação concluída. Para apagar os dados, mude a variável DRY_RUN para False no script e rode novamente.")
+    if simular:
+        print("\nSimulação concluída. Para apagar os dados, rode sem --simular (com DRY_RUN = False).")
+    elif lotes_com_erro:
+        print("\nLimpeza incompleta: o hash da chave lógica não foi gravado nos pedidos mantidos. Rode o script de novo.")
     else:
-        print(f"\nLimpeza concluída! Total de {total_documentos_removidos} documentos duplicados removidos.")
+        print(f"\nLimpeza concluída! Total de {removidos} documentos duplicados removidos; "
+              f"{len(hashes)} pedidos mantidos receberam o hash da chave lógica.")
 
-    client.close()
 
 if __name__ == '__main__':
-    limpar_duplicatas_definitivo()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Remove duplicatas lógicas de pedidos, mantendo a primeira carga.")
+    parser.add_argument('--simular', action='store_true', help="Só conta o que seria apagado, sem alterar nada.")
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE_REMOCAO, help="_ids apagados por delete_many.")
+    args = parser.parse_args()
+
+    limpar_duplicatas_definitivo(simular=DRY_RUN or args.simular, tamanho_lote=args.lote)
@@ -0,0 +1,313 @@
+import os
+import atexit
+from datetime import datetime
+import hashlib
+import threading
+from pymongo import MongoClient, ReadPreference
+
+# --- CONFIGURAÇÕES ---
+# Conexão usada por todos os scripts. Para apontar para outro servidor sem
+# editar o código (ex.: no agendador), defina VENDAS_MONGO_URI / VENDAS_MONGO_DB.
+MONGO_CONNECTION_STRING = os.environ.get('VENDAS_MONGO_URI', "mongodb://localhost:27017/")
+MONGO_DATABASE = os.environ.get('VENDAS_MONGO_DB', "vendas_db")
+MONGO_COLLECTION = "pedidos"
+# Resumo diário (dia × filial × vendedor × parceiro), mantido pela carga.
+# Ver resumo_vendas.py.
+MONGO_COLLECTION_RESUMO = "vendas_diarias"
+# Campo com o hash da chave lógica do pedido (ver calcular_chave_logica),
+# protegido por um índice único: duplicatas lógicas são recusadas na carga.
+CAMPO_CHAVE_LOGICA = "chave_logica_hash"
+# Registro dos pedidos apagados (remover_duplicata, Migrar filiais), lido pela
+# exportação incremental do Power BI para retirar esses pedidos dos deltas.
+MONGO_COLLECTION_REMOVIDOS = "pedidos_removidos"
+
+# Pool de conexões compartilhado pelo processo inteiro (todas as threads e
+# todos os scripts importados no mesmo interpretador).
+OPCOES_CLIENTE = {
+    'appname': 'automacao_vendas',
+    'maxPoolSize': 32,                 # >= escritores da carga + relatórios rodando juntos
+    'minPoolSize': 0,
+    'maxIdleTimeMS': 60_000,           # devolve sockets ociosos em vez de mantê-los abertos
+    'serverSelectionTimeoutMS': 5_000, # falha rápido quando o MongoDB está fora do ar
+    'connectTimeoutMS': 5_000,
+    'socketTimeoutMS': 300_000,        # agregações e exportações grandes podem demorar
+    'retryWrites': True,
+    'retryReads': True,
+}
+# Compressão do protocolo, na ordem de preferência. zstd só é usado se o
+# pacote zstandard estiver instalado; zlib vem com o Python.
+COMPRESSORES_PREFERIDOS = ['zstd', 'zlib']
+# --------------------
+
+_cliente = None
+_trava_cliente = threading.Lock()
+
+
+def compressores_disponiveis():
+    """Compressores de COMPRESSORES_PREFERIDOS que o pymongo consegue usar neste ambiente."""
+    disponiveis = []
+    for compressor in COMPRESSORES_PREFERIDOS:
+        if compressor == 'zstd':
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                continue
+        disponiveis.append(compressor)
+    return disponiveis
+
+
+def obter_cliente():
+    """
+    Retorna o MongoClient compartilhado, criando-o (e testando a conexão) na
+    primeira chamada. Levanta pymongo.errors.ConnectionFailure se o servidor
+    não responder.
+    """
+    global _cliente
+    with _trava_cliente:
+        if _cliente is None:
+            cliente = MongoClient(MONGO_CONNECTION_STRING, compressors=compressores_disponiveis(),
+                                  **OPCOES_CLIENTE)
+            try:
+                cliente.admin.command('ping')
+            except Exception:
+                cliente.close()
+                raise
+            _cliente = cliente
+        return _cliente
+
+
+def obter_banco():
+    return obter_cliente()[MONGO_DATABASE]
+
+
+def obter_colecao(nome=MONGO_COLLECTION, leitura_secundaria=False):
+    """
+    Retorna uma coleção do banco de vendas sobre o pool compartilhado.
+
+    Com leitura_secundaria=True (relatórios e exportações) as leituras vão
+    para um secundário quando houver réplica, aliviando o primário durante
+    a carga; sem réplica, continuam no primário.
+    """
+    colecao = obter_banco()[nome]
+    if leitura_secundaria:
+        colecao = colecao.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    return colecao
+
+
+def configurar_conexao(connection_string=None, banco=None):
+    """Troca o servidor e/ou o banco usados (ex.: benchmark); a conexão atual é fechada."""
+    global MONGO_CONNECTION_STRING, MONGO_DATABASE
+    fechar_conexao()
+    if connection_string is not None:
+        MONGO_CONNECTION_STRING = connection_string
+    if banco is not None:
+        MONGO_DATABASE = banco
+
+
+def fechar_conexao():
+    """Fecha o pool compartilhado; a próxima chamada a obter_cliente abre outro."""
+    global _cliente
+    with _trava_cliente:
+        if _cliente is not None:
+            _cliente.close()
+            _cliente = None
+
+
+atexit.register(fechar_conexao)
+
+
+# --- CONSULTAS DE PEDIDOS ---
+
+def calcular_chave_logica(numero_pv, parceiro, emissao, valor_total):
+    """
+    Hash da chave lógica do pedido: numero_pv, parceiro, emissão e valor
+    total, normalizados (parceiro em maiúsculas e sem espaços repetidos,
+    emissão pelo dia, valor com 2 casas). Não inclui a filial, então o mesmo
+    pedido carregado como "SS" e "ss", ou por duas filiais, tem a mesma chave.
+    """
+    parceiro = ' '.join(parceiro.split()).upper() if isinstance(parceiro, str) else ''
+    texto = f"{int(numero_pv)}|{parceiro}|{emissao:%Y-%m-%d}|{float(valor_total or 0):.2f}"
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def registrar_remocoes(colecao, ids, origem):
+    """
+    Grava um registro (tombstone) para cada _id de pedido apagado da
+    coleção, com o script de origem e o momento da remoção.
+    """
+    if not ids:
+        return
+    agora = datetime.now()
+    colecao.database[MONGO_COLLECTION_REMOVIDOS].insert_many(
+        [{'pedido': _id, 'origem': origem, 'removido_em': agora} for _id in ids], ordered=False)
+
+
+def filtro_pedidos(inicio=None, fim=None, filiais=None, vendedores=None):
+    """
+    Monta o filtro de pedidos por período de emissão, filial e vendedor.
+
+    inicio/fim: datetime; o período é [inicio, fim), isto é, fim não entra
+                (ex.: um ano inteiro é datetime(2025, 1, 1) a datetime(2026, 1, 1)).
+    filiais:    nome da filial (filial_nome) ou lista de nomes.
+    vendedores: nome do vendedor ou lista de nomes.
+    Critérios omitidos (None) não filtram.
+    """
+    filtro = {}
+    if inicio is not None or fim is not None:
+        filtro['emissao'] = {}
+        if inicio is not None:
+            filtro['emissao']['$gte'] = inicio
+        if fim is not None:
+            filtro['emissao']['$lt'] = fim
+    if filiais is not None:
+        filtro['filial_nome'] = {'$in': [filiais] if isinstance(filiais, str) else list(filiais)}
+    if vendedores is not None:
+        filtro['vendedor'] = {'$in': [vendedores] if isinstance(vendedores, str) else list(vendedores)}
+    return filtro
+
+
+def buscar_pedidos(inicio=None, fim=None, filiais=None, vendedores=None, campos=None,
+                   ordenar=None, limite=0, colecao=None):
+    """
+    Retorna um cursor com os pedidos que atendem a filtro_pedidos(...).
+
+    campos:  lista dos campos a trazer (projeção); None traz o documento inteiro.
+    ordenar: lista de (campo, direção), ex.: [('emissao', -1)].
+    limite:  máximo de pedidos (0 = sem limite).
+    colecao: coleção a consultar; por padrão a de pedidos, com leitura secundária.
+    """
+    if colecao is None:
+        colecao = obter_colecao(leitura_secundaria=True)
+    projecao = {campo: 1 for campo in campos} if campos is not None else None
+    cursor = colecao.find(filtro_pedidos(inicio, fim, filiais, vendedores), projecao)
+    if ordenar:
+        cursor = cursor.sort(ordenar)
+    if limite:
+        cursor = cursor.limit(limite)
+    return cursor
+
+
+def contar_pedidos(inicio=None, fim=None, filiais=None, vendedores=None, colecao=None):
+    """Quantidade de pedidos que atendem a filtro_pedidos(...)."""
+    if colecao is None:
+        colecao = obter_colecao(leitura_secundaria=True)
+    return colecao.count_documents(filtro_pedidos(inicio, fim, filiais, vendedores))
+
+
+def buscar_duplicatas_logicas(colecao=None, tamanho_lote=1000):
+    """
+    Grupos de pedidos com a mesma chave lógica, pelo índice único do hash:
+    pedidos que já têm o hash não se repetem entre si, então só os que não
+    o têm (carregados antes do hash ou recusados no preenchimento) são lidos.
+    A chave deles é calculada aqui e procurada no índice em lotes de $in.
+    Retorna uma lista de grupos (listas de pedidos com os campos da chave,
+    filial_codigo e data_carga), o pedido com o hash primeiro e com o campo
+    CAMPO_CHAVE_LOGICA.
+    """
+    if colecao is None:
+        colecao = obter_colecao(leitura_secundaria=True)
+    campos = {'numero_pv': 1, 'parceiro': 1, 'emissao': 1, 'valor_total_pedido': 1, 'filial_codigo': 1, 'data_carga': 1}
+    grupos = {}
+    for pedido in colecao.find({CAMPO_CHAVE_LOGICA: {'$exists': False}}, campos):
+        if pedido.get('numero_pv') is None or pedido.get('emissao') is None:
+            continue
+        chave = calcular_chave_logica(pedido['numero_pv'], pedido.get('parceiro'), pedido['emissao'],
+                                      pedido.get('valor_total_pedido'))
+        grupos.setdefault(chave, []).append(pedido)
+
+    # Sem nenhum pedido com o hash não há o que procurar (e sem o índice cada $in varreria a coleção)
+    chaves = list(grupos) if colecao.find_one({CAMPO_CHAVE_LOGICA: {'$exists': True}}, {'_id': 1}) else []
+    for inicio in range(0, len(chaves), tamanho_lote):
+        for pedido in colecao.find({CAMPO_CHAVE_LOGICA: {'$in': chaves[inicio:inicio + tamanho_lote]}},
+                                   {**campos, CAMPO_CHAVE_LOGICA: 1}):
+            grupos[pedido[CAMPO_CHAVE_LOGICA]].insert(0, pedido)
+    return [pedidos for pedidos in grupos.values() if len(pedidos) > 1]
+
+
+def escolher_pedido_mantido(pedidos):
+    """
+    O pedido que fica num grupo de duplicatas lógicas, pela mesma regra da
+    carga, em que vale a primeira: o que tem o hash (o índice único recusa as
+    cargas seguintes) ou, se nenhum tem, o de data_carga mais antiga (sem
+    data_carga conta como o mais antigo) e, no empate, o de menor _id.
+    """
+    com_hash = [pedido for pedido in pedidos if CAMPO_CHAVE_LOGICA in pedido]
+    if com_hash:
+        return com_hash[0]
+    return min(pedidos, key=lambda pedido: (pedido.get('data_carga') is not None,
+                                            pedido.get('data_carga') or datetime.min, str(pedido['_id'])))
+
+
+def _totalizar(colecao, filtro, agrupar_por, por_mes, campo_data, soma_total, soma_pedidos):
+    """Pipeline $match + $group comum a totalizar_pedidos e totalizar_resumo."""
+    chave = {campo: f"${campo}" for campo in agrupar_por}
+    if por_mes:
+        chave['ano'] = {'$year': f"${campo_data}"}
+        chave['mes'] = {'$month': f"${campo_data}"}
+
+    pipeline = [
+        {'$match': filtro},
+        {'$group': {
+            '_id': chave or None,
+            'total': {'$sum': soma_total},
+            'pedidos': {'$sum': soma_pedidos},
+            'primeira_emissao': {'$min': f"${campo_data}"},
+            'ultima_emissao': {'$max': f"${campo_data}"},
+        }},
+    ]
+    linhas = []
+    for resultado in colecao.aggregate(pipeline):
+        linha = dict(resultado.pop('_id') or {})
+        linha.update(resultado)
+        linhas.append(linha)
+    return linhas
+
+
+def totalizar_pedidos(agrupar_por=(), inicio=None, fim=None, filiais=None, vendedores=None,
+                      por_mes=False, colecao=None):
+    """
+    Soma os pedidos no próprio MongoDB ($match + $group) e devolve só as
+    linhas agregadas, sem trazer os documentos (nem os itens) para o Python.
+
+    agrupar_por: campos do pedido que formam cada linha, ex.: ['filial_nome'].
+    por_mes:     acrescenta 'ano' e 'mes' da emissão ao agrupamento.
+    Os filtros são os de filtro_pedidos. Cada linha traz os campos do
+    agrupamento mais total (soma de valor_total_pedido), pedidos (contagem),
+    primeira_emissao e ultima_emissao.
+    """
+    if colecao is None:
+        colecao = obter_colecao(leitura_secundaria=True)
+    return _totalizar(colecao, filtro_pedidos(inicio, fim, filiais, vendedores), agrupar_por, por_mes,
+                      'emissao', '$valor_total_pedido', 1)
+
+
+def totalizar_resumo(agrupar_por=(), inicio=None, fim=None, filiais=None, vendedores=None,
+                     por_mes=False, colecao=None):
+    """
+    Mesmo resultado de totalizar_pedidos, calculado sobre o resumo diário
+    (poucos milhares de linhas por ano em vez de todos os pedidos).
+    agrupar_por aceita dia, filial_codigo, filial_nome, vendedor e parceiro.
+    """
+    if colecao is None:
+        colecao = obter_colecao(MONGO_COLLECTION_RESUMO, leitura_secundaria=True)
+    filtro = filtro_pedidos(inicio, fim, filiais, vendedores)
+    if 'emissao' in filtro:
+        filtro['dia'] = filtro.pop('emissao')
+    return _totalizar(colecao, filtro, agrupar_por, por_mes, 'dia', '$valor_total', '$pedidos')
+
+
+def resumo_disponivel():
+    """Indica se o resumo diário já foi montado (ver resumo_vendas.py --reconstruir)."""
+    return obter_colecao(MONGO_COLLECTION_RESUMO, leitura_secundaria=True).find_one({}, {'_id': 1}) is not None
+
+
+def totalizar_vendas(agrupar_por=(), inicio=None, fim=None, filiais=None, vendedores=None, por_mes=False):
+    """
+    Totaliza as vendas pelo resumo diário; enquanto ele não existir, cai
+    para a agregação sobre os pedidos (mais lenta, mesmo resultado).
+    """
+    if resumo_disponivel():
+        return totalizar_resumo(agrupar_por, inicio, fim, filiais, vendedores, por_mes)
+    print("AVISO: resumo diário vazio; totalizando direto nos pedidos. "
+          "Rode 'python resumo_vendas.py --reconstruir' para montá-lo.")
+    return totalizar_pedidos(agrupar_por, inicio, fim, filiais, vendedores, por_mes)
@@ -0,0 +1,147 @@
+import argparse
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import ConnectionFailure
+
+from repositorio_vendas import MONGO_COLLECTION_RESUMO, obter_colecao
+
+# --- CONFIGURAÇÕES ---
+# O resumo diário guarda, para cada dia × filial × vendedor × parceiro, a
+# quantidade de pedidos e de itens, o valor total e a quantidade vendida.
+# A carga soma ($inc) os pedidos que insere; remover_duplicata e
+# "Migrar filiais" descontam os que apagam ou movem.
+CAMPOS_CHAVE_RESUMO = ['dia', 'filial_codigo', 'vendedor', 'parceiro']
+CAMPOS_SOMADOS_RESUMO = ['pedidos', 'itens', 'valor_total', 'quantidade']
+# Campos do pedido necessários para descontá-lo do resumo (projeção)
+PROJECAO_RESUMO = {'emissao': 1, 'filial_codigo': 1, 'filial_nome': 1, 'vendedor': 1, 'parceiro': 1,
+                   'valor_total_pedido': 1, 'itens.quantidade': 1}
+# --------------------
+
+
+def obter_resumo(collection):
+    """Coleção do resumo diário, no mesmo banco da coleção de pedidos."""
+    return collection.database[MONGO_COLLECTION_RESUMO]
+
+
+def _numero(valor):
+    """Trata ausente/NaN como zero nas somas."""
+    return 0 if valor is None or valor != valor else valor
+
+
+def linhas_resumo(pedidos):
+    """
+    Agrupa os pedidos por dia × filial × vendedor × parceiro e soma, para
+    cada grupo, pedidos, itens, valor_total e quantidade. Devolve uma lista
+    de (chave, filial_nome, somas).
+    """
+    linhas = {}
+    for pedido in pedidos:
+        emissao = pedido.get('emissao')
+        if emissao is None or emissao != emissao:
+            continue
+        # A ordem dos campos da chave é a mesma do $group de reconstruir_resumo
+        chave = {
+            'dia': datetime(emissao.year, emissao.month, emissao.day),
+            'filial_codigo': pedido.get('filial_codigo'),
+            'vendedor': pedido.get('vendedor'),
+            'parceiro': pedido.get('parceiro'),
+        }
+        identificador = tuple(chave.values())
+        if identificador not in linhas:
+            linhas[identificador] = (chave, pedido.get('filial_nome'), dict.fromkeys(CAMPOS_SOMADOS_RESUMO, 0))
+        somas = linhas[identificador][2]
+        itens = pedido.get('itens') or []
+        somas['pedidos'] += 1
+        somas['itens'] += len(itens)
+        somas['valor_total'] += _numero(pedido.get('valor_total_pedido'))
+        somas['quantidade'] += sum(_numero(item.get('quantidade')) for item in itens)
+    return list(linhas.values())
+
+
+def atualizar_resumo(resumo, pedidos, sinal=1):
+    """
+    Soma (sinal=1) ou desconta (sinal=-1) os pedidos do resumo diário com
+    upserts $inc não ordenados. Linhas que ficam sem pedidos são apagadas.
+    Retorna o número de linhas do resumo afetadas.
+    """
+    linhas = linhas_resumo(pedidos)
+    if not linhas:
+        return 0
+
+    operacoes = [
+        UpdateOne(
+            {'_id': chave},
+            {'$inc': {campo: sinal * valor for campo, valor in somas.items()},
+             '$setOnInsert': {**chave, 'filial_nome': filial_nome}},
+            upsert=True,
+        )
+        for chave, filial_nome, somas in linhas
+    ]
+    resumo.bulk_write(operacoes, ordered=False)
+    if sinal < 0:
+        resumo.delete_many({'_id': {'$in': [chave for chave, _, _ in linhas]}, 'pedidos': {'$lte': 0}})
+    return len(operacoes)
+
+
+def reconstruir_resumo(collection):
+    """
+    Recalcula o resumo diário inteiro a partir dos pedidos, no servidor
+    ($group + $out, que troca a coleção de uma vez ao final). Usado para
+    montar o resumo pela primeira vez ou corrigi-lo após uma falha entre a
+    gravação dos pedidos e a do resumo. Não rode durante uma carga.
+    """
+    chave = {
+        'dia': {'$dateFromParts': {'year': {'$year': '$emissao'}, 'month': {'$month': '$emissao'},
+                                   'day': {'$dayOfMonth': '$emissao'}}},
+        'filial_codigo': {'$ifNull': ['$filial_codigo', None]},
+        'vendedor': {'$ifNull': ['$vendedor', None]},
+        'parceiro': {'$ifNull': ['$parceiro', None]},
+    }
+    pipeline = [
+        {'$match': {'emissao': {'$type': 'date'}}},
+        {'$group': {
+            '_id': chave,
+            'filial_nome': {'$first': '$filial_nome'},
+            'pedidos': {'$sum': 1},
+            'itens': {'$sum': {'$size': {'$ifNull': ['$itens', []]}}},
+            'valor_total': {'$sum': '$valor_total_pedido'},
+            'quantidade': {'$sum': {'$sum': '$itens.quantidade'}},
+        }},
+        {'$addFields': {campo: f"$_id.{campo}" for campo in CAMPOS_CHAVE_RESUMO}},
+        {'$out': MONGO_COLLECTION_RESUMO},
+    ]
+    collection.aggregate(pipeline, allowDiskUse=True)
+    return obter_resumo(collection).estimated_document_count()
+
+
+def inicializar_resumo(collection):
+    """
+    Monta o resumo se ele ainda não existe mas já há pedidos no banco; sem
+    isso a carga passaria a somar só os pedidos novos num resumo incompleto.
+    """
+    if obter_resumo(collection).find_one({}, {'_id': 1}) is not None:
+        return
+    if collection.find_one({}, {'_id': 1}) is None:
+        return
+    print("Resumo diário ainda não existe; montando a partir dos pedidos já carregados...")
+    linhas = reconstruir_resumo(collection)
+    print(f"Resumo diário montado com {linhas} linhas.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manutenção do resumo diário de vendas.")
+    parser.add_argument('--reconstruir', action='store_true',
+                        help="Recalcula o resumo inteiro a partir dos pedidos.")
+    args = parser.parse_args()
+
+    try:
+        collection = obter_colecao()
+    except ConnectionFailure as e:
+        print(f"Não foi possível conectar ao MongoDB: {e}")
+    else:
+        if args.reconstruir:
+            print("Recalculando o resumo diário a partir dos pedidos...")
+            print(f"Resumo diário recalculado: {reconstruir_resumo(collection)} linhas.")
+        else:
+            resumo = obter_resumo(collection)
+            print(f"Resumo diário '{MONGO_COLLECTION_RESUMO}': {resumo.estimated_document_count()} linhas.")
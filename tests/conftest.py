@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# Os scripts ficam na raiz do repositório, fora de um pacote
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def colecao():
+    """Coleção de pedidos num MongoDB em memória (mongomock), num banco novo a cada teste."""
+    mongomock = pytest.importorskip('mongomock')
+    from repositorio_vendas import MONGO_COLLECTION
+    return mongomock.MongoClient()['vendas_teste'][MONGO_COLLECTION]
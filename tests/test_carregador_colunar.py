@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pandas as pd
+
+import carregador_colunar
+
+CAMPOS = ['_id', 'emissao', 'filial_nome', 'parceiro', 'valor_total_pedido', 'numero_pv']
+
+
+def popular(colecao, quantidade):
+    colecao.insert_many([
+        {'_id': f"{numero_pv}_JF", 'numero_pv': numero_pv, 'filial_nome': 'Juiz de Fora' if numero_pv % 3 else 'Rio',
+         'parceiro': f"CLIENTE {numero_pv % 4}", 'emissao': datetime(2025, 1, 1 + numero_pv % 28),
+         'valor_total_pedido': numero_pv * 1.5, 'itens': [{'quantidade': 1}]}
+        for numero_pv in range(quantidade)
+    ])
+    # Campo ausente e nulo continuam ocupando a posição do pedido na coluna
+    colecao.update_one({'_id': '5_JF'}, {'$unset': {'parceiro': ''}})
+    colecao.update_one({'_id': '6_JF'}, {'$set': {'valor_total_pedido': None}})
+
+
+def pelo_find(colecao, filtro=None):
+    """Referência: um dict por pedido, como os scripts faziam."""
+    df = pd.DataFrame(list(colecao.find(filtro or {}, {campo: 1 for campo in CAMPOS}).sort('_id', 1)))
+    return df.reindex(columns=CAMPOS)
+
+
+def test_lotes_colunares_iguais_ao_find(colecao):
+    popular(colecao, 57)
+    esquema = {campo: carregador_colunar.ESQUEMA_PEDIDOS[campo] for campo in CAMPOS}
+    df = carregador_colunar.carregar_dataframe(colecao, {'filial_nome': 'Juiz de Fora'}, esquema, tamanho_lote=10,
+                                               usar_arrow=False)
+    referencia = pelo_find(colecao, {'filial_nome': 'Juiz de Fora'})
+
+    assert df['_id'].tolist() == referencia['_id'].tolist()
+    assert df['emissao'].dtype == 'datetime64[ms]'
+    assert isinstance(df['parceiro'].dtype, pd.CategoricalDtype)
+    assert df['numero_pv'].dtype == 'Int64'
+    for campo in CAMPOS:
+        assert df[campo].astype(object).where(df[campo].notna(), None).tolist() == \
+            referencia[campo].astype(object).where(referencia[campo].notna(), None).tolist(), campo
+
+
+def test_lotes_colunares_com_ordem_e_limite(colecao):
+    popular(colecao, 57)
+    esquema = {'_id': 'texto', 'valor_total_pedido': 'numero'}
+    ordenar = [('valor_total_pedido', -1)]
+
+    maiores = carregador_colunar.carregar_dataframe(colecao, esquema=esquema, ordenar=ordenar, limite=25,
+                                                    tamanho_lote=10, usar_arrow=False)
+    assert maiores['_id'].tolist() == [f"{numero_pv}_JF" for numero_pv in range(56, 31, -1)]
+
+    todos = carregador_colunar.carregar_dataframe(colecao, esquema=esquema, ordenar=ordenar, tamanho_lote=10,
+                                                  usar_arrow=False)
+    assert len(todos) == 57 and todos['_id'].iloc[0] == '56_JF' and pd.isna(todos['valor_total_pedido'].iloc[-1])
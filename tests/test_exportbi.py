@@ -0,0 +1,165 @@
+from datetime import datetime
+
+import pandas as pd
+
+import ExportBI
+from repositorio_vendas import MONGO_COLLECTION, registrar_remocoes
+
+
+def pedido(numero_pv, itens, filial='JF'):
+    return {
+        '_id': f"{numero_pv}_{filial}", 'numero_pv': numero_pv, 'filial_codigo': filial, 'filial_nome': 'Juiz de Fora',
+        'parceiro': 'CLIENTE A', 'emissao': datetime(2025, 3, 1), 'vendedor': 'VENDEDOR 1',
+        'condicao_pagamento': 'A VISTA', 'valor_total_pedido': 100.5, 'itens': itens,
+    }
+
+
+def item(cod_produto, quantidade=2, unitario=10.25, total_item=20.5, **extras):
+    return {'cod_produto': cod_produto, 'descricao': f"PRODUTO {cod_produto}", 'quantidade': quantidade,
+            'unitario': unitario, 'total_item': total_item, **extras}
+
+
+# Um lote com código e quantidade nulos, outro sem nulos, outro com código alfanumérico e quantidade fracionária
+PEDIDOS = [
+    pedido(1, [item(16880), item(None, quantidade=None)]),
+    pedido(2, [item(16880), item(14613)]),
+    pedido(3, [item('A-10', quantidade=2.5), {'cod_produto': 14613}]),
+]
+
+
+def exportar(tmp_path, nome, lotes):
+    caminho = tmp_path / nome
+    for posicao, df in enumerate(lotes):
+        ExportBI.acrescentar_csv(df, caminho, novo=(posicao == 0))
+    return caminho.read_bytes()
+
+
+def test_csv_nao_depende_do_tamanho_do_lote(tmp_path):
+    inteiro = exportar(tmp_path, 'inteiro.csv', [ExportBI.achatar_pedidos(PEDIDOS)])
+    por_pedido = exportar(tmp_path, 'lotes.csv', [ExportBI.achatar_pedidos([p]) for p in PEDIDOS])
+    assert inteiro == por_pedido
+
+
+def test_data_no_mesmo_formato_com_e_sem_hora(tmp_path):
+    com_hora = {**pedido(4, [item(16880)]), 'emissao': datetime(2025, 3, 2, 10, 30)}
+    linhas = exportar(tmp_path, 'datas.csv', [ExportBI.achatar_pedidos(PEDIDOS[:1]), ExportBI.achatar_pedidos([com_hora])])
+    assert [linha.split(';')[5] for linha in linhas.decode('utf-8-sig').splitlines()[1:]] == \
+        ['2025-03-01', '2025-03-01', '2025-03-02']
+
+
+def test_codigos_e_quantidades_com_nulos(tmp_path):
+    linhas = exportar(tmp_path, 'saida.csv', [ExportBI.achatar_pedidos(PEDIDOS)]).decode('utf-8-sig').splitlines()
+    campos = [linha.split(';') for linha in linhas[1:]]
+    assert [c[9] for c in campos] == ['16880', '', '16880', '14613', 'A-10', '14613']
+    assert [c[11] for c in campos] == ['2', '', '2', '2', '2,5', '']
+    assert campos[0][8] == '100,5'
+
+
+
+class ColecaoAchatada:
+    """Devolve as linhas como o $unwind + $project do modo servidor: campos ausentes ficam fora do documento."""
+
+    def __init__(self, pedidos):
+        self.pedidos = pedidos
+
+    def aggregate(self, pipeline, **opcoes):
+        for pedido in self.pedidos:
+            for item in pedido['itens']:
+                documento = {**pedido, 'itens': item}
+                linha = {}
+                for coluna, campo in ExportBI.COLUNAS_EXPORTACAO.items():
+                    origem, _, subcampo = campo.partition('.')
+                    valores = documento[origem] if subcampo else documento
+                    chave = subcampo or origem
+                    if chave in valores:
+                        linha[coluna] = valores[chave]
+                yield linha
+
+
+def test_modo_servidor_gera_o_mesmo_csv(tmp_path):
+    python = exportar(tmp_path, 'python.csv', [ExportBI.achatar_pedidos(PEDIDOS)])
+    lotes = ExportBI.lotes_achatados_servidor(ColecaoAchatada(PEDIDOS), tamanho_lote=2)
+    servidor = exportar(tmp_path, 'servidor.csv', [df for df, _ in lotes])
+    assert python == servidor
+
+
+def test_parquet_escreve_cada_codigo_de_um_jeito():
+    # Lote tipado pelo pandas sem os tipos fixos: o código nulo deixa a coluna em float64
+    df = ExportBI.achatar_pedidos(PEDIDOS)
+    df['Cod_Produto'] = [16880.0, None, 16880.0, 14613.0, None, 14613.0]
+    tabela = ExportBI.tabela_parquet(df)
+    assert tabela.column('Cod_Produto').to_pylist() == ['16880', None, '16880', '14613', None, '14613']
+    assert str(tabela.column('Quantidade_Item').to_pylist()[4]) == '2.500'
+
+
+class ColecaoChaves:
+    """Só registra as escritas; os valores do teste já estão todos registrados."""
+
+    def __init__(self):
+        self.escritas = []
+
+    def bulk_write(self, operacoes, ordered=True):
+        self.escritas.append((operacoes, ordered))
+
+    def update_one(self, filtro, atualizacao):
+        self.escritas.append(([filtro], None))
+
+
+def test_atributos_alterados_em_um_bulk_write_por_lote():
+    df = ExportBI.achatar_pedidos(PEDIDOS)
+    registradas = {valor: {'chave': chave, 'atributos': {'Descricao_Produto': 'NOME ANTIGO'}}
+                   for chave, valor in enumerate(['16880', '14613', 'A-10'], start=1)}
+    registradas['A-10']['atributos'] = {'Descricao_Produto': 'PRODUTO A-10'}
+    colecao = ColecaoChaves()
+
+    chaves = ExportBI.chaves_do_lote(df, colecao, None, 'produto', registradas)
+
+    assert chaves.fillna(0).tolist() == [1, 0, 1, 2, 3, 2]
+    assert len(colecao.escritas) == 1
+    operacoes, ordenado = colecao.escritas[0]
+    assert not ordenado
+    assert sorted(operacao._filter['valor'] for operacao in operacoes) == ['14613', '16880']
+    assert registradas['16880']['atributos'] == {'Descricao_Produto': 'PRODUTO 16880'}
+
+
+def ids_dos_deltas(caminho_base):
+    """IDs das linhas e dos removidos de cada execução incremental, em ordem."""
+    return [{tipo: sorted({id_pedido for caminho in arquivos[tipo]
+                           for id_pedido in pd.read_csv(caminho, sep=';', encoding='utf-8-sig')['ID_Pedido_Filial']})
+             for tipo in ('linhas', 'removidos')}
+            for arquivos in ExportBI.listar_deltas(ExportBI.caminho_deltas(caminho_base)).values()]
+
+
+def test_incremental_compactado_igual_a_exportacao_completa(colecao, tmp_path, monkeypatch):
+    monkeypatch.setattr(ExportBI, 'obter_colecao',
+                        lambda nome=MONGO_COLLECTION, leitura_secundaria=False: colecao.database[nome])
+    colecao.insert_many([{**p, 'data_carga': datetime(2025, 3, 2)} for p in PEDIDOS])
+    base = str(tmp_path / 'dados.csv')
+    ExportBI.exportar_dados_para_csv(base)
+    marca = ExportBI.obter_marcas().find_one({'_id': 'dados.csv'})['marca']
+
+    # Depois da exportação completa: um pedido novo, um alterado e um apagado
+    colecao.insert_one({**pedido(4, [item(16880)]), 'data_carga': datetime.now()})
+    colecao.update_one({'_id': '2_JF'}, {'$set': {'itens': [item(14613, quantidade=5)], 'data_carga': datetime.now()}})
+    colecao.delete_one({'_id': '3_JF'})
+    registrar_remocoes(colecao, ['3_JF'], 'teste')
+    ExportBI.exportar_incremental(base)
+
+    # Só o que mudou desde a marca d'água, que avança
+    assert ids_dos_deltas(base) == [{'linhas': ['2_JF', '4_JF'], 'removidos': ['3_JF']}]
+    assert ExportBI.obter_marcas().find_one({'_id': 'dados.csv'})['marca'] > marca
+
+    # Uma segunda execução altera de novo o pedido 2: vale o delta mais recente
+    colecao.update_one({'_id': '2_JF'}, {'$set': {'itens': [item(16880, quantidade=7), item('A-10')],
+                                                  'data_carga': datetime.now()}})
+    ExportBI.exportar_incremental(base)
+    ExportBI.compactar_deltas(base)
+    assert ids_dos_deltas(base) == []
+
+    completo = tmp_path / 'completo.csv'
+    ExportBI.exportar_dados_para_csv(str(completo))
+    compactado = (tmp_path / 'dados.csv').read_bytes().decode('utf-8-sig').splitlines()
+    linhas_completo = completo.read_bytes().decode('utf-8-sig').splitlines()
+    assert compactado[0] == linhas_completo[0]
+    assert sorted(compactado[1:]) == sorted(linhas_completo[1:])
+    assert len(compactado) == 1 + 2 + 2 + 1
@@ -0,0 +1,16 @@
+import pytest
+
+from gerenciar_indices import garantir_indices, OPCOES_INDICES
+from repositorio_vendas import CAMPO_CHAVE_LOGICA
+
+
+@pytest.mark.parametrize('opcoes, situacao', [
+    (OPCOES_INDICES[CAMPO_CHAVE_LOGICA], 'ok'),
+    # Único mas sem o filtro parcial: os pedidos antigos, sem o hash, colidiriam entre si
+    ({'unique': True}, 'divergente'),
+    ({'partialFilterExpression': OPCOES_INDICES[CAMPO_CHAVE_LOGICA]['partialFilterExpression']}, 'divergente'),
+])
+def test_indice_do_hash_confere_as_opcoes(colecao, opcoes, situacao):
+    # O mongomock perde o partialFilterExpression no create_indexes; criado à mão, ele fica
+    colecao.create_index(CAMPO_CHAVE_LOGICA, name=CAMPO_CHAVE_LOGICA, **opcoes)
+    assert garantir_indices(colecao, silencioso=True)[CAMPO_CHAVE_LOGICA] == situacao
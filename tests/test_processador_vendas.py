@@ -0,0 +1,342 @@
+import importlib
+import math
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from pymongo.errors import ConnectionFailure
+
+import processador_vendas as pv
+import remover_duplicata
+from repositorio_vendas import (CAMPO_CHAVE_LOGICA, MONGO_COLLECTION_REMOVIDOS, calcular_chave_logica,
+                                buscar_duplicatas_logicas)
+from resumo_vendas import obter_resumo, atualizar_resumo, reconstruir_resumo
+
+
+def transformar_com_groupby(df):
+    """Agrupamento original (groupby + iterrows), usado como referência para a versão vetorizada."""
+    pedidos_formatados = []
+    for (numero_pv, filial_cod), grupo in df.groupby([pv.COL_NUMERO_PV, 'filial_codigo']):
+        info_pedido = grupo.iloc[0]
+        itens_do_pedido = []
+        for _, item_row in grupo.iterrows():
+            itens_do_pedido.append({
+                "cod_produto": item_row[pv.COL_PRODUTO],
+                "descricao": item_row[pv.COL_PRODUTO_DESC],
+                "quantidade": item_row[pv.COL_QTD],
+                "unitario": item_row[pv.COL_UNITARIO],
+                "total_item": item_row[pv.COL_TOTAL_ITEM]
+            })
+        pedidos_formatados.append({
+            "_id": f"{int(numero_pv)}_{filial_cod}",
+            "numero_pv": int(numero_pv),
+            "filial_codigo": filial_cod,
+            "filial_nome": info_pedido['filial_nome'],
+            "parceiro": info_pedido[pv.COL_PARCEIRO],
+            "emissao": info_pedido[pv.COL_EMISSAO],
+            "vendedor": info_pedido[pv.COL_VENDEDOR],
+            "condicao_pagamento": info_pedido[pv.COL_COND_PAGTO],
+            "valor_total_pedido": grupo[pv.COL_TOTAL_ITEM].sum(),
+            "itens": itens_do_pedido,
+        })
+    return pedidos_formatados
+
+
+def linha(numero_pv, cod_produto, quantidade=1, total=10.0, emissao='2025-03-01', descricao='PRODUTO', parceiro='CLIENTE A'):
+    return {pv.COL_NUMERO_PV: numero_pv, pv.COL_EMISSAO: emissao, pv.COL_PARCEIRO: parceiro,
+            pv.COL_VENDEDOR: 'VENDEDOR 1', pv.COL_PRODUTO: cod_produto, pv.COL_PRODUTO_DESC: descricao,
+            pv.COL_QTD: quantidade, pv.COL_UNITARIO: 10.0, pv.COL_TOTAL_ITEM: total, pv.COL_COND_PAGTO: 'A VISTA'}
+
+
+def exportacao(codigo_filial, linhas):
+    return pv.marcar_filial(pd.DataFrame(linhas, columns=pv.COLUNAS_EXPORTACAO), codigo_filial)
+
+
+def sem_nan(valor):
+    """NaN != NaN: troca por None para comparar os documentos."""
+    if isinstance(valor, dict):
+        return {campo: sem_nan(v) for campo, v in valor.items()}
+    if isinstance(valor, list):
+        return [sem_nan(v) for v in valor]
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    return valor
+
+
+def test_transformacao_vetorizada_igual_ao_groupby():
+    df = pv.concatenar_exportacoes([
+        exportacao('SS', [
+            linha(10, 16880, quantidade=2, total=20.0),
+            linha(11, 14613, parceiro='CLIENTE B'),
+            linha(10, 'A-10', quantidade=None, total=None),   # sem total: descartada
+            linha(10, 14613, quantidade=2.5, total=25.0, descricao=None),
+            linha(None, 16880),                                # sem PV: descartada
+            linha(12, 16880, emissao='data inválida'),         # sem emissão: descartada
+        ]),
+        exportacao('RJ', [
+            linha(10, 16880, total=30.0, parceiro='CLIENTE C'),
+            linha(9, None, quantidade=None, total=5.0),
+        ]),
+        exportacao('Va', [linha(10, 14613), linha(10, 14613, total=12.5)]),
+    ])
+    pv.normalizar_tipos(df)
+
+    vetorizados = pv.transformar_em_pedidos(df)
+    for pedido in vetorizados:
+        del pedido['data_carga'], pedido[CAMPO_CHAVE_LOGICA]
+
+    referencia = transformar_com_groupby(df)
+    assert [p['_id'] for p in vetorizados] == ['9_RJ', '10_JF', '10_RJ', '10_Va', '11_JF']
+    assert [len(p['itens']) for p in vetorizados] == [1, 2, 1, 2, 1]
+    assert sem_nan(vetorizados) == sem_nan(referencia)
+
+
+def test_transformacao_de_dataframe_vazio():
+    df = exportacao('SS', [])
+    assert pv.transformar_em_pedidos(pv.normalizar_tipos(df)) == []
+
+
+def test_staging_devolve_os_tipos_originais(tmp_path, monkeypatch):
+    monkeypatch.setattr(pv, 'PASTA_STAGING', str(tmp_path))
+    # Como vem do read_excel: códigos ora inteiros, ora texto, e células vazias como NaN
+    df = exportacao('SS', [linha(10, 16880), linha(10, 'A-10'), linha(11, float('nan')), linha(12, '00123')])
+    pv.normalizar_tipos(df)
+    pv.gravar_staging(df, 'chave', 'SS')
+
+    relido = pv.ler_staging(pv.caminho_staging('chave', 'SS'))
+    assert list(relido.columns) == list(df.columns)
+    assert sem_nan(relido[pv.COL_PRODUTO].tolist()) == [16880, 'A-10', None, '00123']
+    assert type(relido[pv.COL_PRODUTO].iloc[0]) is int
+    assert sem_nan(pv.transformar_em_pedidos(relido)[0]['itens']) == sem_nan(pv.transformar_em_pedidos(df)[0]['itens'])
+
+    parcial = pv.carregar_staging([pv.COL_NUMERO_PV, pv.COL_PRODUTO], [(pv.COL_NUMERO_PV, '==', 10)])
+    assert parcial[pv.COL_PRODUTO].tolist() == [16880, 'A-10']
+
+
+def test_emissao_lida_como_dia_mes_ano(tmp_path):
+    caminho = tmp_path / 'exportacao_SS.csv'
+    linhas = [linha(1, 16880, emissao='05/03/2024'), linha(2, 16880, emissao='06/03/2024'),
+              linha(3, 16880, emissao='13/03/2024')]
+    pd.DataFrame(linhas).to_csv(caminho, sep=';', decimal=',', index=False)
+
+    df = pv.normalizar_tipos(pv.ler_arquivo(str(caminho)))
+    assert df[pv.COL_EMISSAO].dt.strftime('%Y-%m-%d').tolist() == ['2024-03-05', '2024-03-06', '2024-03-13']
+
+
+def test_emissao_em_outros_formatos():
+    # Células de data do Excel misturadas com texto chegam em ISO; o ERP às vezes inclui a hora
+    emissoes = pd.Series(['2024-03-05 00:00:00', '13/03/2024', '06/03/2024 10:00', None, 'sem data'])
+    assert pv.converter_emissao(emissoes).tolist()[:3] == [pd.Timestamp(2024, 3, 5), pd.Timestamp(2024, 3, 13),
+                                                           pd.Timestamp(2024, 3, 6, 10)]
+    assert pv.converter_emissao(emissoes).isna().tolist() == [False, False, False, True, True]
+
+
+def pedido_gravado(_id, parceiro='CLIENTE A', emissao=datetime(2025, 3, 1), valor=100.0, data_carga=None, com_hash=False):
+    numero_pv, filial = _id.split('_')
+    pedido = {'_id': _id, 'numero_pv': int(numero_pv), 'filial_codigo': filial, 'filial_nome': filial,
+              'parceiro': parceiro, 'emissao': emissao, 'vendedor': 'VENDEDOR 1', 'valor_total_pedido': valor,
+              'itens': [{'quantidade': 2}], 'data_carga': data_carga or datetime(2025, 3, 2)}
+    if com_hash:
+        pedido[CAMPO_CHAVE_LOGICA] = calcular_chave_logica(pedido['numero_pv'], parceiro, emissao, valor)
+    return pedido
+
+
+def test_remover_duplicata_usa_a_chave_do_indice(colecao, monkeypatch):
+    pedidos = [
+        # O primeiro carregado tem o hash; as cópias diferem só no que a chave normaliza
+        pedido_gravado('1_JF', parceiro='ACME', com_hash=True),
+        pedido_gravado('1_RJ', parceiro='acme  ', data_carga=datetime(2025, 4, 1)),
+        pedido_gravado('1_Va', parceiro='ACME', emissao=datetime(2025, 3, 1, 10), valor=100.001),
+        # Nenhum com o hash: fica o mais antigo, que passa a tê-lo
+        pedido_gravado('2_RJ', data_carga=datetime(2025, 5, 1)),
+        pedido_gravado('2_JF', data_carga=datetime(2025, 1, 1)),
+        pedido_gravado('3_JF', com_hash=True),
+    ]
+    colecao.insert_many(pedidos)
+    atualizar_resumo(obter_resumo(colecao), pedidos)
+    monkeypatch.setattr(remover_duplicata, 'obter_colecao', lambda: colecao)
+
+    remover_duplicata.limpar_duplicatas_definitivo(simular=False)
+
+    assert sorted(p['_id'] for p in colecao.find()) == ['1_JF', '2_JF', '3_JF']
+    assert colecao.find_one({'_id': '2_JF'})[CAMPO_CHAVE_LOGICA] == pedido_gravado('2_JF', com_hash=True)[CAMPO_CHAVE_LOGICA]
+    removidos = colecao.database[MONGO_COLLECTION_REMOVIDOS]
+    assert sorted(r['pedido'] for r in removidos.find()) == ['1_RJ', '1_Va', '2_RJ']
+    assert all(r['origem'] == 'remover_duplicata' for r in removidos.find())
+    # O resumo desconta os apagados: cada parceiro/filial fica com o que sobrou
+    resumo = {(r['filial_codigo'], r['parceiro']): r['pedidos'] for r in obter_resumo(colecao).find()}
+    assert resumo == {('JF', 'ACME'): 1, ('JF', 'CLIENTE A'): 2}
+    # O diagnóstico aponta o mesmo pedido mantido
+    assert buscar_duplicatas_logicas(colecao) == []
+
+
+def test_corrigir_emissao_dos_csvs_antigos(colecao, tmp_path, monkeypatch):
+    import corrigir_emissao
+
+    caminho = tmp_path / '2025-03-20_08-00-00_exportacao_SS.csv'
+    pd.DataFrame([linha(1, 16880, emissao='05/03/2024'), linha(2, 16880, emissao='13/03/2024'),
+                  linha(3, 16880, emissao='04/04/2024')]).to_csv(caminho, sep=';', decimal=',', index=False)
+    monkeypatch.setattr(pv, 'PASTA_STAGING', str(tmp_path / 'staging'))
+    df = pv.normalizar_tipos(pv.marcar_filial(pv.ler_arquivo(str(caminho)), 'SS'))
+    corretos = {pedido['_id']: pedido for pedido in pv.transformar_em_pedidos(df)}
+
+    # Como a leitura mm/dd/aaaa gravou: 1 com dia e mês trocados, 2 descartado, 3 sem diferença
+    antigos = [{**corretos['1_JF'], 'emissao': datetime(2024, 5, 3)}, corretos['3_JF']]
+    antigos[0][CAMPO_CHAVE_LOGICA] = calcular_chave_logica(1, 'CLIENTE A', datetime(2024, 5, 3), 10.0)
+    colecao.insert_many([dict(pedido) for pedido in antigos])
+    atualizar_resumo(obter_resumo(colecao), antigos)
+    monkeypatch.setattr(pv, 'conectar_mongodb', lambda: colecao)
+
+    corrigir_emissao.corrigir_emissao([str(caminho)], simular=False)
+    corrigir_emissao.corrigir_emissao([str(caminho)], simular=False)
+
+    gravados = {pedido['_id']: pedido for pedido in colecao.find()}
+    assert {_id: p['emissao'] for _id, p in gravados.items()} == {_id: p['emissao'] for _id, p in corretos.items()}
+    assert gravados['1_JF'][CAMPO_CHAVE_LOGICA] == corretos['1_JF'][CAMPO_CHAVE_LOGICA]
+    assert gravados['1_JF']['data_carga'] > antigos[0]['data_carga']
+    dias = {r['dia']: r['pedidos'] for r in obter_resumo(colecao).find()}
+    assert dias == {datetime(2024, 3, 5): 1, datetime(2024, 3, 13): 1, datetime(2024, 4, 4): 1}
+
+
+def pastas_de_trabalho(tmp_path, monkeypatch):
+    """Aponta as pastas do processador para tmp_path; devolve a de entrada."""
+    for nome in ('PASTA_ENTRADA', 'PASTA_ARQUIVO', 'PASTA_ERRO', 'PASTA_STAGING'):
+        pasta = tmp_path / getattr(pv, nome)
+        pasta.mkdir(exist_ok=True)
+        monkeypatch.setattr(pv, nome, str(pasta))
+    return tmp_path / pv.PASTA_ENTRADA
+
+
+def gravar_csv(caminho, linhas):
+    pd.DataFrame(linhas).to_csv(caminho, sep=';', decimal=',', index=False)
+
+
+def carregar_em_blocos(colecao, monkeypatch, linhas_por_bloco=2):
+    monkeypatch.setattr(pv, 'estimar_linhas_por_bloco', lambda caminho, limite: linhas_por_bloco)
+    pv.carregar_arquivos_streaming(colecao, pv.LIMITE_MEMORIA_MB, pv.TAMANHO_LOTE_ESCRITA, 1)
+
+
+def test_streaming_junta_o_pedido_da_fronteira_do_bloco(colecao, tmp_path, monkeypatch):
+    entrada = pastas_de_trabalho(tmp_path, monkeypatch)
+    # Blocos de 2 linhas: o pedido 1 atravessa a primeira fronteira e o 2, a segunda
+    linhas = [linha(1, 16880, emissao='01/03/2025'), linha(1, 14613, emissao='01/03/2025'),
+              linha(1, 'A-10', emissao='01/03/2025'), linha(2, 16880, emissao='02/03/2025'),
+              linha(2, 14613, emissao='02/03/2025'), linha(3, 16880, emissao='03/03/2025')]
+    gravar_csv(entrada / 'exportacao_SS.csv', linhas)
+
+    carregar_em_blocos(colecao, monkeypatch)
+
+    assert {p['_id']: len(p['itens']) for p in colecao.find()} == {'1_JF': 3, '2_JF': 2, '3_JF': 1}
+    assert [r['status'] for r in pv.obter_manifesto(colecao).find()] == ['concluido']
+    assert not os.listdir(entrada) and len(os.listdir(pv.PASTA_ARQUIVO)) == 1
+
+
+def test_streaming_falha_o_arquivo_com_pedido_dividido(colecao, tmp_path, monkeypatch):
+    entrada = pastas_de_trabalho(tmp_path, monkeypatch)
+    # Os itens do pedido 1 não são consecutivos: a primeira parte é gravada antes de o resto aparecer
+    linhas = [linha(1, 16880, emissao='01/03/2025'), linha(1, 14613, emissao='01/03/2025'),
+              linha(2, 16880, emissao='01/03/2025'), linha(2, 14613, emissao='01/03/2025'),
+              linha(1, 'A-10', emissao='01/03/2025')]
+    gravar_csv(entrada / 'exportacao_SS.csv', linhas)
+
+    carregar_em_blocos(colecao, monkeypatch)
+
+    # O pedido dividido sai do banco e do resumo; o arquivo vai para a pasta de erro
+    assert [p['_id'] for p in colecao.find()] == ['2_JF']
+    assert [r['pedido'] for r in colecao.database[MONGO_COLLECTION_REMOVIDOS].find()] == ['1_JF']
+    assert sum(r['pedidos'] for r in obter_resumo(colecao).find()) == 1
+    registro = pv.obter_manifesto(colecao).find_one()
+    assert registro['status'] == 'erro' and '1_JF' in registro['mensagem_erro']
+    assert os.listdir(pv.PASTA_ERRO) == ['exportacao_SS.csv']
+
+
+def test_gravar_lote_segue_apos_duplicata_logica(colecao):
+    # O mongomock ignora o filtro parcial; aqui todos os pedidos têm o hash
+    colecao.create_index(CAMPO_CHAVE_LOGICA, unique=True)
+    df = pv.normalizar_tipos(exportacao('SS', [linha(5, 16880), linha(6, 16880), linha(7, 16880)]))
+    pedidos = pv.transformar_em_pedidos(df)
+    # 5_JF já foi carregado como 5_RJ (mesma chave lógica) e 7_JF já está no banco
+    colecao.insert_many([{**pedidos[0], '_id': '5_RJ', 'filial_codigo': 'RJ'}, dict(pedidos[2])])
+
+    assert pv.gravar_lote(colecao, pedidos) == 1
+
+    assert sorted(p['_id'] for p in colecao.find()) == ['5_RJ', '6_JF', '7_JF']
+    # Só o pedido inserido agora entra no resumo
+    assert [r['pedidos'] for r in obter_resumo(colecao).find()] == [1]
+
+
+def test_manifesto_ignora_o_mesmo_conteudo_com_outro_nome(colecao, tmp_path, monkeypatch):
+    entrada = pastas_de_trabalho(tmp_path, monkeypatch)
+    gravar_csv(entrada / 'exportacao_SS.csv', [linha(1, 16880, emissao='01/03/2025')])
+    carregar_em_blocos(colecao, monkeypatch)
+
+    # O mesmo arquivo de novo, renomeado: é arquivado sem ser lido
+    gravar_csv(entrada / 'exportacao_SS (1).csv', [linha(1, 16880, emissao='01/03/2025')])
+    monkeypatch.setattr(pv, 'processar_arquivo_streaming', lambda *args: pytest.fail("arquivo relido"))
+    carregar_em_blocos(colecao, monkeypatch)
+
+    registros = list(pv.obter_manifesto(colecao).find())
+    assert [(r['_id'], r['nome_arquivo'], r['status']) for r in registros] == [
+        (pv.calcular_chave_arquivo(os.path.join(pv.PASTA_ARQUIVO, sorted(os.listdir(pv.PASTA_ARQUIVO))[0])),
+         'exportacao_SS.csv', 'concluido')]
+    assert not os.listdir(entrada) and len(os.listdir(pv.PASTA_ARQUIVO)) == 2
+    assert colecao.count_documents({}) == 1
+
+
+def test_resumo_incremental_igual_ao_reconstruido(colecao):
+    pedidos = [pedido_gravado('1_JF'), pedido_gravado('2_JF', valor=50.0),
+               pedido_gravado('3_JF', emissao=datetime(2025, 3, 1, 15), parceiro='CLIENTE B'),
+               pedido_gravado('4_RJ', emissao=datetime(2025, 3, 2)), pedido_gravado('5_RJ', emissao=datetime(2025, 3, 2))]
+    colecao.insert_many([dict(pedido) for pedido in pedidos])
+    resumo = obter_resumo(colecao)
+    atualizar_resumo(resumo, pedidos)
+    # Descontar um pedido reduz a linha dele; descontar todos os de uma linha a apaga
+    apagados = [pedidos[1], pedidos[2]]
+    colecao.delete_many({'_id': {'$in': [pedido['_id'] for pedido in apagados]}})
+    atualizar_resumo(resumo, apagados, sinal=-1)
+
+    incremental = sorted((tuple(r['_id'].values()), r['pedidos'], r['itens'], r['valor_total'], r['quantidade'])
+                         for r in resumo.find())
+    reconstruir_resumo(colecao)
+    reconstruido = sorted((tuple(r['_id'].values()), r['pedidos'], r['itens'], r['valor_total'], r['quantidade'])
+                          for r in resumo.find())
+    assert incremental == reconstruido
+    assert [linha_resumo[1:] for linha_resumo in incremental] == [(1, 1, 100.0, 2), (2, 2, 200.0, 4)]
+
+
+def test_migracao_retoma_do_checkpoint(colecao, monkeypatch):
+    migrar = importlib.import_module('Migrar filiais')
+    pedidos = [pedido_gravado(f"{numero}_SS", com_hash=True) for numero in range(1, 6)]
+    colecao.insert_many([dict(pedido) for pedido in pedidos])
+    atualizar_resumo(obter_resumo(colecao), pedidos)
+    monkeypatch.setattr(migrar, 'obter_colecao', lambda: colecao)
+    mapa = {'SS': {'codigo_novo': 'JF', 'nome_novo': 'Juiz de Fora'}}
+
+    # A primeira execução cai depois do primeiro lote de 2 pedidos
+    migrar_lote = migrar.migrar_lote
+    lotes = []
+
+    def migrar_e_cair(*args):
+        if lotes:
+            raise ConnectionFailure("conexão perdida")
+        lotes.append(args[2])
+        return migrar_lote(*args)
+
+    monkeypatch.setattr(migrar, 'migrar_lote', migrar_e_cair)
+    with pytest.raises(ConnectionFailure):
+        migrar.migrar_filiais(mapa, simular=False, tamanho_lote=2)
+    checkpoint = colecao.database[migrar.MONGO_COLLECTION_MIGRACOES].find_one()
+    assert (checkpoint['ultimo_id'], checkpoint['migrados'], checkpoint['status']) == ('2_SS', 2, 'em_andamento')
+
+    # A segunda continua após o checkpoint e soma as contagens
+    retomados = []
+    monkeypatch.setattr(migrar, 'migrar_lote', lambda *args: retomados.append(args[2]) or migrar_lote(*args))
+    migrar.migrar_filiais(mapa, simular=False, tamanho_lote=2)
+
+    assert [pedido['_id'] for lote in retomados for pedido in lote] == ['3_SS', '4_SS', '5_SS']
+    checkpoint = colecao.database[migrar.MONGO_COLLECTION_MIGRACOES].find_one()
+    assert (checkpoint['migrados'], checkpoint['status']) == (5, 'concluida')
+    assert sorted(p['_id'] for p in colecao.find()) == [f"{numero}_JF" for numero in range(1, 6)]
+    assert all(p[CAMPO_CHAVE_LOGICA] for p in colecao.find())
+    assert [(r['filial_codigo'], r['pedidos']) for r in obter_resumo(colecao).find()] == [('JF', 5)]
@@ -1,5 +1,4 @@
 import pandas as pd
-from pymongo import MongoClient
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
@@ -8,10 +7,9 @@ from datetime import datetime
 import os
 import locale
 
+from repositorio_vendas import totalizar_vendas
+
 # --- CONFIGURAÇÕES VISUAIS & BANCO ---
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
 
 # Configuração de Filiais Ativas (Rio de Janeiro REMOVIDO)
 FILIAIS_ATIVAS = ["Juiz de Fora", "Vale Aço"]
@@ -88,27 +86,28 @@ class PDF(FPDF):
         self.cell(w, 8, valor, 0, 1, 'C')
 
 def buscar_dados(ano):
+    """
+    Vendas do ano por mês × filial × vendedor × parceiro, somadas no MongoDB
+    (pelo resumo diário, quando disponível). Cada linha é um grupo:
+    valor_total_pedido é o total vendido e pedidos a quantidade de pedidos;
+    emissao é o primeiro dia do mês. Todas as análises do relatório são
+    somas mensais sobre esses grupos.
+    """
     print(f"--- Buscando dados de {ano} (Filtrando RJ)... ---")
-    client = MongoClient(MONGO_CONNECTION_STRING)
-    db = client[MONGO_DATABASE]
-    collection = db[MONGO_COLLECTION]
-    
-    inicio = datetime(ano, 1, 1)
-    fim = datetime(ano, 12, 31, 23, 59, 59)
-    
     # Busca tudo do ano
-    dados = list(collection.find({"emissao": {"$gte": inicio, "$lte": fim}}))
-    if not dados: return pd.DataFrame()
+    linhas = totalizar_vendas(['filial_nome', 'vendedor', 'parceiro'], inicio=datetime(ano, 1, 1),
+                              fim=datetime(ano + 1, 1, 1), por_mes=True)
+    if not linhas: return pd.DataFrame()
     
-    df = pd.DataFrame(dados)
-    df['emissao'] = pd.to_datetime(df['emissao'])
+    df = pd.DataFrame(linhas).rename(columns={'total': 'valor_total_pedido'})
+    df['emissao'] = pd.to_datetime({'year': df['ano'], 'month': df['mes'], 'day': 1})
     
     # --- FILTRO DE EXCLUSÃO DO RIO DE JANEIRO ---
     # Mantém apenas as filiais listadas em FILIAIS_ATIVAS
     df_filtrado = df[df['filial_nome'].isin(FILIAIS_ATIVAS)].copy()
     
-    registros_removidos = len(df) - len(df_filtrado)
-    print(f"Registros carregados: {len(df)}. Removidos (RJ/Outros): {registros_removidos}. Mantidos: {len(df_filtrado)}.")
+    registros_removidos = df['pedidos'].sum() - df_filtrado['pedidos'].sum()
+    print(f"Pedidos carregados: {df['pedidos'].sum()}. Removidos (RJ/Outros): {registros_removidos}. Mantidos: {df_filtrado['pedidos'].sum()}.")
     
     df_filtrado['mes_ano'] = df_filtrado['emissao'].dt.strftime('%m') 
     return df_filtrado
@@ -341,7 +340,7 @@ def gerar_relatorio_final(ano_alvo):
     # PÁGINA 1
     pdf.add_page()
     total_vendas = df['valor_total_pedido'].sum()
-    total_pedidos = len(df)
+    total_pedidos = df['pedidos'].sum()
     
     # Melhor mês considerando apenas dados filtrados
     if not df.empty:
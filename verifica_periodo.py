@@ -1,63 +1,70 @@
+import argparse
 import pandas as pd
-from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 
-# --- CONFIGURAÇÕES ---
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
-# --------------------
+from repositorio_vendas import MONGO_DATABASE, obter_colecao, totalizar_vendas
 
-def analisar_periodo_dados():
+def buscar_extremo(collection, direcao):
+    """Emissão mais antiga (1) ou mais recente (-1), lida pelo índice de emissão (um documento só)."""
+    pedido = collection.find_one({'emissao': {'$type': 'date'}}, {'emissao': 1, '_id': 0}, sort=[('emissao', direcao)])
+    return pedido['emissao'] if pedido else None
+
+def contar_pedidos(por):
+    """
+    Quantidade de pedidos por ano, por mês ou por filial × ano, somada no
+    MongoDB (pelo resumo diário, quando disponível).
+    """
+    linhas = totalizar_vendas(['filial_nome'] if por == 'filial' else [], por_mes=True)
+    if not linhas:
+        return pd.Series(dtype='int64')
+    df = pd.DataFrame(linhas)
+    if por == 'mes':
+        contagem = df.groupby(['ano', 'mes'])['pedidos'].sum()
+        contagem.index = [f"{mes:02d}/{ano}" for ano, mes in contagem.index]
+        return contagem
+    if por == 'filial':
+        return df.pivot_table(index='ano', columns='filial_nome', values='pedidos', aggfunc='sum', fill_value=0)
+    return df.groupby('ano')['pedidos'].sum()
+
+def analisar_periodo_dados(por='ano'):
     """Conecta ao MongoDB e analisa o intervalo de datas dos registros."""
     try:
-        client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
+        collection = obter_colecao(leitura_secundaria=True)
         print(f"Conectado com sucesso ao banco '{MONGO_DATABASE}'.")
     except ConnectionFailure as e:
         print(f"Não foi possível conectar ao MongoDB: {e}")
         return
 
     print("\nAnalisando o período dos dados na coleção 'pedidos'...")
-    
-    # Busca todas as datas de emissão
-    todas_as_datas = list(collection.find({}, {"emissao": 1, "_id": 0}))
 
-    if not todas_as_datas:
-        print(">> Nenhum documento encontrado na coleção.")
-        client.close()
-        return
-        
-    df = pd.DataFrame(todas_as_datas)
-    df['emissao'] = pd.to_datetime(df['emissao'])
-    df.dropna(subset=['emissao'], inplace=True)
+    # Encontra a data mais antiga e a mais recente
+    data_mais_antiga = buscar_extremo(collection, 1)
+    data_mais_recente = buscar_extremo(collection, -1)
 
-    if df.empty:
+    if data_mais_antiga is None:
         print(">> Nenhum documento com data de emissão válida foi encontrado.")
-        client.close()
         return
 
-    # Encontra a data mais antiga e a mais recente
-    data_mais_antiga = df['emissao'].min()
-    data_mais_recente = df['emissao'].max()
-    
+    contagem = contar_pedidos(por)
+
     print("\n--- RESULTADO DA ANÁLISE ---")
-    print(f"Total de registros com data válida: {len(df)}")
+    print(f"Total de registros com data válida: {int(contagem.to_numpy().sum())}")
     print(f"Venda mais ANTIGA registrada: {data_mais_antiga.strftime('%d/%m/%Y')}")
     print(f"Venda mais RECENTE registrada: {data_mais_recente.strftime('%d/%m/%Y')}")
-    
-    # Conta os registros por ano
-    print("\nDistribuição de registros por ano:")
-    contagem_por_ano = df['emissao'].dt.year.value_counts().sort_index()
-    print(contagem_por_ano)
-    
+
+    titulos = {'ano': "por ano", 'mes': "por mês", 'filial': "por filial e ano"}
+    print(f"\nDistribuição de registros {titulos[por]}:")
+    print(contagem)
+
     print("\n--------------------------")
     print("\nConclusão: O script de relatório está procurando por dados a partir de 01/01/2025.")
     print("Se a maioria dos seus dados for de anos anteriores, é normal que os gráficos apareçam vazios.")
 
-    client.close()
 
 if __name__ == '__main__':
-    analisar_periodo_dados()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Mostra o período coberto pelos pedidos e a distribuição dos registros.")
+    parser.add_argument('--por', choices=['ano', 'mes', 'filial'], default='ano',
+                        help="Distribuição por ano (padrão), por mês ou por filial e ano.")
+    args = parser.parse_args()
+
+    analisar_periodo_dados(args.por)
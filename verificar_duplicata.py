@@ -1,58 +1,62 @@
-from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 
+from repositorio_vendas import MONGO_DATABASE, MONGO_COLLECTION, obter_colecao, buscar_duplicatas_logicas
+from gerenciar_indices import situacao_chave_logica
+
 # --- CONFIGURAÇÕES ---
-MONGO_CONNECTION_STRING = "mongodb://localhost:27017/"
-MONGO_DATABASE = "vendas_db"
-MONGO_COLLECTION = "pedidos"
+# Verificação antiga, usada só sem o índice único da chave lógica: mesmo PV
+# com a filial em maiúsculas/minúsculas diferentes.
+PIPELINE_FILIAL_MAIUSCULA = [
+    {
+        "$group": {
+            "_id": {
+                "numero_pv": "$numero_pv",
+                # Converte o código da filial para minúsculas para agrupar "SS" e "ss" juntos
+                "filial_normalizada": {"$toLower": "$filial_codigo"}
+            },
+            "documentos": {"$push": {"_id": "$_id", "filial_original": "$filial_codigo", "data_carga": "$data_carga"}},
+            "count": {"$sum": 1}
+        }
+    },
+    {"$match": {"count": {"$gt": 1}}}
+]
 # --------------------
 
 def verificar_duplicatas():
     """Conecta ao MongoDB e procura por pedidos duplicados."""
     try:
-        client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-        # Testa a conexão
-        client.admin.command('ping')
-        db = client[MONGO_DATABASE]
-        collection = db[MONGO_COLLECTION]
+        collection = obter_colecao(leitura_secundaria=True)
         print(f"Conectado com sucesso ao banco '{MONGO_DATABASE}' e coleção '{MONGO_COLLECTION}'.")
     except ConnectionFailure as e:
         print(f"Não foi possível conectar ao MongoDB: {e}")
         return
 
     # --- Verificação 1: Duplicatas Exatas (mesmo _id) ---
-    # Isto é tecnicamente impossível no MongoDB, mas é uma boa verificação inicial.
-    pipeline_id_exato = [
-        {"$group": {"_id": "$_id", "count": {"$sum": 1}}},
-        {"$match": {"count": {"$gt": 1}}}
-    ]
-    print("\n--- Verificando duplicatas de _id exato (deve retornar vazio)...")
-    duplicatas_exatas = list(collection.aggregate(pipeline_id_exato))
-    if not duplicatas_exatas:
-        print(">> OK: Nenhuma duplicata de _id exato encontrada, como esperado.")
-    else:
-        print(f"!! ATENÇÃO: Encontradas {len(duplicatas_exatas)} duplicatas de _id. Isso é muito incomum.")
-        print(duplicatas_exatas)
+    # Impossível no MongoDB: o índice _id_ é sempre único. Basta confirmar o índice.
+    print("\n--- Verificando duplicatas de _id exato...")
+    if collection.index_information().get('_id_'):
+        print(">> OK: o _id é garantido único pelo índice '_id_', como esperado.")
 
     # --- Verificação 2: Duplicatas por Lógica (mesmo pedido, filial com maiúscula/minúscula diferente) ---
     # Esta é a verificação mais importante, que encontra o problema de "filial_RJ" vs "filial_rj".
-    pipeline_logica = [
-        {
-            "$group": {
-                "_id": {
-                    "numero_pv": "$numero_pv",
-                    # Converte o código da filial para minúsculas para agrupar "SS" e "ss" juntos
-                    "filial_normalizada": {"$toLower": "$filial_codigo"}
-                },
-                "documentos": {"$push": {"_id": "$_id", "filial_original": "$filial_codigo", "data_carga": "$data_carga"}},
-                "count": {"$sum": 1}
-            }
-        },
-        {"$match": {"count": {"$gt": 1}}}
-    ]
-    
+    # O hash da chave lógica não depende da filial: "RJ" e "rj" têm a mesma
+    # chave e o índice único já recusa a segunda carga. Só os pedidos sem o
+    # hash precisam ser conferidos, por consultas ao índice.
     print("\n--- Verificando duplicatas lógicas (ex: 'RJ' vs 'rj')...")
-    duplicatas_logicas = list(collection.aggregate(pipeline_logica))
+    indice_ativo, total, com_chave = situacao_chave_logica(collection)
+    if indice_ativo:
+        print(f"Índice único da chave lógica ativo: {com_chave} de ~{total} pedidos protegidos.")
+        duplicatas_logicas = [] if com_chave >= total else [
+            {'_id': {'numero_pv': pedidos[0]['numero_pv'],
+                     'filial_normalizada': '/'.join(sorted({str(p.get('filial_codigo')).lower() for p in pedidos}))},
+             'documentos': [{'_id': p['_id'], 'filial_original': p.get('filial_codigo'), 'data_carga': p.get('data_carga')}
+                            for p in pedidos]}
+            for pedidos in buscar_duplicatas_logicas(collection)
+        ]
+    else:
+        print("AVISO: índice único da chave lógica ausente (rode 'python preencher_chave_logica.py'); "
+              "agrupando a coleção inteira.")
+        duplicatas_logicas = list(collection.aggregate(PIPELINE_FILIAL_MAIUSCULA, allowDiskUse=True))
 
     if not duplicatas_logicas:
         print(">> OK: Nenhuma duplicata lógica encontrada.")
@@ -67,7 +71,6 @@ def verificar_duplicatas():
             for doc in grupo['documentos']:
                 print(f"  - _id: {doc['_id']}, Filial Original: '{doc['filial_original']}', Carregado em: {doc['data_carga']}")
     
-    client.close()
 
 
 if __name__ == '__main__':